@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Per-call overhead of a 20-stage ``iochain`` built from nested closures,
+relative to the same chain compiled with ``compile_chain``.
+"""
+from conveyant import compile_chain, ichain, iochain, istage, ochain, ostage
+
+
+def oper(w, x, y, z):
+    return {'out': (2 * w - x * z) / y}
+
+
+def increment_w(w, **params):
+    return {'w': w + 1}
+
+
+def increment_out(out):
+    return {'out': out + 1}
+
+
+def bench_chain(n_stages=20):
+    params = {'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    i_chain = ichain(*(istage(increment_w) for _ in range(n_stages // 2)))
+    o_chain = ochain(*(ostage(increment_out) for _ in range(n_stages // 2)))
+    nested = iochain(oper, i_chain, o_chain)
+    compiled = compile_chain(oper, i_chain, o_chain)
+    return {
+        f'nested_{n_stages}': lambda: nested(**params),
+        f'compiled_{n_stages}': lambda: compiled(**params),
+    }
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals())
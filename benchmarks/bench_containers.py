@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Per-call overhead of ``FunctionWrapper`` and ``PartialApplication``
+relative to calling the wrapped function directly.
+"""
+from conveyant import Composition, direct_compositor
+from conveyant import FunctionWrapper as F
+from conveyant import PartialApplication as P
+
+
+def oper(name, w, x, y, z):
+    return (2 * w - x * z) / y
+
+
+def oper_dict(name, w, x, y, z):
+    return {'out': oper(name, w, x, y, z)}
+
+
+def increment(out, incr):
+    return {'out': out + incr}
+
+
+def bench_containers():
+    params = {'name': 'test', 'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    fn = F(oper)
+    ptl = P(oper, name='test', w=1, x=2)
+    ptl_ice = ptl.set_priority('ice')
+    ptl_cond = P(oper, name='test', w=1, x=2, __conditions__={
+        ('w', 1): [('y', 3)],
+        ('x', 2): [('z', 4)],
+    })
+    return {
+        'direct': lambda: oper(**params),
+        'wrapper': lambda: fn(**params),
+        'partial': lambda: ptl(y=3, z=4),
+        'partial_ice': lambda: ptl_ice(y=3, z=4),
+        'partial_conditions': lambda: ptl_cond(),
+    }
+
+
+def bench_composition():
+    params = {'name': 'test', 'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    c = Composition(
+        compositor=direct_compositor,
+        outer=increment,
+        inner=oper_dict,
+    ).bind_curried(incr=1)
+    return {
+        'direct': lambda: increment(incr=1, **oper_dict(**params)),
+        'composition': lambda: c(**params),
+    }
+
+
+def bench_deep_composition(depth=50):
+    params = {'name': 'test', 'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    c = oper_dict
+    for _ in range(depth):
+        c = Composition(
+            compositor=direct_compositor,
+            outer=increment,
+            inner=c,
+        ).bind_curried(incr=1)
+    compiled = c.compile()
+    return {
+        f'nested_{depth}': lambda: c(**params),
+        f'compiled_{depth}': lambda: compiled(**params),
+    }
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals())
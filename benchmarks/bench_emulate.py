@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Decoration and call cost of ``splice_on`` and ``emulate_assignment``.
+"""
+from conveyant import splice_on
+
+
+def oper(name, w, x, y, z):
+    return {name: (2 * w - x * z) / y}
+
+
+def spliced_stack(depth):
+    f = oper
+    for i in range(depth):
+        def layer(_f=f, **params):
+            return _f(**params)
+        f = splice_on(oper, allow_variadic=True)(layer)
+    return f
+
+
+def bench_splice_on():
+    params = {'name': 'test', 'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    f1 = spliced_stack(1)
+    f10 = spliced_stack(10)
+    return {
+        'decorate': lambda: spliced_stack(1),
+        'call_depth1': lambda: f1(**params),
+        'call_depth10': lambda: f10(**params),
+    }
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals())
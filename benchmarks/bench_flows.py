@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Scaling of ``imap``, ``omap``, ``split_chain`` and ``join`` with the number
+of replicates or branches.
+"""
+from conveyant import PartialApplication as P
+from conveyant import (
+    direct_compositor,
+    ichain,
+    imap,
+    join,
+    ochain,
+    omap,
+    split_chain,
+)
+
+COUNTS = (1, 10, 100)
+
+
+def oper(w, x, y, z):
+    return {'out': (2 * w - x * z) / y}
+
+
+def increment_out(incr):
+    def transform(f, compositor=direct_compositor):
+        transformer_f = P(increment, incr=incr)
+
+        def f_transformed(**params):
+            return compositor(transformer_f, f)()(**params)
+        return f_transformed
+    return transform
+
+
+def increment(out, incr):
+    return {'out': out + incr}
+
+
+def shift_w(shift):
+    def transform(f, compositor=direct_compositor):
+        def transformer_f(w):
+            return {'w': w + shift}
+
+        def f_transformed(w, **params):
+            return compositor(f, transformer_f)(**params)(w=w)
+        return f_transformed
+    return transform
+
+
+def bench_imap():
+    params = {'x': 2, 'y': 3, 'z': 4}
+    cases = {}
+    for n in COUNTS:
+        f = ichain(imap(mapping={'w': list(range(n))}))(oper)
+        cases[f'n{n}'] = lambda f=f: f(**params)
+    return cases
+
+
+def bench_omap():
+    params = {'x': 2, 'y': 3, 'z': 4}
+    cases = {}
+    for n in COUNTS:
+        f = ochain(
+            omap(increment_out(1), map_spec='out'),
+        )(ichain(imap(mapping={'w': list(range(n))}))(oper))
+        cases[f'n{n}'] = lambda f=f: f(**params)
+    return cases
+
+
+def bench_split_chain():
+    params = {'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    cases = {}
+    for n in COUNTS:
+        f = ichain(split_chain(*(shift_w(i) for i in range(n))))(oper)
+        cases[f'n{n}'] = lambda f=f: f(**params)
+    return cases
+
+
+def bench_join():
+    params = {'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    cases = {}
+    for n in COUNTS:
+        f = ichain(
+            join(joining_f=sum, join_vars=('w',))(
+                *(shift_w(i) for i in range(n))
+            ),
+        )(oper)
+        cases[f'n{n}'] = lambda f=f: f(**params)
+    return cases
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals(), repeat=3)
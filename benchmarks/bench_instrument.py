@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Per-call cost of instrumentation on a composition of primitives, with
+instrumentation disabled (the default) and with a profile active.
+"""
+from conveyant import (
+    Composition,
+    Primitive,
+    add_hook,
+    direct_compositor,
+    remove_hook,
+)
+from conveyant.instrument import Profile
+
+
+def add(x, y):
+    return x + y
+
+
+def double(z):
+    return 2 * z
+
+
+def bench_instrument():
+    composition = Composition(
+        compositor=direct_compositor,
+        outer=Primitive(double, 'double', output=('w',)),
+        inner=Primitive(add, 'add', output=('z',)),
+    )
+    profile = Profile()
+
+    def enabled():
+        add_hook(profile)
+        try:
+            composition(x=1, y=2)
+        finally:
+            remove_hook(profile)
+
+    return {
+        'disabled': lambda: composition(x=1, y=2),
+        'enabled': enabled,
+    }
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals())
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Serialisation size and round-trip time of typical containers, as sent to
+a process pool.
+"""
+import pickle
+
+from conveyant import (
+    Composition,
+    Invocation,
+    Primitive,
+    direct_compositor,
+)
+from conveyant import FunctionWrapper as F
+from conveyant import PartialApplication as P
+
+
+def oper(name, w, x, y, z):
+    return {name: (2 * w - x * z) / y}
+
+
+def increment(incr, **params):
+    return {k: v + incr for k, v in params.items()}
+
+
+def containers():
+    prim = Primitive(oper, name='oper', output=None)
+    return {
+        'function': oper,
+        'wrapper': F(oper),
+        'partial': P(oper, name='test', w=1, x=2),
+        'primitive': prim,
+        'composition': Composition(
+            compositor=direct_compositor,
+            outer=increment,
+            inner=oper,
+        ).bind_curried(incr=1),
+        'invocation': Invocation(
+            P(prim, name='test', w=1), {'x': 2, 'y': 3, 'z': 4}
+        ),
+    }
+
+
+def bench_pickle():
+    cases = {}
+    for name, obj in containers().items():
+        payload = pickle.dumps(obj)
+        cases[f'{name}_dumps'] = lambda obj=obj: pickle.dumps(obj)
+        cases[f'{name}_loads'] = lambda payload=payload: pickle.loads(payload)
+    return cases
+
+
+def sizes():
+    for name, obj in containers().items():
+        print(f'{name:<48} {len(pickle.dumps(obj)):>12d} bytes')
+
+
+if __name__ == '__main__':
+    from harness import run
+    sizes()
+    run(globals())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Per-call overhead of ``Primitive`` relative to calling the wrapped function
+directly.
+"""
+from conveyant import Primitive
+
+
+def oper(name, w, x, y, z):
+    return (2 * w - x * z) / y
+
+
+def bench_primitive():
+    params = {'name': 'test', 'w': 1, 'x': 2, 'y': 3, 'z': 4}
+    extra = {**params, 'v': 0}
+    prim = Primitive(oper, name='oper', output=('out',))
+    prim_fwd = Primitive(
+        oper, name='oper', output=('out',), forward_unused=True
+    )
+    return {
+        'direct': lambda: oper(**params),
+        'primitive': lambda: prim(**params),
+        'primitive_extra': lambda: prim(**extra),
+        'primitive_forward': lambda: prim_fwd(**extra),
+    }
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals())
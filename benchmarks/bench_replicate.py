@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Throughput of ``replicate`` across spec shapes, weave types and engines.
+"""
+from conveyant import replicate
+
+SIZE = 1000
+
+
+def make_params(size=SIZE):
+    return {
+        'a': list(range(size)),
+        'b': list(range(size // 10)),
+        'c': [str(i) for i in range(size)],
+        'd': tuple(range(size // 100)),
+    }
+
+
+SPECS = {
+    'str': 'a',
+    'tuple': ('a', 'c'),
+    'list': ['b', 'd'],
+    'nested': [('a', 'c'), 'd'],
+}
+
+
+def bench_replicate():
+    params = make_params()
+    cases = {}
+    for spec_name, spec in SPECS.items():
+        for weave_type in ('maximal', 'minimal'):
+            if isinstance(spec, str) and weave_type == 'minimal':
+                continue
+            for engine in ('recursive', 'index'):
+                transformer = replicate(
+                    spec=spec,
+                    weave_type=weave_type,
+                    broadcast_out_of_spec=True,
+                    engine=engine,
+                )
+                cases[f'{spec_name}.{weave_type}.{engine}'] = (
+                    lambda transformer=transformer: transformer(**params)
+                )
+    return cases
+
+
+if __name__ == '__main__':
+    from harness import run
+    run(globals(), repeat=3)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Benchmark harness
+~~~~~~~~~~~~~~~~~
+Minimal timing utilities shared by the benchmark scripts.
+
+Each benchmark module defines functions named ``bench_*``. Every such
+function performs its own setup and returns a mapping from case names to
+zero-argument callables; the harness times each callable and reports the
+best per-call time over several repeats.
+
+Run as a script, the harness runs every benchmark module in this directory
+(or those named on the command line), optionally saving the results as a
+JSON baseline or comparing them against one:
+
+    python harness.py --save baseline.json
+    python harness.py --compare baseline.json --tolerance 0.25
+
+A comparison fails if any case is slower than its baseline by more than the
+tolerance (a fraction of the baseline time).
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import timeit
+from typing import Callable, Mapping, Optional, Sequence
+
+
+def time_per_call(
+    fn: Callable,
+    number: Optional[int] = None,
+    repeat: int = 5,
+) -> float:
+    timer = timeit.Timer(fn)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def collect(namespace: Mapping) -> Mapping[str, Callable]:
+    cases = {}
+    for name, bench in namespace.items():
+        if name.startswith('bench_') and callable(bench):
+            for case, fn in bench().items():
+                cases[f'{name[6:]}.{case}'] = fn
+    return cases
+
+
+def run(namespace: Mapping, repeat: int = 5) -> Mapping[str, float]:
+    results = {}
+    for case, fn in collect(namespace).items():
+        results[case] = time_per_call(fn, repeat=repeat)
+        print(f'{case:<48} {results[case] * 1e6:>12.3f} us/call')
+    return results
+
+
+def modules(names: Sequence[str] = ()) -> Sequence[str]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    found = sorted(
+        name[:-3] for name in os.listdir(here)
+        if name.startswith('bench_') and name.endswith('.py')
+    )
+    if not names:
+        return found
+    return [m for m in found if any(n in m for n in names)]
+
+
+def run_all(
+    names: Sequence[str] = (),
+    repeat: int = 5,
+) -> Mapping[str, float]:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for module in modules(names):
+        namespace = vars(importlib.import_module(module))
+        results.update({
+            f'{module[6:]}:{case}': t
+            for case, t in run(namespace, repeat=repeat).items()
+        })
+    return results
+
+
+def compare(
+    results: Mapping[str, float],
+    baseline: Mapping[str, float],
+    tolerance: float = 0.25,
+) -> Sequence[str]:
+    """
+    Print the change in per-call time of each case relative to the
+    baseline, and return the cases that regressed beyond the tolerance.
+    """
+    regressions = []
+    for case, t in results.items():
+        ref = baseline.get(case)
+        if ref is None:
+            print(f'{case:<56} {"(new)":>10}')
+            continue
+        change = t / ref - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(case)
+            flag = '  REGRESSION'
+        print(f'{case:<56} {change:>+10.1%}{flag}')
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the benchmark suite.')
+    parser.add_argument(
+        'modules', nargs='*',
+        help='Run only benchmark modules whose names contain these strings.',
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='Save results to this JSON file.')
+    parser.add_argument(
+        '--compare', help='Compare results with this JSON baseline.',
+    )
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run_all(args.modules, repeat=args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) regressed by more than '
+                  f'{args.tolerance:.0%}: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,8 +4,13 @@
 """
 Noxfile
 """
+import os
+
 import nox
 
+# Benchmarks are run on request (``nox -s benchmarks``), not by default.
+nox.options.sessions = ['clean', 'tests', 'report']
+
 @nox.session()
 def clean(session):
     session.install('coverage[toml]')
@@ -20,7 +25,7 @@ def tests(session):
         '--cov-append',
         'tests/tests.py',
     )
-    session.run('ruff', 'check', 'src/conveyant')
+    session.run('ruff', 'check', 'src/conveyant', 'benchmarks')
 
 @nox.session()
 def report(session):
@@ -40,3 +45,21 @@ def report(session):
         'xml',
         "--omit='*test*,*__init__*'",
     )
+
+@nox.session()
+def benchmarks(session):
+    """
+    Run the benchmark suite. Arguments after ``--`` are passed to the
+    harness, for instance ``-- --save benchmarks/baseline.json`` to record a
+    baseline before an upgrade. If ``benchmarks/baseline.json`` exists,
+    results are compared against it and the session fails on regressions.
+    """
+    session.install('.')
+    args = list(session.posargs)
+    baseline = 'benchmarks/baseline.json'
+    if (
+        '--save' not in args and '--compare' not in args
+        and os.path.exists(baseline)
+    ):
+        args += ['--compare', baseline]
+    session.run('python', 'benchmarks/harness.py', *args)
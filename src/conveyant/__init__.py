@@ -2,6 +2,11 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 from .compositors import (
+    Invocation,
+    async_delayed_outer_compositor,
+    async_direct_compositor,
+    close_async_imapping_compositor,
+    close_async_omapping_compositor,
     close_imapping_compositor,
     close_omapping_compositor,
     delayed_outer_compositor,
@@ -9,9 +14,11 @@ from .compositors import (
     reversed_args_compositor,
 )
 from .containers import (
+    CompiledStage,
     Composition,
     FunctionWrapper,
     PartialApplication,
+    Pipeline,
     PipelineArgument,
     PipelineStage,
     Primitive,
@@ -22,18 +29,62 @@ from .emulate import (
     splice_on,
 )
 from .flows import (
+    BranchError,
+    async_join,
+    async_split_chain,
+    cached,
+    compile_chain,
     ichain,
     imap,
     imapping_composition,
     inject_params,
     iochain,
+    istage,
     join,
     null_transform,
     ochain,
     omap,
     omapping_composition,
+    ostage,
+    run_sync,
     split_chain,
 )
+from .graph import (
+    EliminationReport,
+    GraphEdge,
+    GraphNode,
+    PipelineGraph,
+    extract_graph,
+)
+from .instrument import (
+    CallEvent,
+    Profile,
+    Trace,
+    add_hook,
+    profile,
+    remove_hook,
+    trace,
+)
+from .memo import (
+    Cache,
+    CacheStats,
+    DiskCache,
+    LRUCache,
+    content_key,
+    repr_key,
+    structural_key,
+    value_key,
+)
 from .replicate import (
+    LazyReplicates,
     replicate,
 )
+from .schedule import (
+    GraphRun,
+    GraphScheduler,
+    NodeTiming,
+)
+from .transport import (
+    SharedArray,
+    SharedMemoryTransport,
+)
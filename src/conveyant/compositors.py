@@ -6,39 +6,101 @@ Functional compositors
 ~~~~~~~~~~~~~~~~~~~~~~
 Composition operators.
 """
-from itertools import chain
-from typing import Literal, Mapping, Optional, Sequence
+import asyncio
+import dataclasses
+import inspect
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain, count, repeat
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+from . import instrument
+from .memo import get_key_function, structural_key
 from .replicate import replicate
+from .transport import (
+    SharedMemoryTransport,
+    _TransportScope,
+    attached,
+    has_shared,
+)
+
+
+class _DictAccumulator:
+    """
+    Incrementally merge a sequence of mappings into a mapping of sequences.
+
+    Each mapping is merged as soon as it is added, so that it can be
+    released by the caller. Under the ``'union'`` merge, each key collects
+    the values of the mappings that have it; under ``'intersection'``,
+    only keys common to all mappings are kept; otherwise, the keys of the
+    first mapping are collected from every mapping. Keys whose first value
+    is a tuple or list have their values concatenated.
+    """
+
+    def __init__(
+        self,
+        merge_type: Optional[Literal['union', 'intersection']] = None,
+    ):
+        self.merge_type = merge_type
+        self.values = None
+
+    def add(self, item: Mapping) -> None:
+        values = self.values
+        if values is None:
+            self.values = {k: [v] for k, v in item.items()}
+        elif self.merge_type == 'union':
+            for k, v in item.items():
+                if k in values:
+                    values[k].append(v)
+                else:
+                    values[k] = [v]
+        elif self.merge_type == 'intersection':
+            for k in [k for k in values if k not in item]:
+                del values[k]
+            for k, v in values.items():
+                v.append(item[k])
+        else:
+            for k, v in values.items():
+                v.append(item[k])
+
+    def result(self) -> Mapping[str, Sequence]:
+        dct = {}
+        for k, v in (self.values or {}).items():
+            # We don't want this path for just any iterable -- in particular,
+            # definitely not for np.ndarray, pd.DataFrame, strings, etc.
+            if isinstance(v[0], (tuple, list)):
+                try:
+                    dct[k] = tuple(chain(*v))
+                    continue
+                except TypeError:
+                    pass
+            dct[k] = tuple(v)
+        return dct
 
 
 def _seq_to_dict(
-    seq: Sequence[Mapping],
+    seq: Iterable[Mapping],
     merge_type: Optional[Literal['union', 'intersection']] = None,
 ) -> Mapping[str, Sequence]:
-    if merge_type is None:
-        keys = seq[0].keys()
-    else:
-        keys = [set(s.keys()) for s in seq]
-        if merge_type == 'union':
-            keys = set.union(*keys)
-        elif merge_type == 'intersection':
-            keys = set.intersection(*keys)
-    if merge_type == 'union':
-        NULLSTR = '__ignore__'
-        dct = {k: tuple(r.get(k, NULLSTR) for r in seq) for k in keys}
-        dct = {k: tuple(v for v in dct[k] if v is not NULLSTR) for k in keys}
-    else:
-        dct = {k: tuple(r[k] for r in seq) for k in keys}
-    for k in dct:
-        try:
-            # We don't want this path for just any iterable -- in particular,
-            # definitely not for np.ndarray, pd.DataFrame, strings, etc.
-            assert isinstance(dct[k][0], tuple) or isinstance(dct[k][0], list)
-            dct[k] = tuple(chain(*dct[k]))
-        except (TypeError, AssertionError, IndexError):
-            pass
-    return dct
+    accumulator = _DictAccumulator(merge_type)
+    for item in seq:
+        accumulator.add(item)
+    return accumulator.result()
 
 
 def _dict_to_seq(
@@ -52,6 +114,258 @@ def _dict_to_seq(
     return seq
 
 
+@dataclasses.dataclass(frozen=True)
+class Invocation:
+    """
+    A single call of ``f`` with keyword parameters ``params``, deferred.
+
+    An invocation is the unit of work that the mapping compositors and
+    concurrent flows submit to an executor. It holds no closures of its
+    own, so it can be sent to a ``ProcessPoolExecutor`` whenever ``f`` and
+    ``params`` can be pickled: for instance, when ``f`` is a ``Primitive``
+    or a ``PartialApplication`` of a module-level function. Any
+    ``SharedArray`` handles among the parameters are resolved into arrays
+    backed by shared memory for the duration of the call.
+    """
+
+    f: Callable
+    params: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+    def __call__(self):
+        if not has_shared(self.params):
+            return self.f(**self.params)
+        with attached(self.params) as params:
+            return self.f(**params)
+
+
+@contextmanager
+def _transport_scope(
+    transport: Optional[SharedMemoryTransport],
+    executor: Optional[Executor],
+) -> Iterator[Optional[_TransportScope]]:
+    # Arrays are only shared when calls are submitted to worker processes:
+    # threads already share the caller's memory, so that sharing them
+    # would only add a copy.
+    if transport is None or not isinstance(executor, ProcessPoolExecutor):
+        yield None
+        return
+    with transport.scope() as scope:
+        yield scope
+
+
+def _default_in_flight(executor: Executor) -> int:
+    # Enough pending calls to keep every worker busy while the result of
+    # the earliest call is consumed. ``Executor`` does not expose its
+    # worker count, so we read the attribute that the standard library
+    # pools set and fall back to the CPU count for any other executor;
+    # pass ``max_in_flight`` explicitly where neither is a good estimate.
+    max_workers = getattr(executor, '_max_workers', None)
+    return 2 * (max_workers or os.cpu_count() or 1)
+
+
+def _map_ordered(
+    f: callable,
+    params_seq: Iterable[Mapping],
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    transport: Optional[_TransportScope] = None,
+) -> Iterator:
+    """
+    Call `f` once for each parameter mapping in `params_seq`, yielding
+    results in the order of `params_seq`. If an executor is provided, calls
+    are submitted to it, with at most `max_in_flight` calls pending at any
+    time (twice the executor's workers, or the CPU count, if None), and
+    with large arrays shared through the `transport` scope if one is
+    given; otherwise, calls are made serially.
+    """
+    if instrument.ACTIVE:
+        # Each replicate is a span, wherever it runs.
+        name = instrument.label(f)
+        fs = (
+            instrument.Spanned(
+                f, instrument.context('replicate', name, index=i)
+            )
+            for i in count()
+        )
+    else:
+        fs = repeat(f)
+    if executor is None:
+        for params, f_i in zip(params_seq, fs):
+            yield f_i(**params)
+        return
+    if max_in_flight is None:
+        max_in_flight = _default_in_flight(executor)
+    pending = deque()
+    collect = instrument.collect
+    try:
+        for params, f_i in zip(params_seq, fs):
+            if len(pending) >= max_in_flight:
+                yield collect(pending.popleft().result())
+            if transport is not None:
+                params = transport.share(params)
+            pending.append(executor.submit(Invocation(f_i, params)))
+        while pending:
+            yield collect(pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _plan_imapping(
+    map_spec_transformer: callable,
+    memo_key_f: Optional[callable],
+    f_outer_params: Mapping,
+    f_inner_params: Mapping,
+    inner_mapping: Optional[Mapping] = None,
+    outer_mapping: Optional[Mapping] = None,
+) -> Tuple[
+    Iterator[Mapping], Sequence, Optional[Mapping[Any, int]], Iterator[Mapping]
+]:
+    """
+    Plan the calls of an input-mapping compositor. Returns an iterator over
+    the parameters of the distinct inner calls (in order of first use), the
+    key of the inner call of each replicate, the index of the last
+    replicate that uses each key (None if every inner call is used once),
+    and an iterator over the outer parameters of each replicate.
+    """
+    inner_mapping = inner_mapping or {}
+    outer_mapping = outer_mapping or {}
+    params_mapped = map_spec_transformer(
+        **{
+            **f_outer_params,
+            **f_inner_params,
+            **inner_mapping,
+            **outer_mapping,
+        }
+    )
+    f_inner_params_mapped = {
+        k: v
+        for k, v in params_mapped.items()
+        if (k in f_inner_params or k in inner_mapping)
+    }
+    f_outer_params_mapped = {
+        k: v
+        for k, v in params_mapped.items()
+        if (k in f_outer_params or k in outer_mapping)
+    }
+    n_replicates = max(len((v)) for v in params_mapped.values())
+
+    def inner_params(i: int) -> Mapping:
+        return {k: v[i % len(v)] for k, v in f_inner_params_mapped.items()}
+
+    if memo_key_f is None:
+        inner_keys = range(n_replicates)
+        first_use = range(n_replicates)
+        last_use = None
+    else:
+        if memo_key_f is structural_key:
+            # Arrays shared by many replicates (such as broadcast volumes)
+            # are digested once for the whole plan rather than once per
+            # replicate.
+            memo_key_f = partial(structural_key, memo={})
+        # Inner calls are deduplicated before any work is done, so that
+        # each distinct inner call is made exactly once even when
+        # replicates are executed concurrently. Only the keys are kept:
+        # parameters are recomputed from the replicate index when the call
+        # is made.
+        inner_keys = []
+        first_use = {}
+        last_use = {}
+        for i in range(n_replicates):
+            key = memo_key_f(inner_params(i))
+            inner_keys.append(key)
+            first_use.setdefault(key, i)
+            last_use[key] = i
+        first_use = first_use.values()
+    inner_calls = (inner_params(i) for i in first_use)
+    outer_params = (
+        {k: v[i % len(v)] for k, v in f_outer_params_mapped.items()}
+        for i in range(n_replicates)
+    )
+    return inner_calls, inner_keys, last_use, outer_params
+
+
+def _join_imapping(
+    inner_results: Iterator[Mapping],
+    inner_keys: Sequence,
+    last_use: Optional[Mapping[Any, int]],
+    outer_params: Iterator[Mapping],
+) -> Iterator[Mapping]:
+    """
+    Combine the results of the distinct inner calls of an input-mapping
+    compositor, in order of first use, with the outer parameters of each
+    replicate. Each inner result is drawn from `inner_results` when it is
+    first needed and held only until the last replicate that uses it.
+    """
+    held = {}
+    for i, (key, outer_params_i) in enumerate(zip(inner_keys, outer_params)):
+        out = held.pop(key) if key in held else next(inner_results)
+        if last_use is not None and last_use[key] > i:
+            held[key] = out
+        yield {**out, **outer_params_i}
+
+
+def _plan_omapping(
+    map_spec_transformer: callable,
+    f_outer_params: Mapping,
+    out: Mapping,
+    mapping: Optional[Mapping] = None,
+    n_replicates: Optional[int] = None,
+) -> Iterator[Mapping]:
+    """
+    Plan the outer calls of an output-mapping compositor, given the output
+    of the inner call. Returns an iterator over the outer parameters of
+    each replicate.
+    """
+    _mapping = mapping or {}
+    f_outer_params_mapped = map_spec_transformer(
+        **{**f_outer_params, **out, **_mapping}
+    )
+    try:
+        out = _dict_to_seq(out)
+    except TypeError:
+        # We really shouldn't enter this branch, since the
+        # compositor does nothing in this case
+        out = [out]
+    if mapping or n_replicates:
+        _n_replicates = n_replicates or len(
+            next(iter(mapping.values()))
+        )
+        assert len(out) == _n_replicates, (
+            f'The length of the output of the inner function '
+            f'({len(out)}) must be equal to the length of the '
+            f'mapped values ({_n_replicates})'
+        )
+    return (
+        {
+            **{
+                k: f_outer_params_mapped[k][i]
+                if len(f_outer_params_mapped[k]) > 1
+                else f_outer_params_mapped[k][0]
+                for k in f_outer_params_mapped
+            },
+            **{k: v[i] for k, v in _mapping.items()},
+            **o,
+        }
+        for i, o in enumerate(out)
+    )
+
+
+def _traced(
+    name: str,
+    f_outer: callable,
+    f_inner: callable,
+    transformed_f: callable,
+) -> callable:
+    # Only called while instrumentation is active, so that compositors
+    # return their bare closures otherwise.
+    return instrument.instrumented(
+        'compositor',
+        f'{name}({instrument.label(f_outer)}, {instrument.label(f_inner)})',
+        transformed_f,
+    )
+
+
 def direct_compositor(
     f_outer: callable,
     f_inner: callable,
@@ -59,6 +373,10 @@ def direct_compositor(
     def transformed_f_outer(**f_outer_params):
         def transformed_f_inner(**f_inner_params):
             return f_outer(**{**f_outer_params, **f_inner(**f_inner_params)})
+        if instrument.ACTIVE:
+            return _traced(
+                'direct_compositor', f_outer, f_inner, transformed_f_inner
+            )
         return transformed_f_inner
     return transformed_f_outer
 
@@ -70,6 +388,13 @@ def reversed_args_compositor(
     def transformed_f_inner(**f_inner_params):
         def transformed_f_outer(**f_outer_params):
             return f_outer(**{**f_outer_params, **f_inner(**f_inner_params)})
+        if instrument.ACTIVE:
+            return _traced(
+                'reversed_args_compositor',
+                f_outer,
+                f_inner,
+                transformed_f_outer,
+            )
         return transformed_f_outer
     return transformed_f_inner
 
@@ -83,14 +408,46 @@ def close_imapping_compositor(
     maximum_aggregation_depth: Optional[int] = None,
     broadcast_out_of_spec: bool = False,
     merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    memo_key: Union[
+        Literal['structural', 'repr'], callable, None
+    ] = 'structural',
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
+    """
+    Close over an input-mapping compositor.
+
+    The compositor replicates the inner and outer function calls across
+    each parameter assignment produced by replicating ``map_spec``. If an
+    ``executor`` (any ``concurrent.futures.Executor``) is provided, the
+    replicates are submitted to it, with at most ``max_in_flight`` calls
+    pending at once (by default, twice the number of workers, or of CPUs
+    if the executor does not report its workers); results are always
+    gathered in replicate order, so the output is identical to serial
+    execution. When using a process pool, the inner and outer
+    functions and all parameters must be picklable; a
+    ``SharedMemoryTransport`` can be passed as ``transport`` to send large
+    arrays to the workers through shared memory instead (it is ignored for
+    any executor other than a ``ProcessPoolExecutor``).
+
+    Replicates that share inner parameters share a single inner call. The
+    inner parameters are keyed by ``memo_key``: ``'structural'`` (see
+    ``memo.structural_key``), ``'repr'`` (the hash of their string
+    representation), any callable mapping parameters to a hashable key, or
+    None to call the inner function once for every replicate.
+    """
+    memo_key_f = get_key_function(memo_key)
     map_spec = map_spec or []
+    # Replicated parameters are computed from the replicate index on access,
+    # so that memory does not grow with the size of the mapped product.
     map_spec_transformer = replicate(
         spec=map_spec,
         weave_type=weave_type,
         n_replicates=n_replicates,
         maximum_aggregation_depth=maximum_aggregation_depth,
         broadcast_out_of_spec=broadcast_out_of_spec,
+        lazy=True,
     )
     def imapping_compositor(
         f_outer: callable,
@@ -98,58 +455,52 @@ def close_imapping_compositor(
     ) -> callable:
         def transformed_f_outer(**f_outer_params):
             def transformed_f_inner(**f_inner_params):
-                ret = []
-                _inner_mapping = inner_mapping or {}
-                _outer_mapping = outer_mapping or {}
-                params_mapped = map_spec_transformer(
-                    **{
-                        **f_outer_params,
-                        **f_inner_params,
-                        **_inner_mapping,
-                        **_outer_mapping,
-                    }
+                (
+                    inner_calls, inner_keys, last_use, outer_params
+                ) = _plan_imapping(
+                    map_spec_transformer,
+                    memo_key_f,
+                    f_outer_params,
+                    f_inner_params,
+                    inner_mapping,
+                    outer_mapping,
                 )
-                f_inner_params_mapped = {
-                    k: v
-                    for k, v in params_mapped.items()
-                    if (k in f_inner_params or k in _inner_mapping)
-                }
-                f_outer_params_mapped = {
-                    k: v
-                    for k, v in params_mapped.items()
-                    if (k in f_outer_params or k in _outer_mapping)
-                }
-                _n_replicates = max(len((v)) for v in params_mapped.values())
-                inner_params_hash_dict = {}
-                for i in range(_n_replicates):
-                    f_inner_params_mapped_i = {
-                        k: v[i % len(v)]
-                        for k, v in f_inner_params_mapped.items()
-                    }
-                    # TODO: This is ... not a great hash
-                    inner_params_hash = hash(str(f_inner_params_mapped_i))
-                    if inner_params_hash in inner_params_hash_dict:
-                        inner_i_result = (
-                            inner_params_hash_dict[inner_params_hash]
-                        )
-                    else:
-                        inner_i_result = f_inner(**f_inner_params_mapped_i)
-                        inner_params_hash_dict[inner_params_hash] = (
-                            inner_i_result
-                        )
-                    f_outer_params_mapped_i = {
-                        k: v[i % len(v)]
-                        for k, v in f_outer_params_mapped.items()
-                    }
-                    ret.append(
-                        f_outer(
-                            **{
-                                **inner_i_result,
-                                **f_outer_params_mapped_i,
-                            }
-                        )
+                with _transport_scope(transport, executor) as scope:
+                    # Inner calls are made as the outer calls need their
+                    # results, and replicate outputs are merged as they
+                    # arrive.
+                    inner_results = _map_ordered(
+                        f_inner,
+                        inner_calls,
+                        executor=executor,
+                        max_in_flight=max_in_flight,
+                        transport=scope,
                     )
-                return _seq_to_dict(ret, merge_type=merge_type)
+                    try:
+                        return _seq_to_dict(
+                            _map_ordered(
+                                f_outer,
+                                _join_imapping(
+                                    inner_results,
+                                    inner_keys,
+                                    last_use,
+                                    outer_params,
+                                ),
+                                executor=executor,
+                                max_in_flight=max_in_flight,
+                                transport=scope,
+                            ),
+                            merge_type=merge_type,
+                        )
+                    finally:
+                        inner_results.close()
+            if instrument.ACTIVE:
+                return _traced(
+                    'imapping_compositor',
+                    f_outer,
+                    f_inner,
+                    transformed_f_inner,
+                )
             return transformed_f_inner
         return transformed_f_outer
     return imapping_compositor
@@ -163,7 +514,22 @@ def close_omapping_compositor(
     maximum_aggregation_depth: Optional[int] = None,
     broadcast_out_of_spec: bool = False,
     merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
+    """
+    Close over an output-mapping compositor.
+
+    The compositor evaluates the inner function once and then calls the
+    outer function for each of its outputs. If an ``executor`` is provided,
+    the outer calls are submitted to it, with at most ``max_in_flight``
+    calls pending at once (by default, twice the number of workers, or of
+    CPUs if the executor does not report its workers), and with large
+    arrays sent through ``transport`` if it is given and the executor is a
+    ``ProcessPoolExecutor``; results are gathered in output order.
+    Otherwise, the outer calls are made serially.
+    """
     # TODO: distinguish between "mapping" (over outputs) compositors and
     # "replicating" (over inputs) compositors in docstring.
     map_spec = map_spec or []
@@ -180,40 +546,32 @@ def close_omapping_compositor(
     ) -> callable:
         def transformed_f_outer(**f_outer_params):
             def transformed_f_inner(**f_inner_params):
-                ret = []
-                _mapping = mapping or {}
                 out = f_inner(**f_inner_params)
-                f_outer_params_mapped = map_spec_transformer(
-                    **{**f_outer_params, **out, **_mapping}
-                )
-                try:
-                    out = _dict_to_seq(out)
-                except TypeError:
-                    # We really shouldn't enter this branch, since the
-                    # compositor does nothing in this case
-                    out = [out]
-                if mapping or n_replicates:
-                    _n_replicates = n_replicates or len(
-                        next(iter(mapping.values()))
+                with _transport_scope(transport, executor) as scope:
+                    # Replicate outputs are merged as they arrive.
+                    return _seq_to_dict(
+                        _map_ordered(
+                            f_outer,
+                            _plan_omapping(
+                                map_spec_transformer,
+                                f_outer_params,
+                                out,
+                                mapping=mapping,
+                                n_replicates=n_replicates,
+                            ),
+                            executor=executor,
+                            max_in_flight=max_in_flight,
+                            transport=scope,
+                        ),
+                        merge_type=merge_type,
                     )
-                    assert len(out) == _n_replicates, (
-                        f'The length of the output of the inner function '
-                        f'({len(out)}) must be equal to the length of the '
-                        f'mapped values ({_n_replicates})'
-                    )
-                for i, o in enumerate(out):
-                    f_outer_params_i = {
-                        **{
-                            k: f_outer_params_mapped[k][i]
-                            if len(f_outer_params_mapped[k]) > 1
-                            else f_outer_params_mapped[k][0]
-                            for k in f_outer_params_mapped
-                        },
-                        **{k: v[i] for k, v in _mapping.items()},
-                        **o,
-                    }
-                    ret.append(f_outer(**f_outer_params_i))
-                return _seq_to_dict(ret, merge_type=merge_type)
+            if instrument.ACTIVE:
+                return _traced(
+                    'omapping_compositor',
+                    f_outer,
+                    f_inner,
+                    transformed_f_inner,
+                )
             return transformed_f_inner
         return transformed_f_outer
     return omapping_compositor
@@ -238,5 +596,192 @@ def delayed_outer_compositor(
         def transformed_f_inner(**f_inner_params):
             out = f_inner(**f_inner_params)
             return out, f_outer, f_outer_params
+        if instrument.ACTIVE:
+            return _traced(
+                'delayed_outer_compositor',
+                f_outer,
+                f_inner,
+                transformed_f_inner,
+            )
         return transformed_f_inner
     return transformed_f_outer
+
+
+async def _maybe_await(value: Any) -> Any:
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def _gather_ordered(
+    f: Callable[..., Union[Any, Awaitable]],
+    params_seq: Iterable[Mapping],
+    max_in_flight: Optional[int] = None,
+) -> Sequence:
+    """
+    Call `f` once for each parameter mapping in `params_seq` and await the
+    results concurrently, with at most `max_in_flight` calls awaited at any
+    time (unbounded if None). Results are returned in the order of
+    `params_seq`. `f` may be a coroutine function or a plain function;
+    plain functions are called on the event loop.
+    """
+    if max_in_flight is None:
+        return await asyncio.gather(*(
+            _maybe_await(f(**params)) for params in params_seq
+        ))
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def call(params):
+        async with semaphore:
+            return await _maybe_await(f(**params))
+    return await asyncio.gather(*(call(params) for params in params_seq))
+
+
+def async_direct_compositor(
+    f_outer: callable,
+    f_inner: callable,
+) -> callable:
+    """
+    Asynchronous counterpart of ``direct_compositor``. The composed function
+    is a coroutine function; either of ``f_outer`` and ``f_inner`` may be a
+    coroutine function or a plain function.
+    """
+    def transformed_f_outer(**f_outer_params):
+        async def transformed_f_inner(**f_inner_params):
+            out = await _maybe_await(f_inner(**f_inner_params))
+            return await _maybe_await(f_outer(**{**f_outer_params, **out}))
+        return transformed_f_inner
+    return transformed_f_outer
+
+
+def async_delayed_outer_compositor(
+    f_outer: callable,
+    f_inner: callable,
+) -> callable:
+    """
+    Asynchronous counterpart of ``delayed_outer_compositor``.
+    """
+    def transformed_f_outer(**f_outer_params):
+        async def transformed_f_inner(**f_inner_params):
+            out = await _maybe_await(f_inner(**f_inner_params))
+            return out, f_outer, f_outer_params
+        return transformed_f_inner
+    return transformed_f_outer
+
+
+def close_async_imapping_compositor(
+    inner_mapping: Optional[Mapping] = None,
+    outer_mapping: Optional[Mapping] = None,
+    map_spec: Optional[Sequence[str]] = None,
+    n_replicates: Optional[int] = None,
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+    maximum_aggregation_depth: Optional[int] = None,
+    broadcast_out_of_spec: bool = False,
+    merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    max_in_flight: Optional[int] = None,
+    memo_key: Union[
+        Literal['structural', 'repr'], callable, None
+    ] = 'structural',
+) -> callable:
+    """
+    Close over an asynchronous input-mapping compositor.
+
+    As ``close_imapping_compositor``, except that the composed function is a
+    coroutine function, and the distinct inner calls and then the outer
+    calls of all replicates are awaited concurrently with
+    ``asyncio.gather``, with at most ``max_in_flight`` calls awaited at
+    once. Results are gathered in replicate order.
+    """
+    memo_key_f = get_key_function(memo_key)
+    map_spec_transformer = replicate(
+        spec=map_spec or [],
+        weave_type=weave_type,
+        n_replicates=n_replicates,
+        maximum_aggregation_depth=maximum_aggregation_depth,
+        broadcast_out_of_spec=broadcast_out_of_spec,
+        lazy=True,
+    )
+    def imapping_compositor(
+        f_outer: callable,
+        f_inner: callable,
+    ) -> callable:
+        def transformed_f_outer(**f_outer_params):
+            async def transformed_f_inner(**f_inner_params):
+                (
+                    inner_calls, inner_keys, last_use, outer_params
+                ) = _plan_imapping(
+                    map_spec_transformer,
+                    memo_key_f,
+                    f_outer_params,
+                    f_inner_params,
+                    inner_mapping,
+                    outer_mapping,
+                )
+                inner_results = await _gather_ordered(
+                    f_inner,
+                    inner_calls,
+                    max_in_flight=max_in_flight,
+                )
+                ret = await _gather_ordered(
+                    f_outer,
+                    _join_imapping(
+                        iter(inner_results),
+                        inner_keys,
+                        last_use,
+                        outer_params,
+                    ),
+                    max_in_flight=max_in_flight,
+                )
+                return _seq_to_dict(ret, merge_type=merge_type)
+            return transformed_f_inner
+        return transformed_f_outer
+    return imapping_compositor
+
+
+def close_async_omapping_compositor(
+    mapping: Optional[Mapping] = None,
+    map_spec: Optional[Sequence[str]] = None,
+    n_replicates: Optional[int] = None,
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+    maximum_aggregation_depth: Optional[int] = None,
+    broadcast_out_of_spec: bool = False,
+    merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    max_in_flight: Optional[int] = None,
+) -> callable:
+    """
+    Close over an asynchronous output-mapping compositor.
+
+    As ``close_omapping_compositor``, except that the composed function is
+    a coroutine function, and the outer calls are awaited concurrently with
+    ``asyncio.gather``, with at most ``max_in_flight`` calls awaited at
+    once. Results are gathered in output order.
+    """
+    map_spec_transformer = replicate(
+        spec=map_spec or [],
+        weave_type=weave_type,
+        n_replicates=n_replicates,
+        maximum_aggregation_depth=maximum_aggregation_depth,
+        broadcast_out_of_spec=broadcast_out_of_spec,
+    )
+    def omapping_compositor(
+        f_outer: callable,
+        f_inner: callable,
+    ) -> callable:
+        def transformed_f_outer(**f_outer_params):
+            async def transformed_f_inner(**f_inner_params):
+                out = await _maybe_await(f_inner(**f_inner_params))
+                ret = await _gather_ordered(
+                    f_outer,
+                    _plan_omapping(
+                        map_spec_transformer,
+                        f_outer_params,
+                        out,
+                        mapping=mapping,
+                        n_replicates=n_replicates,
+                    ),
+                    max_in_flight=max_in_flight,
+                )
+                return _seq_to_dict(ret, merge_type=merge_type)
+            return transformed_f_inner
+        return transformed_f_outer
+    return omapping_compositor
@@ -8,3 +8,12 @@ Module settings.
 """
 
 aggregator_types = (list, tuple)
+
+# Buffers (arrays, bytes) larger than this many bytes are keyed by identity
+# rather than by a digest of their contents when deduplicating calls.
+digest_limit = 2 ** 24
+
+# Arrays of at least this many bytes are placed in shared memory, rather
+# than pickled, when passed to worker processes through a
+# ``SharedMemoryTransport``.
+shared_memory_threshold = 2 ** 20
@@ -7,10 +7,23 @@ Functional containers and sanitised wrappers for safe pickling
 import dataclasses
 import inspect
 from functools import partial
-from typing import Any, Callable, Mapping, Optional, Sequence, Tuple
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from .compositors import reversed_args_compositor
+from . import instrument
+from .compositors import direct_compositor, reversed_args_compositor
 from .emulate import splice_on
+from .memo import Cache, function_key, structural_key, value_key
 
 # TODO: The system for __allowed__ arguments is incredibly brittle and
 #       fails to appropriately mirror/propagate across nested containers. This
@@ -25,6 +38,28 @@ def CONTAINER_TYPES():
     )
 
 
+def _shape_output_dict(primitive: 'Primitive', out: Any) -> Mapping:
+    if not isinstance(out, dict):
+        raise TypeError(
+            f'Primitive {primitive.name} has output spec `None`, so the '
+            f'wrapped function must return a dictionary. Instead, '
+            f'got {out}.'
+        )
+    return out
+
+
+def _shape_output_empty(primitive: 'Primitive', out: Any) -> Mapping:
+    return {}
+
+
+def _shape_output_single(primitive: 'Primitive', out: Any) -> Mapping:
+    return {primitive.output[0]: out}
+
+
+def _shape_output_multi(primitive: 'Primitive', out: Any) -> Mapping:
+    return dict(zip(primitive.output, out))
+
+
 @dataclasses.dataclass(frozen=True)
 class Primitive:
     """
@@ -33,7 +68,17 @@ class Primitive:
     Forces all arguments to be keyword arguments and forces the wrapped
     function to return a dictionary. Furthermore, any arguments that are
     not specified in the signature of the wrapped function are optionally
-    passed directly into the output.
+    passed directly into the output. If the wrapped function accepts
+    variadic keyword arguments, then all arguments are passed to it.
+
+    The accepted parameter names and the strategy for shaping the output
+    are resolved once at construction, so calls do not inspect the
+    wrapped function.
+
+    If a ``cache`` (an ``LRUCache`` or ``DiskCache``) is provided, results
+    are memoised across calls. A cache can be shared among primitives, as
+    entries are keyed by the wrapped function, name and output
+    specification in addition to the arguments.
     """
 
     f: Callable
@@ -41,6 +86,9 @@ class Primitive:
     output: Sequence[str]
     forward_unused: bool = False
     splice_on_call: bool = True
+    cache: Optional[Cache] = dataclasses.field(
+        default=None, compare=False
+    )
 
     def __post_init__(self):
         if self.splice_on_call:
@@ -57,36 +105,75 @@ class Primitive:
                 return self.f(**params)
             object.__setattr__(self, '__signature__', _wrapped.__signature__)
             del _wrapped
-
-    def __call__(self, **params):
-        extra_params = {
-            k: v
-            for k, v in params.items()
-            if k not in inspect.signature(self.f).parameters
-        }
-        valid_params = {
-            k: v
-            for k, v in params.items()
-            if k in inspect.signature(self.f).parameters
-        }
-        out = self.f(**valid_params)
+        # Resolve the call plan once so that ``__call__`` never needs to
+        # inspect the wrapped function.
+        parameters = inspect.signature(self.f).parameters
+        object.__setattr__(self, '_params', frozenset(
+            k for k, v in parameters.items() if v.kind != v.VAR_KEYWORD
+        ))
+        object.__setattr__(self, '_variadic', any(
+            v.kind == v.VAR_KEYWORD for v in parameters.values()
+        ))
         if self.output is None:
-            if not isinstance(out, dict):
-                raise TypeError(
-                    f'Primitive {self.name} has output spec `None`, so the '
-                    f'wrapped function must return a dictionary. Instead, '
-                    f'got {out}.'
-                )
+            shape_output = _shape_output_dict
         elif len(self.output) == 0:
-            out = {}
+            shape_output = _shape_output_empty
         elif len(self.output) == 1:
-            out = {self.output[0]: out}
+            shape_output = _shape_output_single
         else:
-            out = {k: v for k, v in zip(self.output, out)}
-        if self.forward_unused:
-            return {**extra_params, **out}
+            shape_output = _shape_output_multi
+        object.__setattr__(self, '_shape_output', shape_output)
+        object.__setattr__(self, '_cache_identity', (
+            function_key(self.f),
+            self.name,
+            None if self.output is None else tuple(self.output),
+            self.forward_unused,
+        ))
+
+    def __call__(self, **params):
+        if instrument.ACTIVE:
+            return instrument.record(
+                'primitive', self.name, self._call, params
+            )
+        return self._call(**params)
+
+    def _call(self, **params):
+        if self.cache is not None:
+            return self.cache.call(
+                self._evaluate, params, identity=self._cache_identity
+            )
+        return self._evaluate(**params)
+
+    def __getstate__(self):
+        # Only the fields are pickled. Everything attached in
+        # ``__post_init__`` -- the spliced ``__call__`` (a closure that
+        # cannot be pickled), the signature and the call plan -- is rebuilt
+        # after unpickling.
+        return {
+            field.name: getattr(self, field.name)
+            for field in dataclasses.fields(self)
+        }
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            object.__setattr__(self, k, v)
+        self.__post_init__()
+
+    def _evaluate(self, **params):
+        accepted = self._params
+        if self._variadic or accepted.issuperset(params):
+            out = self._shape_output(self, self.f(**params))
         else:
-            return out
+            out = self._shape_output(self, self.f(**{
+                k: v for k, v in params.items() if k in accepted
+            }))
+        if self.forward_unused:
+            extra_params = {
+                k: v for k, v in params.items() if k not in accepted
+            }
+            if extra_params:
+                return {**extra_params, **out}
+        return out
 
     def __str__(self):
         return f'Primitive({self.name})'
@@ -95,6 +182,55 @@ class Primitive:
         return str(self)
 
 
+def _index_conditions(
+    conditions: Mapping[Tuple[str, Any], Sequence[Tuple[str, Any]]],
+    cascade: bool = False,
+) -> Mapping[str, Mapping[Any, Tuple[Tuple[str, Any], ...]]]:
+    """
+    Index conditions by argument name and then by argument value, so that
+    only arguments named in some condition are probed at call time. If
+    ``cascade`` is True, the assignments of each condition are expanded to
+    also include the assignments of any conditions that they trigger, in
+    the order they are triggered. A ValueError is raised if cascading
+    conditions form a cycle.
+    """
+    expanded = {}
+
+    def triggers(assignment: Tuple[str, Any]) -> bool:
+        try:
+            return assignment in conditions
+        except TypeError:
+            # Unhashable values cannot trigger any condition.
+            return False
+
+    def expand(
+        key: Tuple[str, Any],
+        path: Tuple[Tuple[str, Any], ...],
+    ) -> Tuple[Tuple[str, Any], ...]:
+        if key in path:
+            cycle = ' -> '.join(f'{k}={v!r}' for k, v in path + (key,))
+            raise ValueError(f'Cascading conditions form a cycle: {cycle}')
+        if key not in expanded:
+            # A condition's own assignments are made before those of the
+            # conditions that they trigger, so triggered assignments win.
+            assignments = [tuple(a) for a in conditions[key]]
+            for assignment in tuple(assignments):
+                if triggers(assignment):
+                    assignments.extend(expand(assignment, path + (key,)))
+            expanded[key] = tuple(assignments)
+        return expanded[key]
+
+    index = {}
+    for key, assignments in conditions.items():
+        k, v = key
+        if cascade:
+            assignments = expand(key, ())
+        else:
+            assignments = tuple(tuple(a) for a in assignments)
+        index.setdefault(k, {})[v] = assignments
+    return index
+
+
 @dataclasses.dataclass(frozen=True)
 class CallableContainer:
     """
@@ -148,6 +284,11 @@ class CallableContainer:
         * ``'i'`` : internal arguments. These are arguments that are passed to
             the wrapped function by the wrapper, if it is a partial
             application or a composition.
+    __cascade__ : bool (default: False)
+        If True, arguments assigned by a condition can in turn trigger other
+        conditions. Cascades are resolved once, when the container is
+        created, and are triggered by the assigned values irrespective of
+        priority. A ValueError is raised if the conditions form a cycle.
     """
 
     f: Callable
@@ -160,6 +301,7 @@ class CallableContainer:
         Tuple[str, Any], Tuple[str, Any]
     ] = dataclasses.field(default_factory=dict)
     __priority__: str = 'eci'  # environment, condition, internal
+    __cascade__: bool = False
 
     def __init__(
         self,
@@ -171,6 +313,7 @@ class CallableContainer:
             Sequence[Tuple[str, Any]],
         ] = {},
         __priority__: str = 'eci',
+        __cascade__: bool = False,
         **params: Mapping,
     ):
         object.__setattr__(self, 'f', f)
@@ -179,11 +322,27 @@ class CallableContainer:
         object.__setattr__(self, '__allowed__', __allowed__)
         object.__setattr__(self, '__conditions__', __conditions__)
         object.__setattr__(self, '__priority__', __priority__)
+        object.__setattr__(self, '__cascade__', __cascade__)
 
         signature = inspect.signature(
             partial(self.f, *self.pparams, **self.params)
         )
         object.__setattr__(self, '__signature__', signature)
+        # Resolve the merge order once. Parameter groups are merged from
+        # lowest to highest priority, so that higher priorities win.
+        object.__setattr__(self, '_merge_order', tuple(
+            sorted('eci', reverse=True, key=self.get_priority)
+        ))
+        object.__setattr__(
+            self,
+            '_internal_first',
+            self.get_priority('i') > self.get_priority('e'),
+        )
+        object.__setattr__(
+            self,
+            '_condition_index',
+            _index_conditions(__conditions__, cascade=__cascade__),
+        )
 
     def bind(self, *pparams: Sequence, **params: Mapping):
         if self.__allowed__ is not None:
@@ -207,6 +366,7 @@ class CallableContainer:
             __allowed__=self.__allowed__,
             __conditions__=self.__conditions__,
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def add_allowed(
@@ -220,6 +380,7 @@ class CallableContainer:
             __allowed__=tuple(set(__allowed__).union(self.__allowed__)),
             __conditions__=self.__conditions__,
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def add_conditions(
@@ -236,6 +397,7 @@ class CallableContainer:
             __allowed__=self.__allowed__,
             __conditions__={**self.__conditions__, **__conditions__},
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def set_priority(
@@ -249,6 +411,21 @@ class CallableContainer:
             __allowed__=self.__allowed__,
             __conditions__=self.__conditions__,
             __priority__=__priority__,
+            __cascade__=self.__cascade__,
+        )
+
+    def set_cascade(
+        self,
+        __cascade__: bool = True,
+    ) -> 'CallableContainer':
+        return self.__class__(
+            self.f,
+            *self.pparams,
+            **self.params,
+            __allowed__=self.__allowed__,
+            __conditions__=self.__conditions__,
+            __priority__=self.__priority__,
+            __cascade__=__cascade__,
         )
 
     def get_priority(self, query: str) -> int:
@@ -266,33 +443,75 @@ class CallableContainer:
         return self.__str__()
 
     def __call__(self, *pparams, **params):
+        if instrument.ACTIVE:
+            return instrument.record(
+                'container',
+                instrument.label(self),
+                self._call,
+                params,
+                pparams,
+            )
+        return self._call(*pparams, **params)
+
+    def _call(self, *pparams, **params):
         e_params = params
-        c_params = {}
         i_params = self.params
-        if self.__conditions__:
-            if self.get_priority('i') < self.get_priority('e'):
-                params = {**e_params, **i_params}
-            else:
-                params = {**i_params, **e_params}
-            for k, v in params.items():
-                if (k, v) in self.__conditions__:
-                    for new_k, new_v in self.__conditions__[(k, v)]:
-                        c_params[new_k] = new_v
+        if not self.__conditions__:
+            # Fast paths: there is nothing to merge, or only environment and
+            # internal parameters to merge.
+            if not i_params:
+                return self.f(*self.pparams, *pparams, **e_params)
+            elif self._internal_first:
+                return self.f(
+                    *self.pparams, *pparams, **{**i_params, **e_params}
+                )
+            return self.f(*self.pparams, *pparams, **{**e_params, **i_params})
+        c_params = {}
+        if self._internal_first:
+            params = {**i_params, **e_params}
+        else:
+            params = {**e_params, **i_params}
+        condition_index = self._condition_index
+        for k, v in params.items():
+            values = condition_index.get(k)
+            if values is None:
+                continue
+            try:
+                assignments = values.get(v)
+            except TypeError:
+                # Unhashable values cannot match any condition.
+                continue
+            if assignments is not None:
+                for new_k, new_v in assignments:
+                    c_params[new_k] = new_v
         params_metadict = {
             'e': e_params,
             'c': c_params,
             'i': i_params,
         }
-        ordered = sorted(['e', 'c', 'i'], reverse=True, key=self.get_priority)
         all_params = {}
-        for param_key in ordered:
-            param_group = params_metadict[param_key]
-            all_params = {**all_params, **param_group}
+        for param_key in self._merge_order:
+            all_params.update(params_metadict[param_key])
         return self.f(*self.pparams, *pparams, **all_params)
 
     def __eq__(self, other):
         return self.f == other
 
+    @property
+    def _cache_identity(self) -> Hashable:
+        # Containers are unhashable, so caches identify them by the wrapped
+        # callable and everything that they bind, rather than by identity.
+        return (
+            type(self),
+            function_key(self.f),
+            value_key(tuple(self.pparams)),
+            structural_key(self.params),
+            value_key(self.__allowed__),
+            value_key(self.__conditions__),
+            self.__priority__,
+            self.__cascade__,
+        )
+
 
 class FunctionWrapper(CallableContainer):
     def __init__(
@@ -304,12 +523,14 @@ class FunctionWrapper(CallableContainer):
             Sequence[Tuple[str, Any]],
         ] = {},
         __priority__: str = 'eci',
+        __cascade__: bool = False,
     ):
         return super().__init__(
             f,
             __allowed__=__allowed__,
             __conditions__=__conditions__,
             __priority__=__priority__,
+            __cascade__=__cascade__,
         )
 
 
@@ -324,6 +545,7 @@ class PartialApplication(CallableContainer):
             Sequence[Tuple[str, Any]],
         ] = {},
         __priority__: str = 'eci',
+        __cascade__: bool = False,
         **params: Mapping,
     ):
         if isinstance(f, PartialApplication):
@@ -332,6 +554,7 @@ class PartialApplication(CallableContainer):
             __allowed__ = tuple(set(f.__allowed__ + __allowed__))
             __conditions__ = {**f.__conditions__, **__conditions__}
             __priority__ = f.__priority__
+            __cascade__ = f.__cascade__ or __cascade__
             f = f.f
         super().__init__(
             f,
@@ -339,6 +562,7 @@ class PartialApplication(CallableContainer):
             __allowed__=__allowed__,
             __conditions__=__conditions__,
             __priority__=__priority__,
+            __cascade__=__cascade__,
             **params,
         )
 
@@ -406,6 +630,7 @@ class Composition:
         Tuple[str, Any], Sequence[Tuple[str, Any]]
     ] = dataclasses.field(default_factory=dict)
     __priority__: str = 'eci'
+    __cascade__: bool = False
 
     def __post_init__(self):
         if self.compositor == reversed_args_compositor:
@@ -434,15 +659,24 @@ class Composition:
                     __allowed__=__allowed_outer__,
                     __conditions__=__conditions_outer__,
                     __priority__=self.__priority__,
+                    __cascade__=self.__cascade__,
                 ),
             )
         else:
-            object.__setattr__(
-                self, 'outer', self.outer.add_allowed(__allowed_outer__)
-            )
-            object.__setattr__(
-                self, 'outer', self.outer.add_conditions(__conditions_outer__)
-            )
+            # Only rebuild nested containers when there is something to add;
+            # otherwise, construction time grows exponentially with depth.
+            if __allowed_outer__:
+                object.__setattr__(
+                    self, 'outer', self.outer.add_allowed(__allowed_outer__)
+                )
+            if __conditions_outer__:
+                object.__setattr__(
+                    self,
+                    'outer',
+                    self.outer.add_conditions(__conditions_outer__),
+                )
+            if self.__cascade__ and self.curried_fn == 'inner':
+                object.__setattr__(self, 'outer', self.outer.set_cascade())
 
         if not isinstance(self.inner, CONTAINER_TYPES()):
             object.__setattr__(
@@ -453,15 +687,24 @@ class Composition:
                     __allowed__=__allowed_inner__,
                     __conditions__=__conditions_inner__,
                     __priority__=self.__priority__,
+                    __cascade__=self.__cascade__,
                 )
             )
         else:
-            object.__setattr__(
-                self, 'inner', self.inner.add_allowed(__allowed_inner__)
-            )
-            object.__setattr__(
-                self, 'inner', self.inner.add_conditions(__conditions_inner__)
-            )
+            # Only rebuild nested containers when there is something to add;
+            # otherwise, construction time grows exponentially with depth.
+            if __allowed_inner__:
+                object.__setattr__(
+                    self, 'inner', self.inner.add_allowed(__allowed_inner__)
+                )
+            if __conditions_inner__:
+                object.__setattr__(
+                    self,
+                    'inner',
+                    self.inner.add_conditions(__conditions_inner__),
+                )
+            if self.__cascade__ and self.curried_fn == 'outer':
+                object.__setattr__(self, 'inner', self.inner.set_cascade())
 
         if self.curried_fn == 'inner':
             object.__setattr__(self, '__allowed__', self.outer.__allowed__)
@@ -494,6 +737,7 @@ class Composition:
                     __allowed__=self.__allowed__,
                     __conditions__=self.__conditions__,
                     __priority__=self.__priority__,
+                    __cascade__=self.__cascade__,
                     **params,
                 )
         elif self.curried_fn == 'outer':
@@ -505,6 +749,7 @@ class Composition:
                     __allowed__=self.__allowed__,
                     __conditions__=self.__conditions__,
                     __priority__=self.__priority__,
+                    __cascade__=self.__cascade__,
                     **params,
                 )
             outer = self.outer
@@ -516,6 +761,7 @@ class Composition:
             __allowed__=self.__allowed__,
             __conditions__=self.__conditions__,
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def add_allowed(self, __allowed__):
@@ -527,6 +773,7 @@ class Composition:
             __allowed__=tuple(set(__allowed__ + self.__allowed__)),
             __conditions__=self.__conditions__,
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def add_conditions(
@@ -541,6 +788,7 @@ class Composition:
             __allowed__=self.__allowed__,
             __conditions__={**self.__conditions__, **__conditions__},
             __priority__=self.__priority__,
+            __cascade__=self.__cascade__,
         )
 
     def set_priority(
@@ -555,9 +803,224 @@ class Composition:
             __allowed__=self.__allowed__,
             __conditions__=self.__conditions__,
             __priority__=__priority__,
+            __cascade__=self.__cascade__,
+        )
+
+    def set_cascade(
+        self,
+        __cascade__: bool = True,
+    ) -> 'CallableContainer':
+        return self.__class__(
+            self.compositor,
+            self.outer,
+            self.inner,
+            curried_params=self.curried_params,
+            __allowed__=self.__allowed__,
+            __conditions__=self.__conditions__,
+            __priority__=self.__priority__,
+            __cascade__=__cascade__,
         )
 
     def __call__(self, **params):
-        return self.compositor(self.outer, self.inner)(
-            **self.curried_params.params
-        )(**params)
+        # The composition is frozen, so the compositor need only be applied
+        # once. The result is usually a closure, which cannot be pickled, so
+        # it is dropped from the pickled state and rebuilt on first call.
+        if instrument.ACTIVE:
+            # Compositors only instrument the closures they return while
+            # instrumentation is active, so the cached closure is bypassed.
+            return self.compositor(self.outer, self.inner)(
+                **self.curried_params.params
+            )(**params)
+        curried = self.__dict__.get('_curried')
+        if curried is None:
+            curried = self.compositor(self.outer, self.inner)(
+                **self.curried_params.params
+            )
+            object.__setattr__(self, '_curried', curried)
+        return curried(**params)
+
+    def compile(self) -> Union['Pipeline', 'Composition']:
+        """
+        Flatten the composition into a linear ``Pipeline``.
+
+        Nested compositions whose compositors are all
+        ``direct_compositor`` or ``reversed_args_compositor`` are unrolled
+        into a flat sequence of stages, each of which is called with the
+        parameter merges that the nested closures would have performed.
+        Subtrees with any other compositor are kept as opaque stages. If
+        this composition's own compositor is of any other kind, the
+        composition is returned unchanged.
+        """
+        stages = _flatten_composition(self)
+        if stages is None:
+            return self
+        return Pipeline(tuple(stages))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_curried', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledStage:
+    """
+    A single stage of a compiled ``Pipeline``.
+
+    Each stage transforms the running parameter mapping ``d`` according to
+    its ``mode``:
+
+    * ``'call'`` : ``d = f(**{**fixed, **d})``
+    * ``'update'`` : ``d = {**d, **f(**{**fixed, **d})}``
+    * ``'inject'`` : ``d = {**d, **f(**fixed)}``
+    * ``'merge'`` : ``d = {**fixed, **d}``
+    """
+
+    f: Optional[Callable]
+    mode: Literal['call', 'update', 'inject', 'merge'] = 'call'
+    fixed: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+    def __str__(self):
+        if self.f is None:
+            return f'{self.mode}({self.fixed})'
+        return f'{self.mode}({_stage_name(self.f)}, {self.fixed})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+@dataclasses.dataclass(frozen=True)
+class Pipeline:
+    """
+    A linear sequence of compiled stages, executed in a single loop over
+    one running parameter mapping. See ``Composition.compile`` and
+    ``flows.compile_chain``.
+
+    The running mapping is updated in place for as long as it is owned by
+    the pipeline: that is, until it is replaced by the return value of a
+    called stage, which is never mutated.
+    """
+
+    stages: Tuple[CompiledStage, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, 'stages', tuple(self.stages))
+        object.__setattr__(self, '_plan', tuple(
+            (stage.mode, stage.f, dict(stage.fixed))
+            for stage in self.stages
+        ))
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __call__(self, **params):
+        d = params
+        owned = True
+        for mode, f, fixed in self._plan:
+            if mode == 'call':
+                d = f(**{**fixed, **d}) if fixed else f(**d)
+                owned = False
+                continue
+            elif mode == 'merge':
+                d = {**fixed, **d}
+                owned = True
+                continue
+            elif mode == 'update':
+                out = f(**{**fixed, **d}) if fixed else f(**d)
+            else:
+                out = f(**fixed)
+            if owned:
+                d.update(out)
+            else:
+                d = {**d, **out}
+                owned = True
+        return d
+
+    def __str__(self):
+        return '\n'.join(
+            f'[{i}] {stage}' for i, stage in enumerate(self.stages)
+        )
+
+    def __repr__(self):
+        return f'Pipeline({len(self.stages)} stages)'
+
+
+def _stage_name(f: Callable) -> str:
+    if isinstance(f, (Primitive, CallableContainer, Pipeline)):
+        return repr(f)
+    return getattr(f, '__name__', type(f).__name__)
+
+
+def _compositor_kind(c: Composition) -> Optional[str]:
+    compositor = c.compositor
+    if isinstance(compositor, FunctionWrapper):
+        compositor = compositor.f
+    if compositor is direct_compositor:
+        return 'direct'
+    elif compositor is reversed_args_compositor:
+        return 'reversed'
+    return None
+
+
+def _unwrap_container(g: Callable) -> Tuple[Callable, Mapping[str, Any]]:
+    # A container without positional parameters or conditions, whose
+    # internal parameters have lower priority than the environment, is
+    # equivalent to its wrapped callable with the internal parameters as
+    # defaults. Anything else is kept as is.
+    if (
+        isinstance(g, (FunctionWrapper, PartialApplication))
+        and not g.pparams
+        and not g.__conditions__
+        and (g._internal_first or not g.params)
+    ):
+        return g.f, g.params
+    return g, {}
+
+
+def _call_stages(
+    g: Callable,
+    fixed: Mapping[str, Any],
+) -> List[CompiledStage]:
+    # Stages equivalent to ``d = g(**{**fixed, **d})``.
+    if isinstance(g, Composition):
+        stages = _flatten_composition(g)
+        if stages is not None:
+            if not fixed:
+                return stages
+            elif stages[0].mode == 'call':
+                return [
+                    CompiledStage(
+                        stages[0].f,
+                        'call',
+                        {**stages[0].fixed, **fixed},
+                    ),
+                    *stages[1:],
+                ]
+            return [CompiledStage(None, 'merge', fixed), *stages]
+    f, defaults = _unwrap_container(g)
+    return [CompiledStage(f, 'call', {**defaults, **fixed})]
+
+
+def _flatten_composition(c: Composition) -> Optional[List[CompiledStage]]:
+    kind = _compositor_kind(c)
+    curried = c.curried_params.params
+    if kind == 'direct':
+        # outer(**{**curried, **inner(**params)})
+        return _call_stages(c.inner, {}) + _call_stages(c.outer, curried)
+    elif kind == 'reversed':
+        # outer(**{**params, **inner(**curried)})
+        inner = c.inner
+        if isinstance(inner, Composition):
+            inner = inner.compile()
+        inner, defaults = _unwrap_container(inner)
+        return [
+            CompiledStage(inner, 'inject', {**defaults, **curried}),
+            *_call_stages(c.outer, {}),
+        ]
+    return None
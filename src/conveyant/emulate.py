@@ -38,31 +38,57 @@ def wraps(
     return wrapper
 
 
+def _compile_binder(
+    f: callable,
+    strict: bool = True,
+    allow_variadic: bool = False,
+) -> callable:
+    """
+    Resolve the signature of `f` once into a tuple of (name, default) slots
+    and return a function that binds a parameter mapping to those slots.
+
+    The binder consumes the mapping that it is passed.
+    """
+    slots = tuple(
+        (k, v.default)
+        for k, v in inspect.signature(f).parameters.items()
+        if v.kind != v.VAR_KEYWORD
+    )
+    reject_unexpected = strict and not allow_variadic
+
+    def bind(params: dict) -> dict:
+        argument = {}
+        for k, default in slots:
+            argument[k] = params.pop(k, default)
+            if argument[k] is inspect._empty:
+                raise TypeError(
+                    f'{f.__name__}() missing required argument {k!r}'
+                )
+        if len(params) > 0 and reject_unexpected:
+            raise TypeError(
+                f'{f.__name__}() got an unexpected keyword argument '
+                f'{list(params.keys())[0]!r}'
+            )
+        elif allow_variadic:
+            argument = {**params, **argument}
+        return argument
+    return bind
+
+
 def emulate_assignment(
     strict: bool = True,
     allow_variadic: bool = False,
 ) -> callable:
     def _emulate_assignment(f: callable) -> callable:
+        bind = _compile_binder(
+            f,
+            strict=strict,
+            allow_variadic=allow_variadic,
+        )
+
         @wraps(f, assigned=WRAPPER_ASSIGNMENTS + ('__kwdefaults__',))
         def wrapped(**params):
-            argument = {}
-            parameters = inspect.signature(f).parameters
-            for k, v in parameters.items():
-                if v.kind == v.VAR_KEYWORD:
-                    continue
-                argument[k] = params.pop(k, v.default)
-                if argument[k] is inspect._empty:
-                    raise TypeError(
-                        f'{f.__name__}() missing required argument {k!r}'
-                    )
-            if len(params) > 0 and strict and not allow_variadic:
-                raise TypeError(
-                    f'{f.__name__}() got an unexpected keyword argument '
-                    f'{list(params.keys())[0]!r}'
-                )
-            elif allow_variadic:
-                argument = {**params, **argument}
-            return f(**argument)
+            return f(**bind(params))
         return wrapped
     return _emulate_assignment
 
@@ -6,17 +6,37 @@ Functional control flows
 ~~~~~~~~~~~~~~~~~~~~~~~~
 Simple functional transformations for configuring control flows of functions.
 """
+import asyncio
+import inspect
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from itertools import chain
-from typing import Literal, Mapping, Optional, Sequence
+from typing import Any, Literal, Mapping, Optional, Sequence, Tuple, Union
 
+from . import instrument
 from .compositors import (
+    Invocation,
+    _gather_ordered,
+    _maybe_await,
     _seq_to_dict,
+    async_delayed_outer_compositor,
+    async_direct_compositor,
+    close_async_imapping_compositor,
+    close_async_omapping_compositor,
     close_imapping_compositor,
     close_omapping_compositor,
     delayed_outer_compositor,
     direct_compositor,
 )
+from .containers import CompiledStage, Pipeline
+from .memo import Cache, LRUCache
 from .replicate import replicate
+from .transport import SharedMemoryTransport
 
 
 def null_prim(**params):
@@ -30,6 +50,9 @@ def null_transform(
     return f
 
 
+null_transform.__transforms__ = ()
+
+
 def null_stage() -> callable:
     return null_transform
 
@@ -48,6 +71,77 @@ def inject_params() -> callable:
     return transform
 
 
+def cached(
+    cache: Optional[Cache] = None,
+    name: Optional[str] = None,
+) -> callable:
+    """
+    Memoise the transformed function across calls.
+
+    Results are stored in ``cache`` (a new ``LRUCache`` by default). Entries
+    are keyed by the transformed function, or by ``name`` if it is given,
+    together with the parameters. A persistent ``DiskCache`` requires a
+    ``name``, as the transformed function is a closure that cannot be
+    identified across processes.
+    """
+    cache = cache if cache is not None else LRUCache()
+
+    def transform(
+        f: callable,
+        compositor: callable = direct_compositor,
+    ) -> callable:
+        def f_transformed(**params):
+            return cache.call(f, params, identity=name)
+        return f_transformed
+    return transform
+
+
+def istage(g: callable) -> callable:
+    """
+    Input transform that calls ``g`` with the parameters passed to the
+    transformed function, and updates those parameters with its output.
+
+    Unlike an arbitrary transform, an ``istage`` can be compiled into a
+    ``Pipeline`` stage by ``compile_chain``.
+    """
+    def transform(
+        f: callable,
+        compositor: callable = direct_compositor,
+    ) -> callable:
+        def f_transformed(**params):
+            return compositor(f, g)(**params)(**params)
+        return f_transformed
+    transform.__stage__ = CompiledStage(g, 'update')
+    return transform
+
+
+def ostage(g: callable) -> callable:
+    """
+    Output transform that calls ``g`` with the output of the transformed
+    function, and returns its output.
+
+    Unlike an arbitrary transform, an ``ostage`` can be compiled into a
+    ``Pipeline`` stage by ``compile_chain``.
+    """
+    def transform(
+        f: callable,
+        compositor: callable = direct_compositor,
+    ) -> callable:
+        def f_transformed(**params):
+            return compositor(g, f)()(**params)
+        return f_transformed
+    transform.__stage__ = CompiledStage(g, 'call')
+    return transform
+
+
+def _chain_transforms(pparams: Sequence[callable]) -> Tuple[callable, ...]:
+    # Expand chains into the elementary transforms that they apply, in the
+    # order that they are applied.
+    return tuple(chain.from_iterable(
+        getattr(p, '__transforms__', (p,)) for p in pparams
+    ))
+
+
 def ichain(*pparams) -> callable:
     def transform(
         f: callable,
@@ -56,6 +150,7 @@ def ichain(*pparams) -> callable:
         for p in reversed(pparams):
             f = p(f, compositor=compositor)
         return f
+    transform.__transforms__ = _chain_transforms(reversed(pparams))
     return transform
 
 
@@ -67,6 +162,7 @@ def ochain(*pparams) -> callable:
         for p in pparams:
             f = p(f, compositor=compositor)
         return f
+    transform.__transforms__ = _chain_transforms(pparams)
     return transform
 
 
@@ -83,6 +179,220 @@ def iochain(
     return f
 
 
+def compile_chain(
+    f: callable,
+    ichain: Optional[callable] = None,
+    ochain: Optional[callable] = None,
+    compositor: callable = direct_compositor,
+) -> Pipeline:
+    """
+    Compile the equivalent of ``iochain(f, ichain, ochain)`` into a
+    ``Pipeline`` whose stages can be inspected.
+
+    Transforms created by ``istage`` and ``ostage``, including those nested
+    in chains, become pipeline stages that run in a single loop over one
+    parameter mapping. Any other transform is opaque: it is applied to the
+    stages compiled so far, and its result becomes a single stage. With a
+    compositor other than ``direct_compositor``, the whole chain is opaque.
+    """
+    if compositor is not direct_compositor:
+        return Pipeline((
+            CompiledStage(iochain(f, ichain, ochain, compositor=compositor)),
+        ))
+    transforms = _chain_transforms([t for t in (ichain, ochain) if t])
+    stages = [CompiledStage(f)]
+    for transform in transforms:
+        stage = getattr(transform, '__stage__', None)
+        if stage is None:
+            if len(stages) == 1 and stages[0].mode == 'call':
+                compiled = stages[0].f
+            else:
+                compiled = Pipeline(stages)
+            compiled = transform(compiled, compositor=compositor)
+            stages = [CompiledStage(compiled)]
+        elif stage.mode == 'update':
+            stages.insert(0, stage)
+        else:
+            stages.append(stage)
+    return Pipeline(stages)
+
+
+class BranchError(Exception):
+    """
+    Raised when one or more branches of a split chain fail. The exceptions
+    raised by the failing branches are available in ``errors``, a mapping
+    from branch index to exception.
+    """
+
+    def __init__(self, errors: Mapping[int, BaseException]):
+        self.errors = dict(errors)
+        super().__init__(
+            f'{len(self.errors)} branch(es) failed: ' + '; '.join(
+                f'[{i}] {type(e).__name__}: {e}'
+                for i, e in self.errors.items()
+            )
+        )
+
+
+def _branch_timeout(i: int, timeout: float) -> TimeoutError:
+    return TimeoutError(f'Branch {i} timed out after {timeout} s')
+
+
+def _branch_calls(
+    fs: Sequence[callable],
+    mapping: Mapping[str, Sequence],
+    params: Mapping,
+) -> Sequence[Tuple[callable, Mapping]]:
+    return tuple(
+        (
+            f,
+            {
+                **params,
+                **{
+                    k: mapping[k][i]
+                    if len(mapping[k]) > 1
+                    else mapping[k][0]
+                    for k in mapping
+                },
+            },
+        )
+        for i, f in enumerate(fs)
+    )
+
+
+def _spanned_branches(
+    calls: Sequence[Tuple[callable, Mapping]],
+) -> Sequence[Tuple[callable, Mapping]]:
+    # Each branch is a span, wherever it runs.
+    return tuple(
+        (
+            instrument.Spanned(
+                f,
+                instrument.context('branch', instrument.label(f), index=i),
+            ),
+            params,
+        )
+        for i, (f, params) in enumerate(calls)
+    )
+
+
+def _merge_branches(
+    outcomes: Sequence[Tuple[bool, Any]],
+    on_error: Literal['raise', 'aggregate', 'drop'],
+    merge_type: Optional[Literal['union', 'intersection']],
+) -> Mapping[str, Sequence]:
+    errors = {
+        i: out for i, (ok, out) in enumerate(outcomes) if not ok
+    }
+    if errors:
+        if on_error == 'raise':
+            raise next(iter(errors.values()))
+        elif on_error == 'aggregate' or len(errors) == len(outcomes):
+            raise BranchError(errors)
+    ret = tuple(out for ok, out in outcomes if ok)
+    return _seq_to_dict(ret, merge_type=merge_type)
+
+
+def _run_branches_executor(
+    calls: Sequence[Tuple[callable, Mapping]],
+    executor: Executor,
+    timeout: Optional[float] = None,
+) -> Sequence[Tuple[bool, Any]]:
+    submitted = []
+    for f, params in calls:
+        submitted.append(
+            (time.monotonic(), executor.submit(Invocation(f, params)))
+        )
+    outcomes = []
+    for i, (start, future) in enumerate(submitted):
+        try:
+            if timeout is None:
+                result = future.result()
+            else:
+                remaining = max(0, start + timeout - time.monotonic())
+                result = future.result(timeout=remaining)
+            outcomes.append((True, instrument.collect(result)))
+        except FuturesTimeoutError:
+            future.cancel()
+            outcomes.append((False, _branch_timeout(i, timeout)))
+        except Exception as e:
+            outcomes.append((False, e))
+    return outcomes
+
+
+def _run_branches_asyncio(
+    calls: Sequence[Tuple[callable, Mapping]],
+    executor: Executor,
+    timeout: Optional[float] = None,
+) -> Sequence[Tuple[bool, Any]]:
+    async def run_branch(i, f, params):
+        loop = asyncio.get_running_loop()
+        try:
+            return True, instrument.collect(await asyncio.wait_for(
+                loop.run_in_executor(executor, Invocation(f, params)),
+                timeout,
+            ))
+        except asyncio.TimeoutError:
+            return False, _branch_timeout(i, timeout)
+        except Exception as e:
+            return False, e
+
+    async def run_branches():
+        return await asyncio.gather(*(
+            run_branch(i, f, params)
+            for i, (f, params) in enumerate(calls)
+        ))
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run_branches())
+    raise RuntimeError(
+        "The 'asyncio' concurrency mode starts its own event loop and "
+        'cannot be used from a running one. Use async_split_chain instead.'
+    )
+
+
+def _run_branches(
+    calls: Sequence[Tuple[callable, Mapping]],
+    concurrency: Optional[Literal['thread', 'process', 'asyncio']] = None,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    fail_fast: bool = False,
+) -> Sequence[Tuple[bool, Any]]:
+    """
+    Evaluate each (function, parameters) pair in `calls`, returning a
+    sequence of (success, result or exception) outcomes in call order.
+    Under serial evaluation with `fail_fast`, the first exception is
+    raised immediately.
+    """
+    if concurrency is None and executor is None:
+        outcomes = []
+        for f, params in calls:
+            if fail_fast:
+                outcomes.append((True, f(**params)))
+                continue
+            try:
+                outcomes.append((True, f(**params)))
+            except Exception as e:
+                outcomes.append((False, e))
+        return outcomes
+    own_executor = executor is None
+    if own_executor:
+        if concurrency == 'process':
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        if concurrency == 'asyncio':
+            return _run_branches_asyncio(calls, executor, timeout)
+        return _run_branches_executor(calls, executor, timeout)
+    finally:
+        if own_executor:
+            # Don't block on branches that have timed out.
+            executor.shutdown(wait=timeout is None, cancel_futures=True)
+
+
 def split_chain(
     *chains: Sequence[callable],
     map_spec: Optional[Sequence[str]] = None,
@@ -90,7 +400,51 @@ def split_chain(
     maximum_aggregation_depth: Optional[int] = None,
     broadcast_out_of_spec: bool = False,
     merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    concurrency: Optional[Literal['thread', 'process', 'asyncio']] = None,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    on_error: Literal['raise', 'aggregate', 'drop'] = 'raise',
 ) -> callable:
+    """
+    Split the transformed function into branches, one for each chain, and
+    merge the branch outputs in branch order.
+
+    By default, branches are evaluated serially. If ``concurrency`` is
+    ``'thread'`` or ``'process'``, branches are evaluated simultaneously on
+    a pool of at most ``max_workers`` workers that is created for each call;
+    ``'asyncio'`` runs the branches on that pool from an event loop. A
+    long-lived ``executor`` can be passed instead of creating a pool for
+    each call. Under the ``'asyncio'`` mode, the transformed function
+    must not be called from a running event loop; use ``async_split_chain``
+    there instead.
+
+    To be sent to worker processes, each branch is compiled with
+    ``compile_chain``, so branches built from ``istage`` and ``ostage``
+    transforms of picklable functions (such as ``Primitive`` instances of
+    module-level functions) can be evaluated under the ``'process'`` mode
+    or on a ``ProcessPoolExecutor``. Any other transform is compiled as an
+    opaque stage, which compositor closures prevent from being pickled. The
+    arguments of every branch must also be picklable.
+
+    ``timeout`` bounds the time (in seconds, measured from submission) that
+    each branch is allowed to run under concurrent evaluation. A branch
+    that exceeds it fails with a ``TimeoutError``; its worker is not
+    interrupted. ``on_error`` determines how failing branches are handled:
+    ``'raise'`` re-raises the exception of the first failing branch,
+    ``'aggregate'`` raises a ``BranchError`` collecting all failures, and
+    ``'drop'`` merges only the outputs of successful branches (raising a
+    ``BranchError`` if every branch fails).
+    """
+    if concurrency not in (None, 'thread', 'process', 'asyncio'):
+        raise ValueError(f'Unrecognized concurrency: {concurrency}')
+    if timeout is not None and concurrency is None and executor is None:
+        raise ValueError(
+            'A branch timeout requires concurrent evaluation: specify '
+            '`concurrency` or `executor`.'
+        )
+    if on_error not in ('raise', 'aggregate', 'drop'):
+        raise ValueError(f'Unrecognized on_error policy: {on_error}')
     map_spec = map_spec or []
     map_spec_transformer = replicate(
         spec=map_spec,
@@ -99,9 +453,88 @@ def split_chain(
         maximum_aggregation_depth=maximum_aggregation_depth,
         broadcast_out_of_spec=broadcast_out_of_spec,
     )
+    processes = concurrency == 'process' or isinstance(
+        executor, ProcessPoolExecutor
+    )
     def transform(
         f: callable,
         compositor: callable = direct_compositor,
+    ) -> callable:
+        if processes:
+            # Compositor closures cannot be pickled, but the compiled
+            # stages of a chain of picklable functions can.
+            fs_transformed = tuple(
+                compile_chain(f, c, compositor=compositor) for c in chains
+            )
+        else:
+            fs_transformed = tuple(
+                c(f, compositor=compositor) for c in chains
+            )
+            try:
+                fs_transformed = tuple(chain(*fs_transformed))
+            except TypeError:
+                pass
+
+        def f_transformed(**params: Mapping):
+            calls = _branch_calls(
+                fs_transformed, map_spec_transformer(**params), params
+            )
+            if instrument.ACTIVE:
+                calls = _spanned_branches(calls)
+            outcomes = _run_branches(
+                calls,
+                concurrency=concurrency,
+                executor=executor,
+                max_workers=max_workers,
+                timeout=timeout,
+                fail_fast=(on_error == 'raise'),
+            )
+            return _merge_branches(outcomes, on_error, merge_type)
+
+        return f_transformed
+    transform.__flow__ = {
+        'kind': 'split',
+        'chains': chains,
+        'map_spec': map_spec,
+    }
+    return transform
+
+
+def async_split_chain(
+    *chains: Sequence[callable],
+    map_spec: Optional[Sequence[str]] = None,
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+    maximum_aggregation_depth: Optional[int] = None,
+    broadcast_out_of_spec: bool = False,
+    merge_type: Optional[Literal['union', 'intersection']] = 'union',
+    max_in_flight: Optional[int] = None,
+    timeout: Optional[float] = None,
+    on_error: Literal['raise', 'aggregate', 'drop'] = 'raise',
+) -> callable:
+    """
+    Asynchronous counterpart of ``split_chain``.
+
+    The transformed function is a coroutine function. Its branches, which
+    may be coroutine functions or plain functions, are awaited concurrently
+    with ``asyncio.gather``, with at most ``max_in_flight`` branches awaited
+    at once, and their outputs are merged in branch order. A branch that is
+    not complete within ``timeout`` seconds is cancelled and fails with a
+    ``TimeoutError``. ``on_error`` is as for ``split_chain``; under
+    ``'raise'``, the exception of the first failing branch is raised once
+    every branch has completed.
+    """
+    if on_error not in ('raise', 'aggregate', 'drop'):
+        raise ValueError(f'Unrecognized on_error policy: {on_error}')
+    map_spec_transformer = replicate(
+        spec=map_spec or [],
+        weave_type=weave_type,
+        n_replicates=len(chains),
+        maximum_aggregation_depth=maximum_aggregation_depth,
+        broadcast_out_of_spec=broadcast_out_of_spec,
+    )
+    def transform(
+        f: callable,
+        compositor: callable = async_direct_compositor,
     ) -> callable:
         fs_transformed = tuple(c(f, compositor=compositor) for c in chains)
         try:
@@ -109,41 +542,83 @@ def split_chain(
         except TypeError:
             pass
 
-        def f_transformed(**params: Mapping):
-            mapping = map_spec_transformer(**params)
-            ret = tuple(
-                fs_transformed[i](
-                    **{
-                        **params,
-                        **{
-                            k: mapping[k][i]
-                            if len(mapping[k]) > 1
-                            else mapping[k][0]
-                            for k in mapping
-                        },
-                    }
+        async def run_branch(i: int, f: callable, params: Mapping):
+            try:
+                return True, await asyncio.wait_for(
+                    _maybe_await(f(**params)), timeout
                 )
-                for i in range(len(fs_transformed))
+            except asyncio.TimeoutError:
+                return False, _branch_timeout(i, timeout)
+            except Exception as e:
+                return False, e
+
+        async def f_transformed(**params: Mapping):
+            calls = _branch_calls(
+                fs_transformed, map_spec_transformer(**params), params
             )
-            return _seq_to_dict(ret, merge_type=merge_type)
+            outcomes = await _gather_ordered(
+                run_branch,
+                (
+                    {'i': i, 'f': f, 'params': params}
+                    for i, (f, params) in enumerate(calls)
+                ),
+                max_in_flight=max_in_flight,
+            )
+            return _merge_branches(outcomes, on_error, merge_type)
 
         return f_transformed
+    transform.__flow__ = {
+        'kind': 'split',
+        'chains': chains,
+        'map_spec': map_spec,
+        'asynchronous': True,
+    }
     return transform
 
 
+def _check_asynchronous(executor: Optional[Executor]) -> None:
+    if executor is not None:
+        raise ValueError(
+            'Asynchronous mappings are awaited on the event loop and do not '
+            'accept an executor.'
+        )
+
+
 def imapping_composition(
     transform: callable,
     map_spec: Optional[Sequence[str]] = None,
     inner_mapping: Optional[Mapping[str, Sequence]] = None,
     outer_mapping: Optional[Mapping[str, Sequence]] = None,
     n_replicates: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    memo_key: Union[
+        Literal['structural', 'repr'], callable, None
+    ] = 'structural',
+    asynchronous: bool = False,
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
-    mapping_compositor = close_imapping_compositor(
-        map_spec=map_spec,
-        inner_mapping=inner_mapping,
-        outer_mapping=outer_mapping,
-        n_replicates=n_replicates,
-    )
+    if asynchronous:
+        _check_asynchronous(executor)
+        mapping_compositor = close_async_imapping_compositor(
+            map_spec=map_spec,
+            inner_mapping=inner_mapping,
+            outer_mapping=outer_mapping,
+            n_replicates=n_replicates,
+            max_in_flight=max_in_flight,
+            memo_key=memo_key,
+        )
+    else:
+        mapping_compositor = close_imapping_compositor(
+            map_spec=map_spec,
+            inner_mapping=inner_mapping,
+            outer_mapping=outer_mapping,
+            n_replicates=n_replicates,
+            executor=executor,
+            max_in_flight=max_in_flight,
+            memo_key=memo_key,
+            transport=transport,
+        )
     def transform_(
         f: callable,
         compositor: Optional[callable] = None,
@@ -151,6 +626,14 @@ def imapping_composition(
         # We override any compositor passed to the transform function
         # with the mapping compositor.
         return transform(f, compositor=mapping_compositor)
+    transform_.__flow__ = {
+        'kind': 'map',
+        'direction': 'input',
+        'chains': (transform,),
+        'map_spec': map_spec,
+        'mapping': {**(inner_mapping or {}), **(outer_mapping or {})},
+        'asynchronous': asynchronous,
+    }
     return transform_
 
 
@@ -159,12 +642,28 @@ def omapping_composition(
     map_spec: Optional[Sequence[str]] = None,
     mapping: Optional[Mapping[str, Sequence]] = None,
     n_replicates: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    asynchronous: bool = False,
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
-    mapping_compositor = close_omapping_compositor(
-        map_spec=map_spec,
-        mapping=mapping,
-        n_replicates=n_replicates,
-    )
+    if asynchronous:
+        _check_asynchronous(executor)
+        mapping_compositor = close_async_omapping_compositor(
+            map_spec=map_spec,
+            mapping=mapping,
+            n_replicates=n_replicates,
+            max_in_flight=max_in_flight,
+        )
+    else:
+        mapping_compositor = close_omapping_compositor(
+            map_spec=map_spec,
+            mapping=mapping,
+            n_replicates=n_replicates,
+            executor=executor,
+            max_in_flight=max_in_flight,
+            transport=transport,
+        )
     def transform_(
         f: callable,
         compositor: Optional[callable] = None,
@@ -172,6 +671,14 @@ def omapping_composition(
         # We override any compositor passed to the transform function
         # with the mapping compositor.
         return transform(f, compositor=mapping_compositor)
+    transform_.__flow__ = {
+        'kind': 'map',
+        'direction': 'output',
+        'chains': (transform,),
+        'map_spec': map_spec,
+        'mapping': mapping,
+        'asynchronous': asynchronous,
+    }
     return transform_
 
 
@@ -181,6 +688,13 @@ def imap(
     mapping: Optional[Mapping[str, Sequence]] = None,
     map_spec: Optional[Sequence[str]] = None,
     n_replicates: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    memo_key: Union[
+        Literal['structural', 'repr'], callable, None
+    ] = 'structural',
+    asynchronous: bool = False,
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
     transform = transform or inject_params()
     mapping = mapping or {}
@@ -190,6 +704,11 @@ def imap(
         outer_mapping=mapping,
         map_spec=map_spec,
         n_replicates=n_replicates,
+        executor=executor,
+        max_in_flight=max_in_flight,
+        memo_key=memo_key,
+        asynchronous=asynchronous,
+        transport=transport,
     )
 
 
@@ -199,6 +718,10 @@ def omap(
     mapping: Optional[Mapping[str, Sequence]] = None,
     map_spec: Optional[Sequence[str]] = None,
     n_replicates: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    max_in_flight: Optional[int] = None,
+    asynchronous: bool = False,
+    transport: Optional[SharedMemoryTransport] = None,
 ) -> callable:
     transform = transform or inject_params()
     mapping = mapping or {}
@@ -208,9 +731,32 @@ def omap(
         mapping=mapping,
         map_spec=map_spec,
         n_replicates=n_replicates,
+        executor=executor,
+        max_in_flight=max_in_flight,
+        asynchronous=asynchronous,
+        transport=transport,
     )
 
 
+def _join_outputs(
+    out: Sequence[Tuple[Mapping, callable, Mapping]],
+    joining_f: callable,
+    join_vars: Optional[Sequence[str]] = None,
+) -> Tuple[callable, Mapping]:
+    out = tuple(zip(*out))
+    f_outer = out[1][0]
+    f_outer_params = out[2][0]
+    out = _seq_to_dict(out[0], merge_type='union')
+    jvars = join_vars or tuple(out.keys())
+
+    for k, v in out.items():
+        if k not in jvars:
+            out[k] = v[0]
+            continue
+        out[k] = joining_f(v)
+    return f_outer, {**f_outer_params, **out}
+
+
 # TODO: Consider whether adding postprocessing to other flow control
 #       functions would be useful.
 def join(
@@ -230,22 +776,85 @@ def join(
 
             def join_fs(**params):
                 out = [f(**params) for f in fs]
-                out = tuple(zip(*out))
-                f_outer = out[1][0]
-                f_outer_params = out[2][0]
-                out = _seq_to_dict(out[0], merge_type='union')
-                jvars = join_vars or tuple(out.keys())
-
-                for k, v in out.items():
-                    if k not in jvars:
-                        out[k] = v[0]
-                        continue
-                    out[k] = joining_f(v)
-                return f_outer(**{**f_outer_params, **out})
+                if instrument.ACTIVE:
+                    with instrument.span(
+                        'join', instrument.label(joining_f), n=len(out)
+                    ):
+                        f_outer, params = _join_outputs(
+                            out, joining_f, join_vars
+                        )
+                else:
+                    f_outer, params = _join_outputs(out, joining_f, join_vars)
+                return f_outer(**params)
+
+            if postprocess is not None:
+                join_fs = postprocess(join_fs, fs)
+
+            return join_fs
+        transform.__flow__ = {
+            'kind': 'join',
+            'chains': chains,
+            'joining_f': joining_f,
+            'join_vars': join_vars,
+        }
+        return transform
+    return split_chain
+
+
+def async_join(
+    joining_f: callable,
+    join_vars: Optional[Sequence[str]] = None,
+    postprocess: Optional[callable] = None,
+) -> callable:
+    """
+    Asynchronous counterpart of ``join``. The joined function is a
+    coroutine function that awaits all chains concurrently with
+    ``asyncio.gather`` before joining their outputs.
+    """
+    def split_chain(*chains: Sequence[callable]) -> callable:
+        def transform(
+            f: callable,
+            compositor: Optional[callable] = None,
+        ) -> callable:
+            fs = [
+                chain(f, compositor=async_delayed_outer_compositor)
+                for chain in chains
+            ]
+
+            async def join_fs(**params):
+                out = await asyncio.gather(*(
+                    _maybe_await(f(**params)) for f in fs
+                ))
+                f_outer, params = _join_outputs(out, joining_f, join_vars)
+                return await _maybe_await(f_outer(**params))
 
             if postprocess is not None:
                 join_fs = postprocess(join_fs, fs)
 
             return join_fs
+        transform.__flow__ = {
+            'kind': 'join',
+            'chains': chains,
+            'joining_f': joining_f,
+            'join_vars': join_vars,
+            'asynchronous': True,
+        }
         return transform
     return split_chain
+
+
+def run_sync(f: callable) -> callable:
+    """
+    Wrap an asynchronous flow for synchronous callers. Each call of the
+    wrapped function runs a new event loop until the flow completes, so it
+    must not be made from a running event loop.
+    """
+    async def await_result(out):
+        return await out
+
+    def f_sync(**params):
+        out = f(**params)
+        if inspect.isawaitable(out):
+            return asyncio.run(await_result(out))
+        return out
+    return f_sync
@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Pipeline graphs
+~~~~~~~~~~~~~~~
+Explicit data flow graphs of chained pipelines.
+
+A chain built with ``ichain`` and ``ochain`` threads a single parameter
+mapping through its stages, but most stages read and write only a few of
+its entries. ``extract_graph`` recovers those dependencies: each stage
+becomes a node, and each edge records the parameters that flow from the
+stage that last wrote them to a stage that reads them. Stages without a
+path between them are independent.
+"""
+import dataclasses
+import inspect
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .compositors import direct_compositor
+from .containers import (
+    CallableContainer,
+    CompiledStage,
+    Composition,
+    Pipeline,
+    Primitive,
+)
+from .flows import _chain_transforms, iochain
+from .instrument import label
+from .memo import function_key, structural_key
+
+
+@dataclasses.dataclass(frozen=True)
+class GraphNode:
+    """
+    A node of a ``PipelineGraph``.
+
+    Every graph has a single ``'input'`` node, which supplies the
+    parameters passed by the caller, and a single ``'output'`` node, which
+    collects the final parameter mapping. Every other node executes a
+    ``CompiledStage`` against the parameter mapping it receives.
+
+    ``reads`` is the set of parameters that the stage can accept (None if
+    it accepts any), and ``writes`` the set of parameters that it outputs
+    (None if unknown). Stages in the ``'call'`` mode replace the parameter
+    mapping with their output, except that stages that ``forwards`` pass
+    any parameters that they do not consume through unchanged.
+
+    Nodes of kind ``'split'``, ``'map'`` and ``'join'`` are created by
+    ``split_chain``, ``imap``/``omap`` and ``join``. They execute opaquely,
+    but their ``branches`` describe the pipeline run by each branch (or by
+    each replicate, for a ``'map'`` node), including all upstream stages,
+    and ``meta`` records their configuration. Any other transform becomes
+    an ``'opaque'`` node.
+    """
+
+    id: int
+    kind: Literal[
+        'input', 'output', 'stage', 'split', 'map', 'join', 'opaque'
+    ]
+    stage: Optional[CompiledStage] = None
+    reads: Optional[FrozenSet[str]] = None
+    writes: Optional[FrozenSet[str]] = None
+    forwards: bool = False
+    branches: Tuple['PipelineGraph', ...] = ()
+    meta: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        if self.stage is None or self.stage.f is None or self.branches:
+            return self.kind
+        return label(self.stage.f)
+
+    @property
+    def replaces(self) -> bool:
+        return self.stage is not None and self.stage.mode == 'call'
+
+    def __str__(self):
+        reads = '*' if self.reads is None else ', '.join(sorted(self.reads))
+        writes = (
+            '*' if self.writes is None else ', '.join(sorted(self.writes))
+        )
+        return f'{self.kind} {self.name} ({reads}) -> ({writes})'
+
+
+@dataclasses.dataclass(frozen=True)
+class GraphEdge:
+    """
+    A flow of parameters from node ``src`` to node ``dst``. If ``params``
+    is None, all parameters in the output of ``src`` flow along the edge,
+    except those in ``exclude``.
+    """
+
+    src: int
+    dst: int
+    params: Optional[FrozenSet[str]] = None
+    exclude: FrozenSet[str] = frozenset()
+
+    def carries(self, name: str) -> bool:
+        if self.params is None:
+            return name not in self.exclude
+        return name in self.params
+
+
+@dataclasses.dataclass(frozen=True)
+class PipelineGraph:
+    """
+    Data flow graph of a pipeline. Nodes are listed in pipeline order,
+    which is always a topological order of the graph.
+    """
+
+    nodes: Tuple[GraphNode, ...]
+    edges: Tuple[GraphEdge, ...]
+
+    def __post_init__(self):
+        preds = {node.id: [] for node in self.nodes}
+        succs = {node.id: [] for node in self.nodes}
+        for edge in self.edges:
+            preds[edge.dst].append(edge)
+            succs[edge.src].append(edge)
+        object.__setattr__(self, '_index', {n.id: n for n in self.nodes})
+        object.__setattr__(self, '_in', preds)
+        object.__setattr__(self, '_out', succs)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __getitem__(self, id: int) -> GraphNode:
+        return self._index[id]
+
+    @property
+    def input(self) -> GraphNode:
+        return self.nodes[0]
+
+    @property
+    def output(self) -> GraphNode:
+        return self.nodes[-1]
+
+    def in_edges(self, id: int) -> Sequence[GraphEdge]:
+        return tuple(self._in[id])
+
+    def out_edges(self, id: int) -> Sequence[GraphEdge]:
+        return tuple(self._out[id])
+
+    def predecessors(self, id: int) -> Sequence[int]:
+        return tuple(e.src for e in self._in[id])
+
+    def successors(self, id: int) -> Sequence[int]:
+        return tuple(e.dst for e in self._out[id])
+
+    def ancestors(self, id: int) -> FrozenSet[int]:
+        return self._reach(id, self.predecessors)
+
+    def descendants(self, id: int) -> FrozenSet[int]:
+        return self._reach(id, self.successors)
+
+    def _reach(self, id: int, step: Callable) -> FrozenSet[int]:
+        seen = set()
+        frontier = list(step(id))
+        while frontier:
+            node = frontier.pop()
+            if node not in seen:
+                seen.add(node)
+                frontier.extend(step(node))
+        return frozenset(seen)
+
+    def independent(self, a: int, b: int) -> bool:
+        """
+        Whether neither node depends on the other, so that they can be
+        executed in either order or concurrently.
+        """
+        return a != b and a not in self.ancestors(b) and (
+            b not in self.ancestors(a)
+        )
+
+    def levels(self) -> Sequence[Tuple[int, ...]]:
+        """
+        Partition the nodes into levels, such that every node depends only
+        on nodes in earlier levels. The nodes within a level are mutually
+        independent.
+        """
+        depth = {}
+        for node in self.nodes:
+            depth[node.id] = 1 + max(
+                (depth[p] for p in self.predecessors(node.id)), default=-1
+            )
+        levels = [[] for _ in range(max(depth.values()) + 1)]
+        for node in self.nodes:
+            levels[depth[node.id]].append(node.id)
+        return tuple(tuple(level) for level in levels)
+
+    def deduplicate(self) -> 'PipelineGraph':
+        """
+        Merge nodes that execute the same stage on the same inputs. The
+        merged node takes over the outgoing edges of its duplicates.
+        Branches of composite nodes are deduplicated in turn.
+        """
+        canonical = {}
+        replaced = {}
+        nodes = []
+        for node in self.nodes:
+            in_edges = tuple(sorted(
+                (
+                    replaced.get(e.src, e.src),
+                    None if e.params is None else tuple(sorted(e.params)),
+                    tuple(sorted(e.exclude)),
+                )
+                for e in self._in[node.id]
+            ))
+            key = _node_key(node)
+            if key is not None:
+                key = (key, in_edges)
+                if key in canonical:
+                    replaced[node.id] = canonical[key]
+                    continue
+                canonical[key] = node.id
+            if node.branches:
+                node = dataclasses.replace(node, branches=tuple(
+                    b.deduplicate() for b in node.branches
+                ))
+            nodes.append(node)
+        return PipelineGraph(
+            tuple(nodes),
+            _merge_edges(
+                dataclasses.replace(
+                    e,
+                    src=replaced.get(e.src, e.src),
+                )
+                for e in self.edges
+                if e.dst not in replaced
+            ),
+        )
+
+    def prune(
+        self,
+        outputs: Optional[Iterable[str]] = None,
+    ) -> 'PipelineGraph':
+        """
+        Remove all nodes that cannot contribute to the specified outputs
+        (all outputs if None) of the pipeline.
+        """
+        outputs = None if outputs is None else frozenset(outputs)
+        output = self.output.id
+        needed = {output}
+        for node in reversed(self.nodes[:-1]):
+            for e in self._out[node.id]:
+                if e.dst == output:
+                    if outputs is None or any(
+                        e.carries(name) for name in outputs
+                    ):
+                        break
+                elif e.dst in needed:
+                    break
+            else:
+                if node.kind != 'input':
+                    continue
+            needed.add(node.id)
+        edges = tuple(
+            e for e in self.edges
+            if e.src in needed and e.dst in needed
+            and (e.dst != output or outputs is None or any(
+                e.carries(name) for name in outputs
+            ))
+        )
+        if outputs is not None:
+            edges = tuple(
+                _restrict(e, outputs) if e.dst == output else e
+                for e in edges
+            )
+        return PipelineGraph(
+            tuple(n for n in self.nodes if n.id in needed),
+            edges,
+        )
+
+    def eliminate_dead_outputs(
+        self,
+        outputs: Optional[Iterable[str]] = None,
+    ) -> Tuple['PipelineGraph', 'EliminationReport']:
+        """
+        Remove the outputs that no downstream stage reads and that are not
+        among the specified outputs (all outputs if None) of the pipeline.
+
+        A stage whose outputs are all unused is removed. A ``Primitive``
+        stage with only some unused outputs is wrapped so that it drops
+        them, and they are no longer merged downstream. Stages with
+        undeclared outputs are kept whenever anything downstream might
+        read them. Composite nodes execute opaquely, so their branches are
+        left unchanged. Returns the optimised graph and a report of what
+        was eliminated.
+        """
+        outputs = None if outputs is None else frozenset(outputs)
+        output = self.output.id
+        edges = [
+            _restrict(e, outputs)
+            if e.dst == output and outputs is not None else e
+            for e in self.edges
+        ]
+        edges = [e for e in edges if e.params is None or e.params]
+        out_edges = {node.id: [] for node in self.nodes}
+        for e in edges:
+            out_edges[e.src].append(e)
+        live = {output}
+        narrowed = {}
+        for node in reversed(self.nodes[:-1]):
+            used = set()
+            unknown = False
+            for e in out_edges[node.id]:
+                if e.dst not in live:
+                    continue
+                if e.params is not None:
+                    used |= e.params
+                elif node.writes is None:
+                    unknown = True
+                else:
+                    used |= node.writes - e.exclude
+            if node.kind == 'input' or unknown:
+                live.add(node.id)
+            elif used:
+                live.add(node.id)
+                if (
+                    node.writes is not None and node.writes - used
+                    and node.stage.mode != 'merge'
+                ):
+                    narrowed[node.id] = node.writes - used
+        nodes = []
+        for node in self.nodes:
+            if node.id not in live:
+                continue
+            drop = narrowed.get(node.id)
+            if drop is not None:
+                node = dataclasses.replace(
+                    node,
+                    stage=dataclasses.replace(
+                        node.stage, f=DropOutputs(node.stage.f, drop)
+                    ),
+                    writes=node.writes - drop,
+                )
+            nodes.append(node)
+        graph = PipelineGraph(tuple(nodes), tuple(
+            e for e in edges if e.src in live and e.dst in live
+        ))
+        report = EliminationReport(
+            removed=tuple(
+                node for node in self.nodes if node.id not in live
+            ),
+            narrowed=tuple(
+                (node, frozenset(narrowed[node.id]))
+                for node in self.nodes if node.id in narrowed
+            ),
+        )
+        return graph, report
+
+    def __str__(self):
+        lines = []
+        for node in self.nodes:
+            preds = ', '.join(str(p) for p in self.predecessors(node.id))
+            lines.append(f'[{node.id}] {node}' + (
+                f' <- {preds}' if preds else ''
+            ))
+            for i, branch in enumerate(node.branches):
+                lines.append(f'    branch {i}:')
+                lines.extend(
+                    f'        {line}' for line in str(branch).split('\n')
+                )
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'PipelineGraph({len(self.nodes)} nodes)'
+
+
+@dataclasses.dataclass(frozen=True)
+class DropOutputs:
+    """
+    Stage that calls ``f`` and drops the outputs named in ``drop``.
+    """
+
+    f: Callable
+    drop: FrozenSet[str]
+
+    @property
+    def name(self) -> str:
+        return label(self.f)
+
+    def __call__(self, **params):
+        return {
+            k: v for k, v in self.f(**params).items()
+            if k not in self.drop
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class EliminationReport:
+    """
+    Stages removed by ``PipelineGraph.eliminate_dead_outputs``, and the
+    outputs dropped from each stage that was kept.
+    """
+
+    removed: Tuple[GraphNode, ...]
+    narrowed: Tuple[Tuple[GraphNode, FrozenSet[str]], ...]
+
+    def __str__(self):
+        lines = [f'removed [{node.id}] {node.name}' for node in self.removed]
+        lines += [
+            f'dropped {", ".join(sorted(drop))} from [{node.id}] {node.name}'
+            for node, drop in self.narrowed
+        ]
+        return '\n'.join(lines) or 'nothing eliminated'
+
+
+def _restrict(edge: GraphEdge, outputs: FrozenSet[str]) -> GraphEdge:
+    if edge.params is None:
+        return dataclasses.replace(
+            edge, params=frozenset(
+                name for name in outputs if name not in edge.exclude
+            ), exclude=frozenset(),
+        )
+    return dataclasses.replace(edge, params=edge.params & outputs)
+
+
+def _node_key(node: GraphNode) -> Optional[Tuple]:
+    # Nodes with equal keys execute the same stage.
+    if node.stage is None or node.kind in ('input', 'output'):
+        return None
+    stage = node.stage
+    try:
+        fixed = structural_key(stage.fixed)
+        hash(fixed)
+    except TypeError:
+        return None
+    return (
+        node.kind,
+        stage.mode,
+        None if stage.f is None else function_key(stage.f),
+        fixed,
+    )
+
+
+def _merge_edges(edges: Iterable[GraphEdge]) -> Tuple[GraphEdge, ...]:
+    # Combine all edges between the same pair of nodes.
+    merged: Dict[Tuple[int, int], Tuple[Set[str], Optional[Set[str]]]] = {}
+    for e in edges:
+        names, exclude = merged.setdefault((e.src, e.dst), (set(), None))
+        if e.params is None:
+            exclude = set(e.exclude) if exclude is None else (
+                exclude & e.exclude
+            )
+            merged[(e.src, e.dst)] = (names, exclude)
+        else:
+            names |= e.params
+    out = []
+    for (src, dst), (names, exclude) in merged.items():
+        if exclude is None:
+            out.append(GraphEdge(src, dst, frozenset(names)))
+        else:
+            out.append(GraphEdge(
+                src, dst, None, frozenset(exclude - names)
+            ))
+    return tuple(out)
+
+
+def _signature_params(f: Callable) -> Optional[FrozenSet[str]]:
+    try:
+        parameters = inspect.signature(f).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    if any(p.kind == p.VAR_KEYWORD for p in parameters):
+        return None
+    return frozenset(
+        p.name for p in parameters
+        if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+    )
+
+
+def stage_reads(f: Optional[Callable]) -> Optional[FrozenSet[str]]:
+    """
+    The parameters that a stage callable can accept, or None if it accepts
+    any. Signatures spliced by ``splice_on`` are respected.
+    """
+    if f is None:
+        return frozenset()
+    if isinstance(f, Primitive):
+        return None if f._variadic else f._params
+    if isinstance(f, CallableContainer):
+        reads = stage_reads(f.f)
+        if reads is None or f.pparams:
+            return reads
+        return reads | frozenset(k for k, _ in f.__conditions__ or ())
+    if isinstance(f, (Pipeline, Composition)):
+        return None
+    return _signature_params(f)
+
+
+def stage_writes(f: Optional[Callable]) -> Optional[FrozenSet[str]]:
+    """
+    The parameters that a stage callable outputs, or None if unknown. Only
+    primitives declare their outputs.
+    """
+    if isinstance(f, CallableContainer) and not f.pparams:
+        f = f.f
+    if isinstance(f, Primitive) and f.output is not None:
+        return frozenset(f.output)
+    return None
+
+
+def _forwards(f: Optional[Callable]) -> bool:
+    if isinstance(f, CallableContainer) and not f.pparams:
+        f = f.f
+    return isinstance(f, Primitive) and f.forward_unused
+
+
+def _consumed(f: Callable) -> FrozenSet[str]:
+    # Parameters that a forwarding primitive does not pass through; all
+    # others, including any that a variadic primitive accepts, are.
+    if isinstance(f, CallableContainer):
+        f = f.f
+    return f._params
+
+
+@dataclasses.dataclass
+class _Item:
+    # A stage of a pipeline under extraction.
+    stage: CompiledStage
+    kind: str = 'stage'
+    branches: Tuple[PipelineGraph, ...] = ()
+    meta: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+
+def _initial_items(f: Callable) -> List[_Item]:
+    if isinstance(f, Composition):
+        f = f.compile()
+    if isinstance(f, Pipeline):
+        return [_Item(stage) for stage in f.stages]
+    return [_Item(CompiledStage(f))]
+
+
+def _apply(
+    items: List[_Item],
+    transforms: Sequence[Callable],
+    compositor: Callable,
+) -> List[_Item]:
+    # Mirrors ``compile_chain``, keeping the structure of flows.
+    items = list(items)
+    for transform in transforms:
+        stage = getattr(transform, '__stage__', None)
+        if stage is None:
+            if (
+                len(items) == 1 and items[0].stage.mode == 'call'
+                and not items[0].stage.fixed
+            ):
+                compiled = items[0].stage.f
+            else:
+                compiled = Pipeline(tuple(item.stage for item in items))
+            flow = getattr(transform, '__flow__', None)
+            branches = ()
+            meta = {}
+            if flow is not None:
+                branches = tuple(
+                    _build(_apply(
+                        items, _chain_transforms([c]), direct_compositor
+                    ))
+                    for c in flow['chains']
+                )
+                meta = {
+                    k: v for k, v in flow.items()
+                    if k not in ('kind', 'chains')
+                }
+            items = [_Item(
+                CompiledStage(transform(compiled, compositor=compositor)),
+                kind='opaque' if flow is None else flow['kind'],
+                branches=branches,
+                meta=meta,
+            )]
+        elif stage.mode == 'update':
+            items.insert(0, _Item(stage))
+        else:
+            items.append(_Item(stage))
+    return items
+
+
+def _build(items: Sequence[_Item]) -> PipelineGraph:
+    # Track, for each parameter, the nodes that may have written it last,
+    # and the nodes that may have written any other parameter (with the
+    # parameters that they cannot supply).
+    nodes = [GraphNode(0, 'input')]
+    edges = []
+    writers: Dict[str, Tuple[int, ...]] = {}
+    rest: Tuple[Tuple[int, FrozenSet[str]], ...] = ((0, frozenset()),)
+
+    def connect(id: int, reads: Optional[FrozenSet[str]]) -> None:
+        if reads is None:
+            for name, srcs in writers.items():
+                for src in srcs:
+                    edges.append(GraphEdge(src, id, frozenset((name,))))
+            for src, exclude in rest:
+                edges.append(GraphEdge(
+                    src, id, None, exclude | frozenset(writers)
+                ))
+            return
+        for name in reads:
+            srcs = writers.get(name)
+            if srcs is None:
+                srcs = tuple(src for src, ex in rest if name not in ex)
+            for src in srcs:
+                edges.append(GraphEdge(src, id, frozenset((name,))))
+
+    for id, item in enumerate(items, 1):
+        stage = item.stage
+        if item.kind == 'stage':
+            reads = stage_reads(stage.f) if stage.mode != 'inject' else (
+                frozenset()
+            )
+            writes = (
+                frozenset(stage.fixed) if stage.mode == 'merge'
+                else stage_writes(stage.f)
+            )
+            forwards = stage.mode == 'call' and _forwards(stage.f)
+        else:
+            reads = writes = None
+            forwards = False
+        nodes.append(GraphNode(
+            id, item.kind, stage, reads, writes, forwards,
+            item.branches, item.meta,
+        ))
+        consumed = passed = frozenset()
+        if forwards:
+            consumed = _consumed(stage.f)
+            # Fixed parameters that are not consumed are passed through
+            # as well, unless a value is passed in for them.
+            passed = frozenset(stage.fixed) - consumed
+        connect(id, reads if reads is None else reads | passed)
+        if stage.mode == 'call':
+            if forwards:
+                # Parameters that are not consumed bypass the stage, but
+                # any that it outputs override them.
+                writers = {
+                    name: srcs for name, srcs in writers.items()
+                    if name not in consumed
+                }
+                rest = tuple((src, ex | consumed) for src, ex in rest)
+                if writes is None:
+                    writers = {
+                        name: srcs + (id,) for name, srcs in writers.items()
+                    }
+                    rest = rest + ((id, frozenset()),)
+                else:
+                    for name in passed:
+                        writers[name] = writers.get(name, tuple(
+                            src for src, ex in rest if name not in ex
+                        )) + (id,)
+                    writers.update({name: (id,) for name in writes})
+            elif writes is None:
+                writers, rest = {}, ((id, frozenset()),)
+            else:
+                writers, rest = {name: (id,) for name in writes}, ()
+        elif stage.mode == 'merge':
+            # Merged parameters only fill in missing values.
+            for name in writes:
+                writers[name] = (id,) + writers.get(name, tuple(
+                    src for src, ex in rest if name not in ex
+                ))
+        elif writes is None:
+            writers = {
+                name: srcs + (id,) for name, srcs in writers.items()
+            }
+            rest = rest + ((id, frozenset()),)
+        else:
+            writers.update({name: (id,) for name in writes})
+    output = len(nodes)
+    nodes.append(GraphNode(output, 'output'))
+    connect(output, None)
+    return PipelineGraph(tuple(nodes), _merge_edges(edges))
+
+
+def extract_graph(
+    f: Callable,
+    ichain: Optional[Callable] = None,
+    ochain: Optional[Callable] = None,
+    compositor: Callable = direct_compositor,
+) -> PipelineGraph:
+    """
+    Extract the data flow graph of ``iochain(f, ichain, ochain)``.
+
+    Stages are recovered as by ``compile_chain``: ``istage`` and ``ostage``
+    transforms (and the stages of ``Composition`` and ``Pipeline``
+    objects) become separate nodes, while any other transform becomes a
+    single node that subsumes all stages before it. The parameters that
+    each stage reads are taken from its signature (including any signature
+    spliced by ``splice_on``); its outputs are known only if it is a
+    ``Primitive`` with a declared ``output``. With a compositor other than
+    ``direct_compositor``, the whole chain is a single opaque node.
+    """
+    if compositor is not direct_compositor:
+        return _build([_Item(
+            CompiledStage(iochain(f, ichain, ochain, compositor=compositor)),
+            kind='opaque',
+        )])
+    transforms = _chain_transforms([t for t in (ichain, ochain) if t])
+    return _build(_apply(_initial_items(f), transforms, compositor))
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Instrumentation
+~~~~~~~~~~~~~~~
+Opt-in tracing and timing of primitive, container and compositor calls.
+
+Instrumented calls are reported as ``CallEvent`` objects to every hook in a
+global registry. While the registry is empty, instrumented call sites only
+test a module-level flag, and compositors return uninstrumented closures.
+
+Events are nested into spans: ``split_chain`` branches, mapped replicates
+and ``join`` reductions each open a span, and the calls made within it are
+its children, including calls made on thread or process pools. ``profile``
+aggregates events into a flat table, and ``trace`` records them for export
+in the Chrome trace event format.
+"""
+import dataclasses
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from .memo import sizeof
+
+# True while at least one hook is registered. Read by instrumented call
+# sites on every call, so it is a plain module attribute.
+ACTIVE = False
+
+_hooks: List[Callable[['CallEvent'], None]] = []
+_hooks_lock = threading.Lock()
+_local = threading.local()
+# Id of the innermost open span in the current context.
+_current: ContextVar[Optional[str]] = ContextVar(
+    'conveyant_span', default=None
+)
+_ids = count()
+
+
+Kind = Literal[
+    'primitive', 'container', 'compositor', 'branch', 'replicate', 'join'
+]
+
+
+@dataclasses.dataclass
+class CallEvent:
+    """
+    A completed instrumented call or span.
+
+    Times are in seconds. ``wall`` and ``cpu`` include time spent in nested
+    instrumented calls; ``self_wall`` and ``self_cpu`` exclude it. CPU time
+    is that of the calling thread. ``params`` and ``result`` are the call's
+    keyword arguments and return value (None if the call raised
+    ``error``); hooks should not retain them.
+
+    ``start`` is a ``time.perf_counter`` reading. Each event has an ``id``
+    unique across processes, the ``parent`` id of the innermost enclosing
+    event (which may have run on another thread or process), and the
+    ``pid`` and ``tid`` where it ran. ``args`` annotates spans, for
+    instance with a replicate index.
+    """
+
+    kind: Kind
+    name: str
+    wall: float
+    cpu: float
+    self_wall: float
+    self_cpu: float
+    params: Mapping[str, Any]
+    result: Any = None
+    error: Optional[BaseException] = None
+    start: float = 0.
+    id: str = ''
+    parent: Optional[str] = None
+    pid: int = 0
+    tid: int = 0
+    args: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+
+def _reset_hooks() -> None:
+    # A forked process inherits the hooks of its parent, but events
+    # reported to them never reach the parent. Worker processes report
+    # events through ``Spanned`` instead.
+    global ACTIVE, _hooks_lock
+    _hooks.clear()
+    _hooks_lock = threading.Lock()
+    ACTIVE = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_hooks)
+
+
+def add_hook(hook: Callable[[CallEvent], None]) -> Callable:
+    global ACTIVE
+    with _hooks_lock:
+        _hooks.append(hook)
+        ACTIVE = True
+    return hook
+
+
+def remove_hook(hook: Callable[[CallEvent], None]) -> None:
+    global ACTIVE
+    with _hooks_lock:
+        _hooks.remove(hook)
+        ACTIVE = bool(_hooks)
+
+
+def emit(event: CallEvent) -> None:
+    for hook in tuple(_hooks):
+        hook(event)
+
+
+def label(f: Any) -> str:
+    """
+    Human-readable name of a stage: the name of a ``Primitive``, the
+    wrapped callable of a container, or the qualified name of a function
+    (without ``<locals>`` markers, so that closures are named after the
+    transforms that create them).
+    """
+    name = getattr(f, 'name', None)
+    if isinstance(name, str):
+        return name
+    inner = getattr(f, 'f', None)
+    if inner is not None and callable(inner):
+        return f'{type(f).__name__}({label(inner)})'
+    qualname = getattr(f, '__qualname__', None)
+    if isinstance(qualname, str):
+        return qualname.replace('<locals>.', '')
+    return type(f).__name__
+
+
+class _Frame:
+    __slots__ = ('child_wall', 'child_cpu')
+
+    def __init__(self):
+        self.child_wall = 0.
+        self.child_cpu = 0.
+
+
+class _Span:
+    """
+    Time the enclosed block and report it to all hooks on exit.
+    """
+
+    __slots__ = (
+        'kind', 'name', 'params', 'parent', 'args', 'result', 'id',
+        '_frame', '_token', '_wall', '_cpu',
+    )
+
+    def __init__(
+        self,
+        kind: Kind,
+        name: str,
+        params: Mapping[str, Any],
+        parent: Optional[str] = None,
+        args: Optional[Mapping[str, Any]] = None,
+    ):
+        self.kind = kind
+        self.name = name
+        self.params = params
+        self.parent = parent
+        self.args = args or {}
+        self.result = None
+
+    def __enter__(self) -> '_Span':
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        if self.parent is None:
+            self.parent = _current.get()
+        self.id = f'{os.getpid()}.{next(_ids)}'
+        self._token = _current.set(self.id)
+        self._frame = _Frame()
+        stack.append(self._frame)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_wall += wall
+            stack[-1].child_cpu += cpu
+        _current.reset(self._token)
+        emit(CallEvent(
+            kind=self.kind,
+            name=self.name,
+            wall=wall,
+            cpu=cpu,
+            self_wall=wall - self._frame.child_wall,
+            self_cpu=cpu - self._frame.child_cpu,
+            params=self.params,
+            result=self.result,
+            error=exc,
+            start=self._wall,
+            id=self.id,
+            parent=self.parent,
+            pid=os.getpid(),
+            tid=threading.get_native_id(),
+            args=self.args,
+        ))
+
+
+def span(kind: Kind, name: str, **args) -> _Span:
+    """
+    Context manager recording the enclosed block as an event of the
+    specified kind, annotated with ``args``.
+    """
+    return _Span(kind, name, {}, args=args)
+
+
+def record(
+    kind: Kind,
+    name: str,
+    f: Callable,
+    params: Mapping[str, Any],
+    pparams: Sequence = (),
+    parent: Optional[str] = None,
+    args: Optional[Mapping[str, Any]] = None,
+) -> Any:
+    """
+    Call ``f(*pparams, **params)`` and report the call to all hooks.
+    """
+    with _Span(kind, name, params, parent=parent, args=args) as s:
+        s.result = f(*pparams, **params)
+    return s.result
+
+
+def instrumented(
+    kind: Kind,
+    name: str,
+    f: Callable,
+) -> Callable:
+    """
+    Wrap ``f`` so that its calls are recorded while instrumentation is
+    active.
+    """
+    def f_instrumented(**params):
+        if not ACTIVE:
+            return f(**params)
+        return record(kind, name, f, params)
+    return f_instrumented
+
+
+@dataclasses.dataclass(frozen=True)
+class SpanContext:
+    kind: Kind
+    name: str
+    parent: Optional[str]
+    pid: int
+    args: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+
+def context(kind: Kind, name: str, **args) -> SpanContext:
+    """
+    Capture the current span, so that a span of the specified kind can be
+    opened as its child on another thread or in another process.
+    """
+    return SpanContext(kind, name, _current.get(), os.getpid(), args)
+
+
+@dataclasses.dataclass(frozen=True)
+class _Traced:
+    result: Any
+    events: Sequence[CallEvent]
+
+
+@dataclasses.dataclass(frozen=True)
+class Spanned:
+    """
+    Callable that evaluates ``f`` within a span opened as a child of the
+    span captured in ``context``. Like ``f``, it can be submitted to a
+    thread or process pool. In a worker process, which has no hooks of its
+    own, the events of the call are collected and returned to the parent
+    with the result; ``collect`` unwraps the result and reports them there.
+    Events of calls that fail in a worker process are lost.
+    """
+
+    f: Callable
+    context: SpanContext
+
+    def __call__(self, **params):
+        ctx = self.context
+        if os.getpid() == ctx.pid:
+            return record(
+                ctx.kind, ctx.name, self.f, params,
+                parent=ctx.parent, args=ctx.args,
+            )
+        events = []
+        hook = add_hook(events.append)
+        try:
+            result = record(
+                ctx.kind, ctx.name, self.f, params,
+                parent=ctx.parent, args=ctx.args,
+            )
+        finally:
+            remove_hook(hook)
+        return _Traced(result, tuple(_detach(e) for e in events))
+
+
+def _detach(event: CallEvent) -> CallEvent:
+    # Arguments, results and exceptions (with their tracebacks) are not
+    # retained or sent back from worker processes; only a description of
+    # the exception is kept.
+    args = event.args
+    if event.error is not None:
+        args = {**args, 'error': repr(event.error)}
+    return dataclasses.replace(
+        event, params={}, result=None, error=None, args=args
+    )
+
+
+def collect(result: Any) -> Any:
+    """
+    Report any events returned from a worker process along with ``result``
+    and return the bare result.
+    """
+    if isinstance(result, _Traced):
+        for event in result.events:
+            emit(event)
+        return result.result
+    return result
+
+
+@dataclasses.dataclass
+class ProfileRow:
+    kind: str
+    name: str
+    calls: int = 0
+    errors: int = 0
+    wall: float = 0.
+    self_wall: float = 0.
+    cpu: float = 0.
+    self_cpu: float = 0.
+    param_bytes: int = 0
+    result_bytes: int = 0
+
+
+class Profile:
+    """
+    Flat profile of instrumented calls, aggregated by kind and name.
+
+    If ``sizes`` is True, the approximate sizes (see ``memo.sizeof``) of
+    the arguments and results of every call are also accumulated, at some
+    cost. Calls made in worker processes are not recorded.
+    """
+
+    COLUMNS = (
+        'kind', 'name', 'calls', 'errors', 'wall', 'self_wall', 'cpu',
+        'self_cpu', 'param_bytes', 'result_bytes',
+    )
+
+    def __init__(self, sizes: bool = False):
+        self.sizes = sizes
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: CallEvent) -> None:
+        if self.sizes:
+            param_bytes = sizeof(event.params)
+            result_bytes = sizeof(event.result)
+        with self._lock:
+            row = self.rows.get((event.kind, event.name))
+            if row is None:
+                row = self.rows[(event.kind, event.name)] = ProfileRow(
+                    event.kind, event.name
+                )
+            row.calls += 1
+            row.errors += event.error is not None
+            row.wall += event.wall
+            row.self_wall += event.self_wall
+            row.cpu += event.cpu
+            row.self_cpu += event.self_cpu
+            if self.sizes:
+                row.param_bytes += param_bytes
+                row.result_bytes += result_bytes
+
+    def table(self, sort: str = 'self_wall') -> List[ProfileRow]:
+        with self._lock:
+            rows = list(self.rows.values())
+        return sorted(rows, key=lambda r: getattr(r, sort), reverse=True)
+
+    def format(self, sort: str = 'self_wall', limit: Optional[int] = None):
+        rows = self.table(sort=sort)[:limit]
+        width = max([len(r.name) for r in rows] + [4])
+        lines = [
+            f'{"kind":<11} {"name":<{width}} {"calls":>8} {"wall":>10} '
+            f'{"self_wall":>10} {"cpu":>10} {"self_cpu":>10}'
+            + (f' {"param_bytes":>12} {"result_bytes":>12}'
+               if self.sizes else '')
+        ]
+        for r in rows:
+            lines.append(
+                f'{r.kind:<11} {r.name:<{width}} {r.calls:>8d} '
+                f'{r.wall:>10.6f} {r.self_wall:>10.6f} {r.cpu:>10.6f} '
+                f'{r.self_cpu:>10.6f}'
+                + (f' {r.param_bytes:>12d} {r.result_bytes:>12d}'
+                   if self.sizes else '')
+            )
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+@contextmanager
+def profile(sizes: bool = False) -> Iterator[Profile]:
+    """
+    Record a flat ``Profile`` of all instrumented calls made within the
+    context.
+    """
+    hook = add_hook(Profile(sizes=sizes))
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+class Trace:
+    """
+    Record of all instrumented events, exportable in the Chrome trace
+    event format (viewable in ``chrome://tracing`` or Perfetto).
+
+    Events are recorded without their ``params`` and ``result`` (and with
+    ``error`` replaced by its description in ``args``), so that the trace
+    does not keep the values passed through the pipeline alive.
+
+    Each event becomes a complete (``'X'``) event on the thread and process
+    where it ran. Events whose parent ran on another thread or process are
+    additionally linked to it by a flow arrow. Timestamps are
+    ``time.perf_counter`` readings, which are comparable across processes
+    on the platforms where its clock is system-wide (e.g., Linux).
+    """
+
+    def __init__(self):
+        self.events: List[CallEvent] = []
+
+    def __call__(self, event: CallEvent) -> None:
+        self.events.append(_detach(event))
+
+    def to_chrome(self) -> Mapping[str, Any]:
+        events = list(self.events)
+        by_id = {e.id: e for e in events}
+        trace_events = []
+        for e in events:
+            ts = e.start * 1e6
+            args = {**e.args, 'id': e.id, 'parent': e.parent}
+            trace_events.append({
+                'name': e.name,
+                'cat': e.kind,
+                'ph': 'X',
+                'ts': ts,
+                'dur': e.wall * 1e6,
+                'pid': e.pid,
+                'tid': e.tid,
+                'args': args,
+            })
+            parent = by_id.get(e.parent)
+            if parent is not None and (
+                (parent.pid, parent.tid) != (e.pid, e.tid)
+            ):
+                trace_events.append({
+                    'name': 'spawn',
+                    'cat': 'flow',
+                    'ph': 's',
+                    'id': e.id,
+                    'ts': ts,
+                    'pid': parent.pid,
+                    'tid': parent.tid,
+                })
+                trace_events.append({
+                    'name': 'spawn',
+                    'cat': 'flow',
+                    'ph': 'f',
+                    'bp': 'e',
+                    'id': e.id,
+                    'ts': ts,
+                    'pid': e.pid,
+                    'tid': e.tid,
+                })
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path: Union[str, os.PathLike]) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f, default=repr)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """
+    Record a ``Trace`` of all instrumented calls and spans made within the
+    context.
+    """
+    hook = add_hook(Trace())
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
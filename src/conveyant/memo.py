@@ -0,0 +1,667 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Memoisation
+~~~~~~~~~~~
+Keying of function calls for deduplication and caching.
+"""
+import dataclasses
+import hashlib
+import math
+import os
+import pickle
+import shutil
+import sys
+import threading
+import types
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import (
+    Any,
+    FrozenSet,
+    Hashable,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from . import config
+
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+def _is_array(value: Any) -> bool:
+    # Duck-typed so that NumPy is never imported here.
+    return (
+        hasattr(value, '__array_interface__')
+        and hasattr(value, 'dtype')
+        and hasattr(value, 'nbytes')
+    )
+
+
+def _digest(buffer: Any) -> str:
+    return hashlib.blake2b(buffer, digest_size=16).hexdigest()
+
+
+def _is_identity_key(key: tuple) -> bool:
+    return (
+        len(key) == 3 and isinstance(key[0], str) and key[0] == '__id__'
+        and isinstance(key[1], type) and isinstance(key[2], int)
+    )
+
+
+def _identity_key(value: Any, identity: bool) -> Hashable:
+    if not identity:
+        raise TypeError(
+            f'Cannot construct a structural key for a value of type '
+            f'{type(value).__name__} without keying by identity'
+        )
+    return ('__id__', type(value), id(value))
+
+
+def value_key(
+    value: Any,
+    digest_limit: Optional[int] = None,
+    identity: bool = True,
+    memo: Optional[dict] = None,
+) -> Hashable:
+    """
+    Construct a hashable key for a single value.
+
+    * Arrays and byte buffers are keyed by a digest of their contents, or by
+      identity if they are larger than ``digest_limit`` bytes.
+    * Hashable values are keyed by their type and value, so that ``1``,
+      ``1.0`` and ``True`` are kept distinct.
+    * Unhashable tuples, lists, dicts and sets are keyed recursively.
+    * Any other unhashable value is keyed by identity. Identity keys are
+      valid only while the value is alive; if ``identity`` is False, a
+      ``TypeError`` is raised instead.
+
+    If a ``memo`` dict is given, the keys of arrays and buffers are stored
+    in it by identity (together with a reference to the value), so that an
+    array that is keyed again is not digested again. Values must not be
+    mutated while the memo is in use.
+    """
+    if memo is not None and (
+        isinstance(value, BUFFER_TYPES) or _is_array(value)
+    ):
+        entry = memo.get(id(value))
+        if entry is None:
+            entry = memo[id(value)] = (
+                value, value_key(value, digest_limit, identity)
+            )
+        return entry[1]
+    if isinstance(value, BUFFER_TYPES):
+        nbytes = memoryview(value).nbytes
+        if digest_limit is not None and nbytes > digest_limit:
+            return _identity_key(value, identity)
+        try:
+            digest = _digest(value)
+        except (BufferError, TypeError, ValueError):
+            digest = _digest(memoryview(value).tobytes())
+        return ('__buffer__', type(value), digest)
+    if _is_array(value):
+        if value.dtype.hasobject or (
+            digest_limit is not None and value.nbytes > digest_limit
+        ):
+            return _identity_key(value, identity)
+        try:
+            digest = _digest(memoryview(value))
+        except (BufferError, TypeError, ValueError):
+            # Not C-contiguous
+            digest = _digest(value.tobytes())
+        return (
+            '__array__', type(value), value.dtype.str, value.shape, digest
+        )
+    try:
+        hash(value)
+    except TypeError:
+        pass
+    else:
+        return (type(value), value)
+    if isinstance(value, (tuple, list)):
+        return (type(value), tuple(
+            value_key(v, digest_limit, identity, memo) for v in value
+        ))
+    if isinstance(value, dict):
+        return (type(value), tuple(
+            (value_key(k, digest_limit, identity, memo),
+             value_key(v, digest_limit, identity, memo))
+            for k, v in value.items()
+        ))
+    if isinstance(value, (set, frozenset)):
+        return (type(value), frozenset(
+            value_key(v, digest_limit, identity, memo) for v in value
+        ))
+    return _identity_key(value, identity)
+
+
+def structural_key(
+    params: Mapping[str, Any],
+    digest_limit: Optional[int] = None,
+    identity: bool = True,
+    memo: Optional[dict] = None,
+) -> Hashable:
+    """
+    Construct a hashable key for a parameter mapping, independent of the
+    order of its keys. See ``value_key`` for how values are keyed (and for
+    ``memo``). If ``digest_limit`` is None, the module setting is used.
+    """
+    if digest_limit is None:
+        digest_limit = config.digest_limit
+    return tuple(sorted(
+        (k, value_key(
+            v, digest_limit=digest_limit, identity=identity, memo=memo
+        ))
+        for k, v in params.items()
+    ))
+
+
+def content_key(params: Mapping[str, Any]) -> Hashable:
+    """
+    Construct a structural key that is valid across calls: buffers of any
+    size are keyed by a digest of their contents, and values that cannot be
+    keyed without resorting to identity raise a ``TypeError``.
+    """
+    return structural_key(params, digest_limit=math.inf, identity=False)
+
+
+def function_key(f: callable) -> Hashable:
+    """
+    Construct a key identifying a callable. Primitives are identified by
+    their wrapped function, name and output specification.
+    """
+    if hasattr(f, '_cache_identity'):
+        return f._cache_identity
+    try:
+        hash(f)
+    except TypeError:
+        return _identity_key(f, identity=True)
+    return f
+
+
+def repr_key(params: Mapping[str, Any]) -> Hashable:
+    """
+    Key a parameter mapping by the hash of its string representation.
+
+    This is the legacy behaviour of the input-mapping compositor. It is
+    slow for large arrays and conflates distinct values that share a
+    representation (such as truncated arrays).
+    """
+    return hash(str(params))
+
+
+def get_key_function(
+    key: Union[Literal['structural', 'repr'], callable, None],
+) -> Optional[callable]:
+    if key is None or callable(key):
+        return key
+    elif key == 'structural':
+        return structural_key
+    elif key == 'repr':
+        return repr_key
+    raise ValueError(f'Unrecognized key type: {key}')
+
+
+def sizeof(value: Any, _seen: Optional[set] = None) -> int:
+    """
+    Approximate the memory footprint of a value in bytes. Arrays and
+    buffers count their data; containers count their elements.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if _is_array(value):
+        return value.nbytes
+    if isinstance(value, memoryview):
+        return sys.getsizeof(value) + value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(
+            sizeof(k, _seen) + sizeof(v, _seen) for k, v in value.items()
+        )
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(sizeof(v, _seen) for v in value)
+    return size
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bypasses: int = 0
+
+
+class Cache(ABC):
+    """
+    Abstract base class for caches of call results.
+
+    Subclasses implement ``get``, returning a (hit, value) pair, and
+    ``put``. Calls are keyed by the identity of the function (see
+    ``function_key``) and by ``key`` applied to the parameters; calls
+    whose parameters cannot be keyed bypass the cache.
+    """
+
+    key: callable
+    stats: CacheStats
+
+    def make_key(
+        self,
+        f: callable,
+        params: Mapping[str, Any],
+        identity: Optional[Hashable] = None,
+    ) -> Hashable:
+        return (
+            function_key(f) if identity is None else identity,
+            self.key(params),
+        )
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Return a (hit, value) pair for ``key``, counting the hit or miss.
+        """
+
+    @abstractmethod
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store ``value`` under ``key``.
+        """
+
+    def call(
+        self,
+        f: callable,
+        params: Mapping[str, Any],
+        identity: Optional[Hashable] = None,
+    ) -> Any:
+        """
+        Call ``f`` with ``params``, returning a cached result if one exists
+        and caching the result otherwise. ``identity`` overrides the key
+        identifying ``f``.
+        """
+        try:
+            key = self.make_key(f, params, identity=identity)
+        except TypeError:
+            with self._lock:
+                self.stats.bypasses += 1
+            return f(**params)
+        hit, value = self.get(key)
+        if hit:
+            return value
+        value = f(**params)
+        self.put(key, value)
+        return value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class LRUCache(Cache):
+    """
+    In-memory cache of call results with least-recently-used eviction.
+
+    The cache holds at most ``max_entries`` results and at most
+    ``max_bytes`` bytes of results, as approximated by ``sizeof``; either
+    bound may be None. Parameters are keyed by ``content_key`` by default.
+    Cached results are returned by reference and must not be mutated.
+
+    Entries are not pickled: a copy of the cache sent to a worker process
+    (for instance, with a ``Primitive`` that uses it) starts empty, and
+    entries that it adds are not returned to the original.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = 128,
+        max_bytes: Optional[int] = None,
+        key: callable = content_key,
+        sizeof: callable = sizeof,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.key = key
+        self.sizeof = sizeof
+        self.stats = CacheStats()
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return True, value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while (
+                (
+                    self.max_entries is not None
+                    and len(self._entries) > self.max_entries
+                ) or (
+                    self.max_bytes is not None
+                    and self.nbytes > self.max_bytes
+                )
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_entries'] = OrderedDict()
+        state['nbytes'] = 0
+        state['stats'] = CacheStats()
+        return state
+
+
+def stable_digest(key: Hashable) -> str:
+    """
+    Digest a key into a string that is stable across processes. Raises a
+    ``TypeError`` if the key cannot be serialised.
+    """
+    try:
+        data = pickle.dumps(_canonical(key), protocol=4)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        raise TypeError(f'Cannot serialise cache key: {e}') from e
+    return hashlib.sha256(data).hexdigest()
+
+
+def _canonical(key: Any, _seen: FrozenSet[int] = frozenset()) -> Any:
+    # Sets are pickled in iteration order, which depends on the
+    # (randomised) hashes of their elements.
+    if isinstance(key, tuple):
+        if _is_identity_key(key):
+            # Addresses are reused across processes, so an identity key
+            # could match a different object in a later run.
+            raise TypeError(
+                f'Cannot serialise a key by identity of {key[1].__name__}'
+            )
+        return tuple(_canonical(k, _seen) for k in key)
+    if isinstance(key, (set, frozenset)):
+        return ('__set__', tuple(sorted(
+            (_canonical(k, _seen) for k in key),
+            key=lambda k: pickle.dumps(k, protocol=4),
+        )))
+    # Functions are pickled by qualified name only, so their code is
+    # digested too; otherwise, entries would outlive changes to the code.
+    if isinstance(key, types.MethodType):
+        return ('__method__', key, _canonical(key.__func__, _seen))
+    if isinstance(key, types.FunctionType):
+        if id(key) in _seen:
+            return ('__function__', key)
+        return ('__function__', key, code_digest(key, _seen | {id(key)}))
+    return key
+
+
+def _code_state(code: types.CodeType) -> tuple:
+    return (
+        code.co_code,
+        code.co_names,
+        code.co_varnames,
+        tuple(
+            _code_state(c) if isinstance(c, types.CodeType) else c
+            for c in code.co_consts
+        ),
+    )
+
+
+def _cell_key(cell: types.CellType) -> Hashable:
+    try:
+        value = cell.cell_contents
+    except ValueError:
+        # Empty cell
+        return ('__empty__',)
+    return value_key(value, digest_limit=math.inf, identity=False)
+
+
+def code_digest(
+    f: types.FunctionType,
+    _seen: FrozenSet[int] = frozenset(),
+) -> str:
+    """
+    Digest the implementation of a function: its bytecode, constants
+    (including the code of nested functions), referenced names, defaults
+    and the values captured in its closure. Raises a ``TypeError`` if a
+    default or closure value cannot be keyed by content. Changes to the
+    globals that the function reads, including other functions that it
+    calls, are not reflected in the digest.
+    """
+    state = (
+        _code_state(f.__code__),
+        value_key(f.__defaults__, digest_limit=math.inf, identity=False),
+        value_key(f.__kwdefaults__, digest_limit=math.inf, identity=False),
+        tuple(_cell_key(cell) for cell in f.__closure__ or ()),
+    )
+    try:
+        data = pickle.dumps(_canonical(state, _seen), protocol=4)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        raise TypeError(f'Cannot serialise function state: {e}') from e
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclasses.dataclass(frozen=True)
+class _ArrayRef:
+    index: int
+
+
+class DiskCache(Cache):
+    """
+    Persistent cache of call results, shared by processes on one machine.
+
+    Each entry is a directory under ``directory`` named by a digest of its
+    key (see ``stable_digest``), so that keys must be serialisable and
+    functions must be importable (or identified by name). Functions are
+    keyed by their qualified name and by a digest of their code (see
+    ``code_digest``), so that entries are not returned once the body of
+    the function changes. Changes that the digest does not reflect (such
+    as changes to the functions that it calls, or to a function cached
+    under a ``name``) require the cache to be cleared by hand. Calls whose
+    key would depend on the identity of an object (see ``value_key``)
+    bypass the cache, as identities are not stable across processes.
+
+    Results are pickled, except that NumPy arrays found in a result (or in
+    its dicts, lists and tuples) are stored as ``.npy`` files; with
+    ``mmap`` they are loaded as read-only memory maps, so that hits do not
+    copy array data.
+
+    Entries are written to a temporary directory and renamed into place, so
+    that readers never see partial entries and concurrent writers of the
+    same entry do not conflict. Recency is tracked by entry modification
+    time. When the cache exceeds ``max_bytes`` bytes on disk or
+    ``max_entries`` entries, the least recently used entries are evicted.
+    Statistics are counted for the current process only.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        key: callable = content_key,
+        mmap: bool = True,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.key = key
+        self.mmap = mmap
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def make_key(
+        self,
+        f: callable,
+        params: Mapping[str, Any],
+        identity: Optional[Hashable] = None,
+    ) -> str:
+        return stable_digest(super().make_key(f, params, identity=identity))
+
+    def _path(self, key: Hashable) -> str:
+        if not isinstance(key, str):
+            key = stable_digest(key)
+        return os.path.join(self.directory, key)
+
+    def _entries(self) -> Sequence[os.DirEntry]:
+        return [
+            e for e in os.scandir(self.directory)
+            if e.is_dir() and not e.name.startswith('.')
+        ]
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def __contains__(self, key: Hashable) -> bool:
+        return os.path.isdir(self._path(key))
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, 'value.pkl'), 'rb') as f:
+                value = pickle.load(f)
+            value = self._load_arrays(value, path)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # Missing, or evicted while we were reading it
+            with self._lock:
+                self.stats.misses += 1
+            return False, None
+        with self._lock:
+            self.stats.hits += 1
+        return True, value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        path = self._path(key)
+        tmp = os.path.join(self.directory, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            arrays = []
+            value = self._extract_arrays(value, arrays)
+            for i, array in enumerate(arrays):
+                self._save_array(os.path.join(tmp, f'{i}.npy'), array)
+            with open(os.path.join(tmp, 'value.pkl'), 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another writer has already stored this entry.
+                pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Evict least recently used entries until the cache is within its
+        bounds.
+        """
+        if self.max_bytes is None and self.max_entries is None:
+            return
+        entries = []
+        for entry in self._entries():
+            try:
+                size = sum(
+                    f.stat().st_size for f in os.scandir(entry.path)
+                )
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                continue
+        entries.sort()
+        nbytes = sum(size for _, size, _ in entries)
+        while entries and (
+            (self.max_bytes is not None and nbytes > self.max_bytes)
+            or (
+                self.max_entries is not None
+                and len(entries) > self.max_entries
+            )
+        ):
+            _, size, path = entries.pop(0)
+            nbytes -= size
+            if self._remove(path):
+                with self._lock:
+                    self.stats.evictions += 1
+
+    def _remove(self, path: str) -> bool:
+        trash = os.path.join(self.directory, f'.trash-{uuid.uuid4().hex}')
+        try:
+            os.rename(path, trash)
+        except OSError:
+            # Already evicted by another process
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def _extract_arrays(self, value: Any, arrays: list) -> Any:
+        if _is_array(value) and not value.dtype.hasobject:
+            arrays.append(value)
+            return _ArrayRef(len(arrays) - 1)
+        if type(value) in (tuple, list):
+            return type(value)(
+                self._extract_arrays(v, arrays) for v in value
+            )
+        if type(value) is dict:
+            return {
+                k: self._extract_arrays(v, arrays) for k, v in value.items()
+            }
+        return value
+
+    def _load_arrays(self, value: Any, path: str) -> Any:
+        if isinstance(value, _ArrayRef):
+            import numpy as np
+            return np.load(
+                os.path.join(path, f'{value.index}.npy'),
+                mmap_mode='r' if self.mmap else None,
+                allow_pickle=False,
+            )
+        if type(value) in (tuple, list):
+            return type(value)(self._load_arrays(v, path) for v in value)
+        if type(value) is dict:
+            return {k: self._load_arrays(v, path) for k, v in value.items()}
+        return value
+
+    @staticmethod
+    def _save_array(path: str, array: Any) -> None:
+        import numpy as np
+        np.save(path, array, allow_pickle=False)
@@ -4,12 +4,18 @@
 """
 Elementary replication
 """
+from collections.abc import Sequence as SequenceABC
 from itertools import chain, cycle, product
 from math import prod
-from typing import Any, Literal, Optional, Sequence, Union
+from typing import Any, Literal, Mapping, Optional, Sequence, Tuple, Union
 
 from .config import aggregator_types
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 def _flatten(xs):
     if not isinstance(xs, aggregator_types):
@@ -175,13 +181,315 @@ def _replicate(
         )
 
 
+def _positions_product(length: int, stride: int, total: int) -> Sequence:
+    # Position in a factor of length `length` and stride `stride` for each
+    # element of a Cartesian product of size `total`
+    if np is not None:
+        return np.arange(total) // stride % length
+    return [
+        j for j in range(length) for _ in range(stride)
+    ] * (total // (length * stride))
+
+
+def _positions_cycle(length: int, total: int) -> Sequence:
+    if np is not None:
+        return np.arange(total) % length
+    return [i % length for i in range(total)]
+
+
+def _take(index: Sequence, positions: Sequence) -> Sequence:
+    if np is not None:
+        return np.asarray(index)[positions]
+    return [index[j] for j in positions]
+
+
+def _weave_length(
+    spec: tuple,
+    lengths: Sequence[int],
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+) -> int:
+    if weave_type == 'maximal':
+        return max(lengths)
+    elif weave_type == 'minimal':
+        return min(lengths)
+    elif weave_type == 'strict':
+        if len(set(lengths)) != 1:
+            raise ValueError(
+                f'Strict weave of spec {spec} with unequal lengths {lengths}'
+            )
+        return lengths[0]
+    raise ValueError(f'Unrecognized weave_type: {weave_type}')
+
+
+def _index_plan(
+    spec: Union[Sequence, str],
+    lengths: Mapping[str, int],
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+) -> Tuple[int, Sequence[Tuple[str, Sequence]]]:
+    """
+    Compute the length of the replicated structure for `spec`, together
+    with, for each leaf of the spec in order, an integer index into the
+    flattened values of that leaf for each replicate.
+    """
+    if isinstance(spec, str):
+        return lengths[spec], [(spec, range(lengths[spec]))]
+    children = [
+        _index_plan(spec=e, lengths=lengths, weave_type=weave_type)
+        for e in spec
+    ]
+    if isinstance(spec, list):
+        total = prod(length for length, _ in children)
+        stride = total
+        leaves = []
+        for length, child_leaves in children:
+            stride //= length
+            positions = _positions_product(length, stride, total)
+            leaves.extend(
+                (k, _take(index, positions)) for k, index in child_leaves
+            )
+        return total, leaves
+    elif isinstance(spec, tuple):
+        child_lengths = [length for length, _ in children]
+        total = _weave_length(spec, child_lengths, weave_type)
+        leaves = []
+        for length, child_leaves in children:
+            if length == total:
+                leaves.extend(child_leaves)
+                continue
+            positions = _positions_cycle(length, total)
+            leaves.extend(
+                (k, _take(index, positions)) for k, index in child_leaves
+            )
+        return total, leaves
+    else:
+        raise ValueError(f'Unrecognized spec type: {type(spec)}')
+
+
+def _replicate_indexed(
+    spec: Union[Sequence, str],
+    params: dict,
+    length: int,
+    maximum_aggregation_depth: Optional[int] = None,
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+) -> Optional[Mapping[str, list]]:
+    """
+    Replicate the parameters in `spec` to `length` by computing index
+    arrays for the spec's product and weave structure and then gathering
+    each parameter's values once. Returns None for the edge cases in which
+    the recursive implementation must be used instead: an empty spec or
+    leaf, or leaf values that would be flattened again when cycled.
+    """
+    if not spec or maximum_aggregation_depth == 0:
+        return None
+    sources = {
+        k: list(_flatten_to_depth(params[k], maximum_aggregation_depth))
+        for k in _flatten(spec)
+    }
+    for src in sources.values():
+        if len(src) == 0:
+            return None
+        if maximum_aggregation_depth is not None and any(
+            isinstance(v, aggregator_types) for v in src
+        ):
+            return None
+    total, leaves = _index_plan(
+        spec=spec,
+        lengths={k: len(v) for k, v in sources.items()},
+        weave_type=weave_type,
+    )
+    positions = _positions_cycle(total, length)
+    repl_params = {}
+    for k, index in leaves:
+        src = sources[k]
+        if isinstance(index, range) and total == length:
+            repl_params[k] = src
+            continue
+        index = _take(index, positions)
+        if np is not None:
+            index = index.tolist()
+        repl_params[k] = [src[j] for j in index]
+    return repl_params
+
+
+class LazyReplicates(SequenceABC):
+    """
+    Random-access view of a replicated parameter that is never
+    materialised.
+
+    Element ``i`` is ``values[index(i % period)]``, where ``index`` applies
+    each (divisor, modulus) step of ``steps`` in turn to the position
+    (that is, ``p -> p // divisor % modulus``).
+    """
+
+    __slots__ = ('values', 'steps', 'period', 'length')
+
+    def __init__(
+        self,
+        values: Sequence,
+        steps: Sequence[Tuple[int, int]],
+        period: int,
+        length: int,
+    ):
+        self.values = values
+        self.steps = tuple(steps)
+        self.period = period
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, i: Union[int, slice]) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('replicate index out of range')
+        p = i % self.period
+        for divisor, modulus in self.steps:
+            p = p // divisor % modulus
+        return self.values[p]
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (list, tuple, LazyReplicates)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other)
+            )
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'LazyReplicates(length={self.length})'
+
+
+def _lazy_plan(
+    spec: Union[Sequence, str],
+    lengths: Mapping[str, int],
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+) -> Tuple[int, Sequence[Tuple[str, Tuple[Tuple[int, int], ...]]]]:
+    """
+    Symbolic counterpart of ``_index_plan``: for each leaf of the spec,
+    return the (divisor, modulus) steps that map a position in the
+    replicated structure to an index into the leaf's flattened values.
+    """
+    if isinstance(spec, str):
+        return lengths[spec], [(spec, ())]
+    children = [
+        _lazy_plan(spec=e, lengths=lengths, weave_type=weave_type)
+        for e in spec
+    ]
+    child_lengths = [length for length, _ in children]
+    if isinstance(spec, list):
+        total = prod(child_lengths)
+        stride = total
+        leaves = []
+        for length, child_leaves in children:
+            stride //= length
+            leaves.extend(
+                (k, ((stride, length),) + steps)
+                for k, steps in child_leaves
+            )
+        return total, leaves
+    elif isinstance(spec, tuple):
+        total = _weave_length(spec, child_lengths, weave_type)
+        leaves = []
+        for length, child_leaves in children:
+            leaves.extend(
+                (k, steps if length >= total else ((1, length),) + steps)
+                for k, steps in child_leaves
+            )
+        return total, leaves
+    else:
+        raise ValueError(f'Unrecognized spec type: {type(spec)}')
+
+
+def _replicate_lazy(
+    spec: Union[Sequence, str],
+    params: dict,
+    length: int,
+    maximum_aggregation_depth: Optional[int] = None,
+    weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
+) -> Optional[Mapping[str, LazyReplicates]]:
+    """
+    Lazy counterpart of ``_replicate_indexed``, with the same fallbacks.
+    """
+    if not spec or maximum_aggregation_depth == 0:
+        return None
+    sources = {
+        k: list(_flatten_to_depth(params[k], maximum_aggregation_depth))
+        for k in _flatten(spec)
+    }
+    for src in sources.values():
+        if len(src) == 0:
+            return None
+        if maximum_aggregation_depth is not None and any(
+            isinstance(v, aggregator_types) for v in src
+        ):
+            return None
+    total, leaves = _lazy_plan(
+        spec=spec,
+        lengths={k: len(v) for k, v in sources.items()},
+        weave_type=weave_type,
+    )
+    return {
+        k: LazyReplicates(sources[k], steps, period=total, length=length)
+        for k, steps in leaves
+    }
+
+
+def _cycle_lazy(
+    var: str,
+    params: dict,
+    length: int,
+    maximum_aggregation_depth: Optional[int] = None,
+) -> Sequence:
+    nl = _nominal_length(
+        var=params[var],
+        maximum_aggregation_depth=maximum_aggregation_depth,
+    )
+    src = list(_flatten_to_depth(params[var], maximum_aggregation_depth))
+    if len(src) != nl:
+        return cycle_to_length(
+            var=var,
+            params=params,
+            length=length,
+            maximum_aggregation_depth=maximum_aggregation_depth,
+        )
+    return LazyReplicates(src, (), period=nl, length=length)
+
+
 def replicate(
     spec: Union[Sequence[Union[Sequence, str]], str],
     weave_type: Literal['maximal', 'minimal', 'strict'] = 'maximal',
     n_replicates: Optional[int] = None,
     maximum_aggregation_depth: Optional[int] = None,
     broadcast_out_of_spec: bool = False,
+    engine: Literal['index', 'recursive'] = 'index',
+    lazy: bool = False,
 ) -> callable:
+    """
+    Replicate parameters according to a spec.
+
+    Strings in the spec name parameters whose values are replicated. Lists
+    in the spec denote a Cartesian product of their elements, and tuples
+    denote a weave (zip) of their elements, where ``weave_type`` determines
+    how elements of unequal length are handled: ``'maximal'`` cycles
+    shorter elements, ``'minimal'`` truncates longer elements, and
+    ``'strict'`` requires equal lengths.
+
+    ``engine`` selects the implementation. The ``'index'`` engine computes
+    integer index arrays for the structure of the spec (vectorised with
+    NumPy if it is available) and gathers the values of each parameter
+    once; the ``'recursive'`` engine builds the replicated lists directly.
+    Both produce identical output.
+
+    If ``lazy`` is True, replicated parameters are returned as
+    ``LazyReplicates`` sequences that compute each element from its index
+    on access, so that memory does not grow with the size of Cartesian
+    products. Parameters for which this is not possible are materialised as
+    usual.
+    """
+    if engine not in ('index', 'recursive'):
+        raise ValueError(f'Unrecognized engine: {engine}')
     if list not in aggregator_types:
         raise ValueError(
             f'aggregator_types must contain list: {aggregator_types}'
@@ -213,24 +521,43 @@ def replicate(
                     maximum_aggregation_depth=maximum_aggregation_depth,
                 )
         spec_flat = list(_flatten(spec))
-        repl_vals = _replicate(
-            spec=spec,
-            params=params,
-            maximum_aggregation_depth=maximum_aggregation_depth,
-            weave_type=weave_type,
-        )
-        repl_params = {k: v for k, v in zip(spec_flat, repl_vals)}
-        for k in repl_params.keys():
-            repl_params[k] = cycle_to_length(
-                var=k,
-                params=repl_params,
+        repl_params = None
+        if lazy:
+            repl_params = _replicate_lazy(
+                spec=spec,
+                params=params,
                 length=_n_replicates,
                 maximum_aggregation_depth=maximum_aggregation_depth,
+                weave_type=weave_type,
             )
+        elif engine == 'index':
+            repl_params = _replicate_indexed(
+                spec=spec,
+                params=params,
+                length=_n_replicates,
+                maximum_aggregation_depth=maximum_aggregation_depth,
+                weave_type=weave_type,
+            )
+        if repl_params is None:
+            repl_vals = _replicate(
+                spec=spec,
+                params=params,
+                maximum_aggregation_depth=maximum_aggregation_depth,
+                weave_type=weave_type,
+            )
+            repl_params = {k: v for k, v in zip(spec_flat, repl_vals)}
+            for k in repl_params.keys():
+                repl_params[k] = cycle_to_length(
+                    var=k,
+                    params=repl_params,
+                    length=_n_replicates,
+                    maximum_aggregation_depth=maximum_aggregation_depth,
+                )
+        cycle_param = _cycle_lazy if lazy else cycle_to_length
         if broadcast_out_of_spec:
             for k in params.keys():
                 if k not in spec_flat:
-                    repl_params[k] = cycle_to_length(
+                    repl_params[k] = cycle_param(
                         var=k,
                         params=params,
                         length=_n_replicates,
@@ -242,13 +569,19 @@ def replicate(
                     repl_params[k] = [v]
 
         repl_params = {
-            k: list(v) if type(v) in aggregator_types else [v]
+            k: v if isinstance(v, LazyReplicates)
+            else list(v) if type(v) in aggregator_types
+            else [v]
             for k, v in repl_params.items()
         }
 
         # Restore empty sequences
         for k, v in _empty_seq.items():
-            if broadcast_out_of_spec:
+            if broadcast_out_of_spec and lazy:
+                repl_params[k] = LazyReplicates(
+                    (v,), (), period=1, length=_n_replicates
+                )
+            elif broadcast_out_of_spec:
                 repl_params[k] = [v] * _n_replicates
             else:
                 repl_params[k] = [v]
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""
+Transport
+~~~~~~~~~
+Zero-copy transport of large NumPy arrays to worker processes.
+"""
+import dataclasses
+import threading
+import weakref
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Any, Iterator, List, Mapping, Optional, Tuple
+
+from . import config
+from .memo import _is_array
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedArray:
+    """
+    Lightweight, picklable handle to an array placed in shared memory by a
+    ``SharedMemoryTransport``.
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: Any
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python >= 3.13: attaching processes need not be tracked, as the
+        # creating process unlinks the segment.
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# Attached segments, each with weak references to the arrays backed by it.
+# Closing a segment unmaps its memory, so a segment is only closed once all
+# of its arrays (and therefore all views of them, which reference them as
+# their base) have been released. Segments whose arrays outlive the call
+# that attached them -- for instance, because they are returned by it --
+# are held here and closed at a later call.
+_attachments: List[
+    Tuple[shared_memory.SharedMemory, List[weakref.ref]]
+] = []
+_attachments_lock = threading.Lock()
+
+
+def _release(
+    attachments: List[Tuple[shared_memory.SharedMemory, List[weakref.ref]]],
+) -> None:
+    with _attachments_lock:
+        attachments = _attachments + attachments
+        _attachments.clear()
+        for segment, arrays in attachments:
+            if any(array() is not None for array in arrays):
+                _attachments.append((segment, arrays))
+            else:
+                segment.close()
+
+
+def has_shared(params: Mapping[str, Any]) -> bool:
+    return any(isinstance(v, SharedArray) for v in params.values())
+
+
+@contextmanager
+def attached(params: Mapping[str, Any]) -> Iterator[Mapping[str, Any]]:
+    """
+    Resolve any ``SharedArray`` handles among the values of ``params`` into
+    read-only arrays backed by the shared segments, for the duration of the
+    context.
+    """
+    import numpy as np
+
+    attachments = {}
+    resolved = {}
+    v = None
+    try:
+        for k, v in params.items():
+            if isinstance(v, SharedArray):
+                if v.name not in attachments:
+                    attachments[v.name] = (_attach(v.name), [])
+                segment, arrays = attachments[v.name]
+                v = np.ndarray(v.shape, dtype=v.dtype, buffer=segment.buf)
+                # Other replicates read the same segment.
+                v.flags.writeable = False
+                arrays.append(weakref.ref(v))
+            resolved[k] = v
+        yield resolved
+    finally:
+        resolved.clear()
+        del v
+        _release(list(attachments.values()))
+
+
+class SharedMemoryTransport:
+    """
+    Opt-in transport that passes large NumPy arrays to worker processes
+    through ``multiprocessing.shared_memory`` instead of pickling them.
+
+    Within each mapped call, every distinct array of at least ``threshold``
+    bytes (``config.shared_memory_threshold`` by default) among the
+    parameters of the replicates is copied into a shared segment once, and
+    the replicates receive a ``SharedArray`` handle in its place. Workers
+    attach to the segment and see a read-only view of the array; a worker
+    that needs to modify it must copy it first. All segments created for a
+    call are unlinked when the call finishes, whether or not it succeeds.
+    Arrays of object dtype are never shared, and the transport is only
+    used with a ``ProcessPoolExecutor``, as threads already share memory.
+    """
+
+    def __init__(self, threshold: Optional[int] = None):
+        self.threshold = threshold
+
+    @contextmanager
+    def scope(self) -> Iterator['_TransportScope']:
+        scope = _TransportScope(
+            self.threshold if self.threshold is not None
+            else config.shared_memory_threshold
+        )
+        try:
+            yield scope
+        finally:
+            scope.close()
+
+
+class _TransportScope:
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        # Keyed by identity, with a weak reference to each array to detect
+        # an identity reused by a new array once the original is released.
+        self.handles = {}
+        self.segments = []
+
+    def _share(self, array: Any) -> SharedArray:
+        import numpy as np
+
+        ref, handle = self.handles.get(id(array), (None, None))
+        if ref is not None and ref() is array:
+            return handle
+        segment = shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1)
+        )
+        self.segments.append(segment)
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        np.copyto(view, array, casting='no')
+        del view
+        handle = SharedArray(
+            name=segment.name,
+            shape=tuple(array.shape),
+            dtype=array.dtype,
+        )
+        self.handles[id(array)] = (weakref.ref(array), handle)
+        return handle
+
+    def share(self, params: Mapping[str, Any]) -> Mapping[str, Any]:
+        return {
+            k: self._share(v)
+            if (
+                _is_array(v)
+                and v.nbytes >= self.threshold
+                and not v.dtype.hasobject
+            )
+            else v
+            for k, v in params.items()
+        }
+
+    def close(self) -> None:
+        for segment in self.segments:
+            try:
+                segment.close()
+            finally:
+                segment.unlink()
+        self.segments.clear()
+        self.handles.clear()
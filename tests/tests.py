@@ -4,19 +4,31 @@
 """
 Unit tests
 """
-import inspect, pytest
+import asyncio, inspect, json, multiprocessing, os, pickle, pytest
+import threading, time, weakref
+from concurrent.futures import (
+    Executor, ProcessPoolExecutor, ThreadPoolExecutor
+)
+from multiprocessing import shared_memory
 
 
 from conveyant import (
     ichain,
     ochain,
     iochain,
+    istage,
+    ostage,
+    compile_chain,
     split_chain,
     emulate_assignment,
     splice_on,
     splice_docstring,
     direct_compositor,
     reversed_args_compositor,
+    async_direct_compositor,
+    delayed_outer_compositor,
+    close_imapping_compositor,
+    close_omapping_compositor,
     null_transform,
     # null_op,
     # null_stage,
@@ -26,14 +38,41 @@ from conveyant import (
     omap,
     join,
     replicate,
+    LazyReplicates,
     inject_params,
+    BranchError,
+    async_join,
+    async_split_chain,
+    run_sync,
     PipelineArgument as A,
     PipelineStage as S,
     FunctionWrapper as F,
     PartialApplication as P,
     Primitive,
+    Invocation,
     Composition,
+    Pipeline,
+    repr_key,
+    structural_key,
+    cached,
+    Cache,
+    CacheStats,
+    DiskCache,
+    LRUCache,
+    SharedArray,
+    SharedMemoryTransport,
+    CallEvent,
+    add_hook,
+    remove_hook,
+    profile,
+    trace,
+    extract_graph,
+    GraphScheduler,
 )
+from conveyant.compositors import _seq_to_dict
+from conveyant import instrument
+from conveyant.memo import _digest
+from conveyant.transport import _TransportScope, attached
 
 
 class UnknownCallable:
@@ -320,6 +359,110 @@ def test_replicate():
         assert len(v) == 3
 
 
+def test_replicate_engines():
+    params = {
+        'a': ['cat', 'dog'],
+        'b': [0, 1, 2],
+        'c': [3, 4, 3, 7],
+        'd': 'fish',
+        'e': [['whales', 'dolphins'], 'porpoises'],
+        'f': (99, 77, 55),
+        'g': (),
+    }
+    specs = (
+        'a',
+        ['a', 'b'],
+        ('a', 'b'),
+        ['a', ('b', 'c'), 'd', ('e', 'f')],
+        (['a', 'b'], ['c', 'd']),
+        [('a', ['b', 'f']), 'e', 'g'],
+        ('e', ('a', ['b', 'c'])),
+        [],
+    )
+    for spec in specs:
+        for weave_type in ('maximal', 'minimal'):
+            for maximum_aggregation_depth in (None, 0, 1):
+                for broadcast_out_of_spec in (True, False):
+                    for n_replicates in (None, 7):
+                        config = dict(
+                            spec=spec,
+                            weave_type=weave_type,
+                            maximum_aggregation_depth=(
+                                maximum_aggregation_depth
+                            ),
+                            broadcast_out_of_spec=broadcast_out_of_spec,
+                            n_replicates=n_replicates,
+                        )
+                        assert (
+                            replicate(**config, engine='index')(**params) ==
+                            replicate(**config, engine='recursive')(**params)
+                        )
+    # Strict weaves of elements of equal length
+    strict_params = {
+        'a': ['cat', 'dog', 'eel'],
+        'b': [0, 1, 2],
+        'c': [3, 5, 6],
+        'd': 'fish',
+        'e': tuple(range(9)),
+    }
+    strict_specs = (
+        ('a', 'b'),
+        ('a', ('b', 'c')),
+        (['a', 'b'], ['b', 'c']),
+        [('a', 'b'), 'd'],
+        (['a', 'd', 'b'], 'e', ['c', 'd', ['a', 'd']]),
+    )
+    for spec in strict_specs:
+        for maximum_aggregation_depth in (None, 1):
+            for broadcast_out_of_spec in (True, False):
+                for n_replicates in (None, 27):
+                    config = dict(
+                        spec=spec,
+                        weave_type='strict',
+                        maximum_aggregation_depth=maximum_aggregation_depth,
+                        broadcast_out_of_spec=broadcast_out_of_spec,
+                        n_replicates=n_replicates,
+                    )
+                    assert (
+                        replicate(**config, engine='index')(**strict_params)
+                        == replicate(**config, engine='recursive')(
+                            **strict_params
+                        )
+                    )
+    with pytest.raises(ValueError):
+        replicate(spec=('a', 'b'), weave_type='strict', n_replicates=3)(
+            **params
+        )
+
+
+def test_replicate_lazy():
+    params = {
+        'a': list(range(10000)),
+        'b': list(range(10000)),
+        'c': ['x', 'y', 'z'],
+        'd': (),
+    }
+    out = replicate(
+        spec=['a', ('b', 'c')],
+        broadcast_out_of_spec=True,
+        lazy=True,
+    )(**params)
+    assert isinstance(out['a'], LazyReplicates)
+    assert len(out['a']) == len(out['b']) == len(out['c']) == 10 ** 8
+    assert out['a'][123456789 % 10 ** 8] == 2345
+    assert out['b'][123456789 % 10 ** 8] == 6789
+    assert out['c'][-1] == 'x'
+    assert out['d'][10 ** 7] == ()
+
+    small = {'a': [1, 2, 3], 'b': [4, 5], 'c': 6}
+    for spec in (['a', 'b'], ('a', 'b'), [('a', 'b'), 'c']):
+        config = dict(spec=spec, broadcast_out_of_spec=True)
+        eager = replicate(**config)(**small)
+        lazy = replicate(**config, lazy=True)(**small)
+        assert lazy == eager
+        assert lazy['a'][1:4] == eager['a'][1:4]
+
+
 def test_direct_compositor():
     w, x, y, z = 1, 2, 3, 4
     name = 'test'
@@ -346,6 +489,230 @@ def test_direct_chains():
     assert out['test2'] == -11 / 4
 
 
+def test_compile_chain():
+    def square_w(w, **params):
+        return {'w': w ** 2}
+
+    def halve(**params):
+        return {k: v / 2 for k, v in params.items()}
+
+    i_chain = ichain(
+        istage(square_w),
+        increment_args(incr=1),
+        ichain(istage(square_w), name_output('test')),
+        null_transform,
+    )
+    o_chain = ochain(
+        ostage(halve),
+        ostage(P(increment_output_p, incr=1)),
+    )
+    ref = iochain(oper, i_chain, o_chain)(w=2, x=2, y=3, z=4)
+    pipeline = compile_chain(oper, i_chain, o_chain)
+    assert isinstance(pipeline, Pipeline)
+    # Opaque transforms delimit the compiled stages.
+    assert [s.mode for s in pipeline] == ['update', 'call', 'call', 'call']
+    assert pipeline(w=2, x=2, y=3, z=4) == ref
+
+    o_chain = ochain(o_chain, rename_output('test', 'test2'))
+    ref = iochain(oper, i_chain, o_chain)(w=2, x=2, y=3, z=4)
+    pipeline = compile_chain(oper, i_chain, o_chain)
+    assert len(pipeline) == 1
+    assert pipeline(w=2, x=2, y=3, z=4) == ref
+
+    pipeline = compile_chain(
+        oper,
+        ichain(name_output('test'), istage(square_w)),
+        ochain(ostage(halve)),
+    )
+    assert [s.mode for s in pipeline] == ['call', 'call']
+    params = {'w': 2, 'x': 2, 'y': 3, 'z': 4}
+    assert pipeline(**params) == {'test': 0.0}
+    assert params['w'] == 2
+
+    assert compile_chain(oper)(name='test', **params) == {'test': -4 / 3}
+
+
+def shift(x):
+    return x + 1
+
+
+def scale(y):
+    return 2 * y
+
+
+def combine(x_shifted, y_scaled, **params):
+    return {'total': x_shifted + y_scaled}
+
+
+def test_extract_graph():
+    p_shift = Primitive(shift, 'shift', output=('x_shifted',))
+    p_scale = Primitive(scale, 'scale', output=('y_scaled',))
+    p_combine = Primitive(combine, 'combine', output=None)
+    p_report = Primitive(
+        lambda total: str(total), 'report', output=('report',),
+        forward_unused=True,
+    )
+    i_chain = ichain(istage(p_shift), istage(p_scale), istage(p_shift))
+    o_chain = ochain(ostage(p_report))
+    graph = extract_graph(p_combine, i_chain, o_chain)
+    assert [n.kind for n in graph] == [
+        'input', 'stage', 'stage', 'stage', 'stage', 'stage', 'output'
+    ]
+    assert [n.name for n in graph][1:-1] == [
+        'shift', 'scale', 'shift', 'combine', 'report'
+    ]
+    assert graph[1].reads == {'x'} and graph[1].writes == {'x_shifted'}
+    assert graph[5].forwards
+    # The two stages read different inputs, so they are independent.
+    assert graph.independent(1, 2)
+    assert graph.levels()[:2] == ((0,), (1, 2, 3))
+    assert set(graph.predecessors(4)) == {0, 2, 3}
+    # The repeated stage is identical to the first, and is merged into it.
+    dedup = graph.deduplicate()
+    assert len(dedup) == len(graph) - 1
+    assert set(dedup.predecessors(4)) == {0, 1, 2}
+    # The output of the first stage is overwritten by the third, and only
+    # the report is requested.
+    pruned = graph.prune(['report'])
+    assert [n.name for n in pruned][1:-1] == [
+        'scale', 'shift', 'combine', 'report'
+    ]
+    assert pruned.predecessors(pruned.output.id) == (5,)
+
+    i_chain = ichain(
+        istage(p_shift),
+        split_chain(istage(p_scale), ichain(name_output('test'))),
+    )
+    graph = extract_graph(p_combine, i_chain)
+    split = graph[2]
+    assert split.kind == 'split'
+    assert len(split.branches) == 2
+    assert [n.name for n in split.branches[0]][1:-1] == ['scale', 'combine']
+    assert set(graph.predecessors(2)) == {0, 1}
+
+    graph = extract_graph(
+        oper, ichain(imap(istage(p_shift), mapping={'w': [1, 2]}))
+    )
+    assert graph[1].kind == 'map'
+    assert graph[1].meta['mapping'] == {'w': [1, 2]}
+    # ``oper`` does not read the shifted output, so no path leads from the
+    # stage to the output of the replicate.
+    body = graph[1].branches[0]
+    assert body[1].name == 'shift'
+    assert [n.name for n in body.prune()][1:-1] == ['oper']
+
+
+def test_graph_scheduler():
+    p_shift = Primitive(shift, 'shift', output=('x_shifted',))
+    p_scale = Primitive(scale, 'scale', output=('y_scaled',))
+    p_combine = Primitive(combine, 'combine', output=None)
+    i_chain = ichain(istage(p_shift), istage(p_scale))
+    o_chain = ochain(ostage(P(increment_output_p, incr=1)))
+    ref = iochain(p_combine, i_chain, o_chain)(x=1, y=2)
+    graph = extract_graph(p_combine, i_chain, o_chain)
+    for concurrency in (None, 'thread', 'process'):
+        scheduler = GraphScheduler(graph, concurrency=concurrency)
+        run = scheduler.run(x=1, y=2)
+        assert run.output == ref
+        assert sorted(t.id for t in run.timings) == [1, 2, 3, 4]
+        assert all(t.wall >= 0 for t in run.timings)
+        assert 'shift' in str(run)
+    # Opaque transforms, flows and non-mapping outputs are executed as
+    # single nodes.
+    def square_w(w, **params):
+        return {'w': w ** 2}
+
+    i_chain = ichain(
+        istage(square_w),
+        increment_args(incr=1),
+        split_chain(
+            ichain(name_output('test')),
+            ichain(negate_args(), name_output('testn')),
+        ),
+    )
+    o_chain = ochain(rename_output('testn', 'negated'))
+    ref = iochain(oper, i_chain, o_chain)(w=2, x=2, y=3, z=4)
+    graph = extract_graph(oper, i_chain, o_chain)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = GraphScheduler(graph, executor=executor)
+        assert scheduler(w=2, x=2, y=3, z=4) == ref
+    assert GraphScheduler(extract_graph(lambda: 3))() == 3
+
+    # Parameters forwarded by stages with undeclared outputs or variadic
+    # signatures reach the output.
+    def base(x):
+        return {'y': x + 1}
+
+    def post(y):
+        return {'z': y * 2}
+
+    def post_variadic(y, **params):
+        return {'z': y * 2, 'n': len(params)}
+
+    p_base = Primitive(base, 'base', None, forward_unused=True)
+    for post_f, output in (
+        (post, None),
+        (post, ('z',)),
+        (post_variadic, None),
+    ):
+        p_post = Primitive(post_f, 'post', output, forward_unused=True)
+        o_chain = ochain(ostage(p_post))
+        ref = iochain(p_base, None, o_chain)(w=7, x=1)
+        assert ref['w'] == 7
+        graph = extract_graph(p_base, None, o_chain)
+        assert GraphScheduler(graph)(w=7, x=1) == ref
+        graph, _ = graph.eliminate_dead_outputs()
+        assert GraphScheduler(graph)(w=7, x=1) == ref
+
+
+def test_eliminate_dead_outputs():
+    def stats(x):
+        return x + 1, x * 2, x ** 2
+
+    def negate(x):
+        return -x
+
+    def summarise(used, hi):
+        return {'result': used + 1, 'hi': hi}
+
+    p_stats = Primitive(stats, 'stats', output=('lo', 'mid', 'hi'))
+    p_negate = Primitive(negate, 'negate', output=('neg',))
+    p_use = Primitive(
+        lambda lo: lo * 10, 'use', output=('used',), forward_unused=True
+    )
+    p_summarise = Primitive(summarise, 'summarise', output=None)
+    i_chain = ichain(istage(p_stats), istage(p_negate), istage(p_use))
+    ref = iochain(p_summarise, i_chain)(x=3)
+    graph = extract_graph(p_summarise, i_chain)
+    optimised, report = graph.eliminate_dead_outputs()
+    assert [n.name for n in report.removed] == ['negate']
+    assert [(n.name, drop) for n, drop in report.narrowed] == [
+        ('stats', {'mid'})
+    ]
+    assert 'removed [2] negate' in str(report)
+    assert optimised[1].writes == {'lo', 'hi'}
+    assert optimised[1].stage.f(x=3) == {'lo': 4, 'hi': 9}
+    assert GraphScheduler(optimised)(x=3) == ref
+
+    # Unused outputs of the final stage are dropped if outputs are
+    # requested.
+    graph = extract_graph(
+        Primitive(
+            lambda used, hi: (used + 1, hi), 'summarise',
+            output=('result', 'hi'),
+        ),
+        i_chain,
+    )
+    optimised, report = graph.eliminate_dead_outputs(['result'])
+    assert [(n.name, drop) for n, drop in report.narrowed] == [
+        ('stats', {'mid'}), ('summarise', {'hi'}),
+    ]
+    assert GraphScheduler(optimised)(x=3) == {'result': ref['result']}
+    assert str(
+        extract_graph(oper).eliminate_dead_outputs()[1]
+    ) == 'nothing eliminated'
+
+
 def test_splitting_chains():
     # wp, xp, yp, zp = 1, 2, 3, 4
     # wn, xn, yn, zn = -1, -2, -3, -4
@@ -407,6 +774,119 @@ def test_splitting_chains():
     assert out['test2'][1] == 10 / 3
 
 
+def test_concurrent_splitting_chains():
+    w, x, y, z = 1, 2, 3, 4
+    chains = (
+        ichain(
+            increment_args(incr=1),
+            name_output('test'),
+        ),
+        ichain(
+            negate_args(),
+            name_output('testn'),
+        ),
+    )
+    ref = iochain(oper, split_chain(*chains))(w=w, x=x, y=y, z=z)
+    for concurrency in ('thread', 'asyncio'):
+        out = iochain(
+            oper,
+            split_chain(*chains, concurrency=concurrency, timeout=10),
+        )(w=w, x=x, y=y, z=z)
+        assert out == ref
+
+    def fail(**params):
+        raise ValueError('failed branch')
+
+    def stall(**params):
+        time.sleep(0.5)
+        return {'stalled': True}
+
+    def failing_branch(f, compositor=direct_compositor):
+        return fail
+
+    def stalling_branch(f, compositor=direct_compositor):
+        return stall
+
+    with pytest.raises(ValueError):
+        iochain(oper, split_chain(chains[0], failing_branch))(
+            w=w, x=x, y=y, z=z
+        )
+    with pytest.raises(BranchError) as e:
+        iochain(oper, split_chain(
+            chains[0], failing_branch, on_error='aggregate'
+        ))(w=w, x=x, y=y, z=z)
+    assert list(e.value.errors) == [1]
+    out = iochain(oper, split_chain(
+        failing_branch, chains[0], on_error='drop'
+    ))(w=w, x=x, y=y, z=z)
+    assert out == {'test': ref['test']}
+
+    for concurrency in ('thread', 'asyncio'):
+        with pytest.raises(BranchError) as e:
+            iochain(oper, split_chain(
+                chains[0],
+                stalling_branch,
+                concurrency=concurrency,
+                timeout=0.05,
+                on_error='aggregate',
+            ))(w=w, x=x, y=y, z=z)
+        assert isinstance(e.value.errors[1], TimeoutError)
+    with pytest.raises(ValueError):
+        split_chain(*chains, timeout=1)
+    with pytest.raises(ValueError):
+        split_chain(*chains, concurrency='fibers')
+
+    # The 'asyncio' mode cannot be used from a running event loop.
+    async def call_in_loop():
+        return iochain(oper, split_chain(*chains, concurrency='asyncio'))(
+            w=w, x=x, y=y, z=z
+        )
+    with pytest.raises(RuntimeError):
+        asyncio.run(call_in_loop())
+
+    # Branches of staged Primitives are compiled so that they can be sent
+    # to worker processes.
+    p_shift = Primitive(shift, 'shift', output=('x_shifted',))
+    p_scale = Primitive(scale, 'scale', output=('y_scaled',))
+    p_combine = Primitive(combine, 'combine', output=None)
+    chains = (
+        ichain(istage(p_shift), istage(p_scale)),
+        ochain(
+            istage(p_shift),
+            istage(p_scale),
+            ostage(P(increment_output_p, incr=1)),
+        ),
+    )
+    ref = iochain(p_combine, split_chain(*chains))(x=1, y=2)
+    assert ref == {'total': (6, 7)}
+    out = iochain(
+        p_combine, split_chain(*chains, concurrency='process')
+    )(x=1, y=2)
+    assert out == ref
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        out = iochain(
+            p_combine, split_chain(*chains, executor=executor)
+        )(x=1, y=2)
+    assert out == ref
+
+
+def test_seq_to_dict():
+    seq = (
+        {'a': 1, 'b': [1, 2], 'c': 'x'},
+        {'a': 2, 'b': [3]},
+        {'a': 3, 'b': (4,), 'd': None},
+    )
+    assert _seq_to_dict(iter(seq), merge_type='union') == {
+        'a': (1, 2, 3), 'b': (1, 2, 3, 4), 'c': ('x',), 'd': (None,),
+    }
+    assert _seq_to_dict(iter(seq), merge_type='intersection') == {
+        'a': (1, 2, 3), 'b': (1, 2, 3, 4),
+    }
+    with pytest.raises(KeyError):
+        _seq_to_dict(iter(seq[::-1]))
+    assert _seq_to_dict(iter(seq[1:2])) == {'a': (2,), 'b': (3,)}
+
+
 def test_omapping_compositor():
     w, x, y, z = 1, 2, 3, 4
     ref = [oper(name='test', w=w, x=x, y=y, z=z) for w, x, y, z in zip(
@@ -503,6 +983,114 @@ def test_omapping_compositor():
     assert out == ref1
 
 
+def test_omapping_executor():
+    w, x, y, z = 1, 2, 3, 4
+    i_chain = ichain(
+        name_output('test'),
+        omapping_composition(
+            intermediate_oper(['x', 'y']),
+            map_spec=('x', 'y'),
+        ),
+        omapping_composition(
+            intermediate_oper(['w', 'z']),
+            map_spec=('w', 'z'),
+        ),
+    )
+    ref = iochain(oper, i_chain)(w=w, x=x, y=y, z=z)
+
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def oper_tracked(**params):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.001)
+        with lock:
+            in_flight[0] -= 1
+        return oper(**params)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        i_chain = ichain(
+            name_output('test'),
+            omapping_composition(
+                intermediate_oper(['x', 'y']),
+                map_spec=('x', 'y'),
+                executor=executor,
+                max_in_flight=2,
+            ),
+            omapping_composition(
+                intermediate_oper(['w', 'z']),
+                map_spec=('w', 'z'),
+                executor=executor,
+                max_in_flight=2,
+            ),
+        )
+        out = iochain(oper_tracked, i_chain)(w=w, x=x, y=y, z=z)
+    assert out == ref
+    # Each of at most two in-flight replicates of the first mapping fans
+    # out to at most two in-flight calls of the second.
+    assert in_flight[1] <= 4
+
+
+def test_mapping_default_in_flight():
+    lock = threading.Lock()
+    outstanding = [0, 0]
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            with lock:
+                outstanding[0] += 1
+                outstanding[1] = max(outstanding)
+            future = super().submit(fn, *args, **kwargs)
+            future.add_done_callback(release)
+            return future
+
+    def release(future):
+        with lock:
+            outstanding[0] -= 1
+
+    def slow(**params):
+        time.sleep(0.002)
+        return params
+
+    # Without an explicit bound, at most twice as many calls as there are
+    # workers are pending at once.
+    with CountingExecutor(max_workers=2) as executor:
+        compositor = close_omapping_compositor(
+            map_spec='x',
+            executor=executor,
+        )
+        f = compositor(slow, lambda **params: params)()
+        out = f(x=list(range(50)))
+    assert out == {'x': tuple(range(50))}
+    assert 0 < outstanding[1] <= 4
+
+    # Executors that do not report their workers are bounded by the CPU
+    # count instead.
+    class OpaqueExecutor(Executor):
+        def __init__(self):
+            self.pool = CountingExecutor(max_workers=2)
+
+        def submit(self, fn, *args, **kwargs):
+            return self.pool.submit(fn, *args, **kwargs)
+
+        def shutdown(self, wait=True, **kwargs):
+            self.pool.shutdown(wait=wait)
+
+    outstanding[1] = 0
+    with OpaqueExecutor() as executor:
+        assert not hasattr(executor, '_max_workers')
+        compositor = close_omapping_compositor(
+            map_spec='x',
+            executor=executor,
+        )
+        f = compositor(slow, lambda **params: params)()
+        out = f(x=list(range(50)))
+    assert out == {'x': tuple(range(50))}
+    assert 0 < outstanding[1] <= 2 * (os.cpu_count() or 1)
+
+
 def test_imapping_compositor():
     w, x, y, z = 1, 2, 3, 4
     ref = [oper(name='test', w=wi, x=x, y=y, z=z) for wi in [1, 2, 3, 4]]
@@ -550,6 +1138,356 @@ def test_imapping_compositor():
     assert out == ref
 
 
+def test_imapping_executor():
+    x, y, z = 2, 3, 4
+    ref = [oper(name='test', w=wi, x=x, y=y, z=z) for wi in [1, 2, 3, 4]]
+    ref = {'test': tuple(r['test'] + 2 for r in ref)}
+    calls = []
+
+    def count_calls(**params):
+        calls.append(params)
+        return params
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        i_chain = ichain(
+            name_output('test'),
+            imap(
+                mapping={'w': [1, 2, 3, 4]},
+                executor=executor,
+            ),
+        )
+        o_chain = ochain(
+            omap(
+                increment_output(2),
+                map_spec='test',
+            ),
+        )
+        io_chain = iochain(oper, i_chain, o_chain)
+        out = io_chain(x=x, y=y, z=z)
+        assert out == ref
+
+        compositor = close_imapping_compositor(
+            outer_mapping={'w': [1, 2, 3, 4] * 4},
+            map_spec='w',
+            executor=executor,
+        )
+        f = compositor(lambda **params: params, count_calls)()
+        out = f(x=x)
+        assert out == {'w': (1, 2, 3, 4) * 4, 'x': (x,) * 16}
+        assert len(calls) == 1
+
+    # Primitives and partial applications of module-level functions can be
+    # sent to worker processes.
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        compositor = close_imapping_compositor(
+            outer_mapping={'w': [1, 2, 3, 4]},
+            map_spec='w',
+            executor=executor,
+        )
+        f = compositor(
+            Primitive(oper, name='oper', output=None),
+            P(increment_output_p, incr=0),
+        )(name='test')
+        out = f(x=x, y=y, z=z)
+        assert out == {'test': tuple(
+            oper(name='test', w=wi, x=x, y=y, z=z)['test']
+            for wi in [1, 2, 3, 4]
+        )}
+
+
+def test_async_flows():
+    active = []
+    peak = []
+
+    async def aoper(**params):
+        active.append(None)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+        return oper(**params)
+
+    w, x, y, z = 1, 2, 3, 4
+    i_chain = ichain(increment_args(incr=1), name_output('test'))
+    o_chain = ochain(rename_output('test', 'test2'))
+    ref = iochain(oper, i_chain, o_chain)(w=w, x=x, y=y, z=z)
+    f = iochain(aoper, i_chain, o_chain, compositor=async_direct_compositor)
+    out = f(w=w, x=x, y=y, z=z)
+    assert inspect.isawaitable(out)
+    assert asyncio.run(out) == ref
+    assert run_sync(f)(w=w, x=x, y=y, z=z) == ref
+
+    # Mapped replicates are awaited concurrently, up to ``max_in_flight``.
+    i_chain = ichain(
+        name_output('test'),
+        imap(mapping={'w': [1, 2, 3, 4]}),
+    )
+    o_chain = ochain(omap(increment_output(2), map_spec='test'))
+    ref = iochain(oper, i_chain, o_chain)(x=x, y=y, z=z)
+    for max_in_flight in (None, 2):
+        peak.clear()
+        i_chain = ichain(
+            name_output('test'),
+            imap(
+                mapping={'w': [1, 2, 3, 4]},
+                max_in_flight=max_in_flight,
+                asynchronous=True,
+            ),
+        )
+        o_chain = ochain(
+            omap(increment_output(2), map_spec='test', asynchronous=True),
+        )
+        f = iochain(
+            aoper, i_chain, o_chain, compositor=async_direct_compositor
+        )
+        assert run_sync(f)(x=x, y=y, z=z) == ref
+        assert max(peak) == (max_in_flight or 4)
+    with pytest.raises(ValueError):
+        imap(mapping={'w': [1, 2]}, executor=object(), asynchronous=True)
+
+    chains = (
+        ichain(increment_args(incr=1), name_output('test')),
+        ichain(negate_args(), name_output('testn')),
+    )
+    ref = iochain(oper, split_chain(*chains))(w=w, x=x, y=y, z=z)
+    f = iochain(
+        aoper, async_split_chain(*chains), compositor=async_direct_compositor
+    )
+    assert run_sync(f)(w=w, x=x, y=y, z=z) == ref
+
+    async def stall(**params):
+        await asyncio.sleep(1)
+        return {'stalled': True}
+
+    def stalling_branch(f, compositor=async_direct_compositor):
+        return stall
+
+    f = iochain(
+        aoper,
+        async_split_chain(
+            chains[0], stalling_branch, timeout=0.05, on_error='drop'
+        ),
+        compositor=async_direct_compositor,
+    )
+    ref = iochain(oper, chains[0])(w=w, x=x, y=y, z=z)
+    assert run_sync(f)(w=w, x=x, y=y, z=z) == {'test': (ref['test'],)}
+
+    wr, xr, yr, zr = 7, 14, 21, 28
+    i_chain = ichain(
+        name_output('test'),
+        async_join(joining_f=sum, join_vars=('w', 'x', 'y', 'z'))(
+            intermediate_oper(['x', 'y']),
+            intermediate_oper(['w', 'z']),
+        ),
+    )
+    f = iochain(aoper, i_chain, compositor=async_direct_compositor)
+    out = run_sync(f)(w=w, x=x, y=y, z=z)
+    assert out == oper(name='test', w=wr, x=xr, y=yr, z=zr)
+
+
+def sum_scaled(vol, scale):
+    return {'out': float(vol.sum()) * scale}
+
+
+def filled(x):
+    import numpy as np
+    return {'vol': np.full(1024, x, dtype=float)}
+
+
+def first_scaled(vol, scale):
+    return {'out': float(vol[0]) * scale}
+
+
+def test_shared_memory_transport():
+    np = pytest.importorskip('numpy')
+    vol = np.ones((64, 64, 64))
+    ref = {'out': tuple(float(vol.sum()) * s for s in [1, 2, 3, 4])}
+
+    # Each distinct large array is shared once per scope, and its segment is
+    # unlinked when the scope exits.
+    with SharedMemoryTransport(threshold=vol.nbytes).scope() as scope:
+        small = vol[0]
+        params = scope.share({'vol': vol, 'small': small, 'scale': 1})
+        assert isinstance(params['vol'], SharedArray)
+        assert params['small'] is small
+        assert scope.share({'vol': vol})['vol'] == params['vol']
+        assert Invocation(sum_scaled, {
+            'vol': params['vol'], 'scale': 1
+        })()['out'] == ref['out'][0]
+        # Attached views are read-only, as every replicate shares them.
+        with attached({'vol': params['vol']}) as attached_params:
+            assert not attached_params['vol'].flags.writeable
+            with pytest.raises(ValueError):
+                attached_params['vol'][0, 0, 0] = 0
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=params['vol'].name)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        compositor = close_imapping_compositor(
+            outer_mapping={'scale': [1, 2, 3, 4]},
+            map_spec=['scale'],
+            broadcast_out_of_spec=True,
+            executor=executor,
+            transport=SharedMemoryTransport(threshold=vol.nbytes),
+        )
+        f = compositor(sum_scaled, P(increment_output_p, incr=0))()
+        assert f(vol=vol) == ref
+
+        compositor = close_imapping_compositor(
+            outer_mapping={'scale': [1, 2, 3, 4]},
+            map_spec=['scale'],
+            broadcast_out_of_spec=True,
+            executor=executor,
+            transport=SharedMemoryTransport(threshold=vol.nbytes + 1),
+        )
+        f = compositor(sum_scaled, P(increment_output_p, incr=0))()
+        assert f(vol=vol) == ref
+
+        # Inner results are released as the replicates proceed, so a new
+        # array can take the identity of one that was already shared.
+        x = [i // 2 for i in range(40)]
+        compositor = close_imapping_compositor(
+            inner_mapping={'x': x},
+            outer_mapping={'scale': list(range(40))},
+            map_spec=[('x', 'scale')],
+            executor=executor,
+            max_in_flight=2,
+            transport=SharedMemoryTransport(threshold=1024),
+        )
+        f = compositor(first_scaled, filled)()
+        assert f() == {
+            'out': tuple(float(xi * si) for xi, si in zip(x, range(40)))
+        }
+
+    # Threads share the caller's memory, so the transport is not used.
+    def no_share(self, params):
+        raise AssertionError('transport used with a thread pool')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        compositor = close_imapping_compositor(
+            outer_mapping={'scale': [1, 2, 3, 4]},
+            map_spec=['scale'],
+            broadcast_out_of_spec=True,
+            executor=executor,
+            transport=SharedMemoryTransport(threshold=vol.nbytes),
+        )
+        f = compositor(sum_scaled, P(increment_output_p, incr=0))()
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(_TransportScope, 'share', no_share)
+            assert f(vol=vol) == ref
+
+
+def test_memo_keys(monkeypatch):
+    class Opaque:
+        __hash__ = None
+
+        def __repr__(self):
+            return 'Opaque(...)'
+
+    a, b = Opaque(), Opaque()
+    assert repr_key({'x': a}) == repr_key({'x': b})
+    assert structural_key({'x': a}) != structural_key({'x': b})
+    assert structural_key({'x': a}) == structural_key({'x': a})
+    assert structural_key({'x': 1}) != structural_key({'x': True})
+    assert (
+        structural_key({'x': 1, 'y': [1, 2]}) ==
+        structural_key({'y': [1, 2], 'x': 1})
+    )
+    assert (
+        structural_key({'x': bytearray(b'abc')}) ==
+        structural_key({'x': bytearray(b'abc')})
+    )
+    assert (
+        structural_key({'x': bytearray(b'abc')}) !=
+        structural_key({'x': bytearray(b'abd')})
+    )
+    assert (
+        structural_key({'x': bytearray(b'abc')}, digest_limit=2) !=
+        structural_key({'x': bytearray(b'abc')}, digest_limit=2)
+    )
+    with pytest.raises(TypeError):
+        structural_key({'x': a}, identity=False)
+
+    for memo_key, n_calls in (
+        ('structural', 2),
+        ('repr', 1),
+        (None, 4),
+        (lambda params: params['x'] is a, 2),
+    ):
+        calls = []
+
+        def count_calls(**params):
+            calls.append(params)
+            return params
+
+        compositor = close_imapping_compositor(
+            inner_mapping={'x': [a, b, a, b]},
+            map_spec='x',
+            memo_key=memo_key,
+        )
+        out = compositor(lambda **params: params, count_calls)()()
+        assert len(calls) == n_calls
+        if memo_key != 'repr':
+            assert out == {'x': (a, b, a, b)}
+
+    # A value shared by every replicate is digested once per plan.
+    digests = []
+
+    def count_digests(buffer):
+        digests.append(buffer)
+        return _digest(buffer)
+
+    compositor = close_imapping_compositor(
+        outer_mapping={'x': list(range(200))},
+        map_spec='x',
+    )
+    f = compositor(lambda **params: params, lambda **params: params)
+    monkeypatch.setattr('conveyant.memo._digest', count_digests)
+    out = f()(volume=bytearray(1024))
+    assert len(out['x']) == 200
+    assert len(digests) == 1
+    memo = {}
+    assert (
+        structural_key({'x': bytearray(b'abc')}, memo=memo) ==
+        structural_key({'x': bytearray(b'abc')})
+    )
+    assert len(memo) == 1
+
+
+def test_imapping_releases_inner_results():
+    class Result:
+        pass
+
+    live = weakref.WeakSet()
+    held = []
+
+    def inner(x):
+        result = Result()
+        live.add(result)
+        return {'result': result}
+
+    def outer(result, w):
+        held.append(len(live))
+        return {'w': w}
+
+    # Each inner result is released once the last replicate using it has
+    # been called, rather than once all replicates are complete.
+    for inner_mapping, memo_key in (
+        ({'x': list(range(8))}, None),
+        ({'x': [0, 0, 1, 1, 2, 2, 3, 3]}, 'structural'),
+    ):
+        held.clear()
+        compositor = close_imapping_compositor(
+            inner_mapping=inner_mapping,
+            outer_mapping={'w': list(range(8))},
+            map_spec=[('x', 'w')],
+            memo_key=memo_key,
+        )
+        out = compositor(outer, inner)()()
+        assert out == {'w': tuple(range(8))}
+        assert len(held) == 8 and max(held) <= 2
+        assert len(live) == 0
+
+
 def test_imap_omap_convenience():
     x, y, z = 2, 3, 4
     ref = [oper(name='test', w=wi, x=x, y=y, z=z) for wi in [1, 2, 3, 4]]
@@ -634,6 +1572,13 @@ def test_sanitisers():
     assert repr(ptl) == "oper(test, y=3, z=4, w=1, x=2)"
     assert ptl() == oper(name='test', w=1, x=2, y=3, z=4)
 
+    # Without conditions, only environment and internal priority matter.
+    ptl = P(oper, name='test', w=1, x=2, y=3, z=4)
+    assert ptl(x=0) == oper(name='test', w=1, x=0, y=3, z=4)
+    assert ptl.set_priority('ice')(x=0) == ptl()
+    assert ptl.set_priority('cie')(x=0) == ptl()
+    assert ptl.set_priority('eic')(x=0) == ptl(x=0)
+
     ptl = P(oper, name='test', w=1, x=2)
     assert repr(ptl) == "oper(name=test, w=1, x=2)"
     ptl = P(oper, 'test', 1, 2)
@@ -649,6 +1594,32 @@ def test_sanitisers():
     ptl = ptl.set_priority('eic')
     assert ptl() == oper(name='test', w=1, x=2, y=3, z=4)
 
+    # Unhashable values never match a condition.
+    ptl = P(lambda w, x: (w, x), __conditions__={('w', 1): [('x', 0)]})
+    assert ptl(w=[1], x=2) == ([1], 2)
+    assert ptl(w=1, x=[2]) == (1, [2])
+    assert ptl.set_priority('cei')(w=1, x=[2]) == (1, 0)
+
+    # Cascading conditions are opt-in.
+    conditions = {
+        ('w', 1): [('x', 2)],
+        ('x', 2): [('y', 3), ('z', 5)],
+        ('y', 3): [('z', 4)],
+    }
+    ptl = P(oper, name='test', w=1, __conditions__=conditions)
+    with pytest.raises(TypeError):
+        ptl()
+    ptl = ptl.set_cascade()
+    assert ptl() == oper(name='test', w=1, x=2, y=3, z=4)
+    assert ptl.bind(name='test2').__cascade__
+    ptl = P(oper, name='test', w=1, __conditions__=conditions,
+            __cascade__=True)
+    assert ptl() == oper(name='test', w=1, x=2, y=3, z=4)
+    # Cycles are harmless without cascading, but are rejected with it.
+    ptl = ptl.set_cascade(False).add_conditions({('z', 4): [('w', 1)]})
+    with pytest.raises(ValueError):
+        ptl.set_cascade()
+
     w, x, y, z = 1, 2, 3, 4
     i_chain = ichain(
         increment_args(incr=1),
@@ -700,6 +1671,19 @@ def test_primitive():
     with pytest.raises(TypeError):
         oper_p('test', 1, 2, 3, 4)
 
+    # Attributes derived at construction are rebuilt after unpickling.
+    oper_p_pickled = pickle.loads(pickle.dumps(oper_p))
+    assert oper_p_pickled == oper_p
+    assert oper_p_pickled.__signature__ == oper_p.__signature__
+    assert (
+        oper_p_pickled(name='test', v=0, w=1, x=2, y=3, z=4) ==
+        oper_p(name='test', v=0, w=1, x=2, y=3, z=4)
+    )
+    invocation = pickle.loads(pickle.dumps(
+        Invocation(ptl, {'y': 3, 'z': 4})
+    ))
+    assert invocation() == {'output': oper('test', 1, 2, 3, 4)}
+
     oper_p = Primitive(
         oper,
         name='oper',
@@ -751,6 +1735,245 @@ def test_primitive():
     )
     assert consume_p(all=0) == {}
 
+    def indef_oper(name, **params):
+        return oper(name, **params)
+    indef_oper_p = Primitive(
+        indef_oper,
+        name='indef_oper',
+        output=None,
+        forward_unused=True,
+    )
+    assert indef_oper_p._variadic
+    assert indef_oper_p._params == frozenset(('name',))
+    assert (
+        indef_oper_p(name='test', w=1, x=2, y=3, z=4) ==
+        {'w': 1, 'x': 2, 'y': 3, 'z': 4, **oper('test', 1, 2, 3, 4)}
+    )
+
+
+def test_lru_cache():
+    calls = []
+
+    def oper_counted(name, w, x, y, z):
+        calls.append(name)
+        return oper(name, w, x, y, z)
+
+    with pytest.raises(TypeError):
+        Cache()
+    cache = LRUCache(max_entries=2)
+    oper_p = Primitive(
+        oper_counted,
+        name='oper',
+        output=None,
+        cache=cache,
+    )
+    other_p = Primitive(
+        oper_counted,
+        name='other',
+        output=None,
+        cache=cache,
+    )
+    ref = oper('test', 1, 2, 3, 4)
+    assert oper_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert oper_p(z=4, y=3, x=2, w=1, name='test') == ref
+    assert other_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert len(calls) == 2
+    assert cache.stats == CacheStats(hits=1, misses=2)
+    oper_p(name='test', w=2, x=2, y=3, z=4)
+    assert cache.stats.evictions == 1
+    assert len(cache) == 2
+    # Parameters that can only be keyed by identity bypass the cache.
+    class Unhashable:
+        __hash__ = None
+
+    oper_p(name='test', w=1, x=2, y=3, z=4, v=Unhashable())
+    assert cache.stats.bypasses == 1
+
+    cache = LRUCache(max_entries=None, max_bytes=2048)
+    for i in range(32):
+        cache.put(i, list(range(16)))
+    assert 0 < cache.nbytes <= 2048
+    assert cache.stats.evictions == 32 - len(cache)
+    cache.put('big', list(range(1024)))
+    assert 'big' not in cache
+
+    calls.clear()
+    cache = LRUCache()
+    io_chain = iochain(
+        oper_counted,
+        ichain(
+            increment_args(incr=1),
+            cached(cache),
+            name_output('test'),
+        ),
+    )
+    assert io_chain(w=1, x=2, y=3, z=4) == io_chain(w=1, x=2, y=3, z=4)
+    assert io_chain(w=2, x=2, y=3, z=4) != io_chain(w=1, x=2, y=3, z=4)
+    assert len(calls) == 2
+    assert cache.stats.hits == 2
+
+    # Entries are not pickled along with a Primitive that uses the cache.
+    cache = LRUCache(max_entries=None)
+    oper_p = Primitive(oper, name='oper', output=None, cache=cache)
+    cold = len(pickle.dumps(oper_p))
+    for w in range(2000):
+        oper_p(name='test', w=w, x=2, y=3, z=4)
+    assert len(cache) == 2000
+    warm = pickle.dumps(oper_p)
+    assert len(warm) == cold
+    copy = pickle.loads(warm)
+    assert len(copy.cache) == 0 and copy.cache.stats == CacheStats()
+    assert copy(name='test', w=1, x=2, y=3, z=4) == oper_p(
+        name='test', w=1, x=2, y=3, z=4
+    )
+    assert len(cache) == 2000
+
+
+def cached_shift(x):
+    return x + 1
+
+
+def cached_add(x, y):
+    return {'z': x + y}
+
+
+def test_disk_cache(tmp_path):
+    calls = []
+
+    def oper_counted(name, w, x, y, z):
+        calls.append(name)
+        return oper(name, w, x, y, z)
+
+    oper_p = Primitive(
+        oper_counted,
+        name='oper',
+        output=None,
+        cache=DiskCache(tmp_path / 'cache'),
+    )
+    ref = oper('test', 1, 2, 3, 4)
+    # The wrapped function is local, so it cannot be identified on disk.
+    assert oper_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert oper_p.cache.stats.bypasses == 1
+
+    cache = DiskCache(tmp_path / 'cache', max_entries=2)
+    oper_p = Primitive(oper, name='oper', output=None, cache=cache)
+    assert oper_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert oper_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert cache.stats == CacheStats(hits=1, misses=1)
+    # Another instance (as in another process) sees the same entries.
+    cache_other = DiskCache(tmp_path / 'cache')
+    oper_p = Primitive(oper, name='oper', output=None, cache=cache_other)
+    assert oper_p(name='test', w=1, x=2, y=3, z=4) == ref
+    assert cache_other.stats.hits == 1
+
+    oper_p = Primitive(oper, name='oper', output=None, cache=cache)
+    for w in range(2, 6):
+        time.sleep(0.01)
+        oper_p(name='test', w=w, x=2, y=3, z=4)
+    assert len(cache) == 2
+    assert cache.stats.evictions == 3
+
+    calls.clear()
+    cache = DiskCache(tmp_path / 'chain')
+    io_chain = iochain(
+        oper_counted,
+        ichain(
+            increment_args(incr=1),
+            cached(cache, name='increment_oper'),
+            name_output('test'),
+        ),
+    )
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        out = list(executor.map(
+            lambda _: io_chain(w=1, x=2, y=3, z=4), range(8)
+        ))
+    assert all(o == out[0] for o in out)
+    assert len(cache) == 1
+    assert not [
+        e for e in os.listdir(tmp_path / 'chain') if e.startswith('.')
+    ]
+    cache.clear()
+    assert len(cache) == 0
+
+    # Redefining a function under the same name invalidates its entries.
+    cache = DiskCache(tmp_path / 'code')
+    shift_p = Primitive(
+        cached_shift, name='shift', output=('x',), cache=cache
+    )
+    assert shift_p(x=1) == {'x': 2}
+    assert shift_p(x=1) == {'x': 2}
+    assert cache.stats == CacheStats(hits=1, misses=1)
+    code = cached_shift.__code__
+    cached_shift.__code__ = (lambda x: x + 2).__code__
+    try:
+        shift_p = Primitive(
+            cached_shift, name='shift', output=('x',), cache=cache
+        )
+        assert shift_p(x=1) == {'x': 3}
+        assert cache.stats == CacheStats(hits=1, misses=2)
+    finally:
+        cached_shift.__code__ = code
+
+    # Partial applications are keyed by the values that they bind, and
+    # values that can only be keyed by identity bypass the cache.
+    cache = DiskCache(tmp_path / 'partial')
+    for y, z in ((1, 2), (100, 101), (1, 2)):
+        add_p = Primitive(
+            P(cached_add, y=y), name='add', output=None, cache=cache
+        )
+        assert add_p(x=1) == {'z': z}
+    assert cache.stats == CacheStats(hits=1, misses=2)
+
+    class Opaque:
+        __hash__ = None
+
+        def __radd__(self, other):
+            return other
+
+    add_p = Primitive(
+        P(cached_add, y=Opaque()), name='add', output=None, cache=cache
+    )
+    assert add_p(x=1) == {'z': 1}
+    assert cache.stats.bypasses == 1
+    assert len(cache) == 2
+
+
+def make_arrays(n):
+    import numpy as np
+    return {'a': np.arange(n), 'meta': [np.ones((2, n)), 'tag']}
+
+
+def test_disk_cache_arrays(tmp_path):
+    np = pytest.importorskip('numpy')
+    make_p = Primitive(
+        make_arrays,
+        name='make_arrays',
+        output=None,
+        cache=DiskCache(tmp_path / 'arrays'),
+    )
+    ref = make_arrays(5)
+    assert make_p(n=5)['a'].tolist() == ref['a'].tolist()
+    out = make_p(n=5)
+    assert make_p.cache.stats == CacheStats(hits=1, misses=1)
+    # Arrays are stored as .npy files and loaded as read-only memory maps.
+    (entry,) = os.listdir(tmp_path / 'arrays')
+    entry = os.path.join(tmp_path / 'arrays', entry)
+    assert sorted(os.listdir(entry)) == ['0.npy', '1.npy', 'value.pkl']
+    assert isinstance(out['a'], np.memmap)
+    assert not out['a'].flags.writeable
+    assert np.array_equal(out['a'], ref['a'])
+    assert np.array_equal(out['meta'][0], ref['meta'][0])
+    assert out['meta'][1] == 'tag'
+
+    cache = DiskCache(tmp_path / 'arrays', mmap=False)
+    make_p = Primitive(
+        make_arrays, name='make_arrays', output=None, cache=cache
+    )
+    out = make_p(n=5)
+    assert cache.stats.hits == 1
+    assert not isinstance(out['a'], np.memmap)
+    assert np.array_equal(out['a'], ref['a'])
+
 
 def test_composition():
     c = Composition(
@@ -816,6 +2039,12 @@ def test_composition():
     assert c1(a=2)['h'] == 1.5
     assert c1.bind()(a=2)['h'] == 1.5
 
+    # The curried callable is a closure, so it is not pickled.
+    assert '_curried' in c.__dict__
+    c_pickled = pickle.loads(pickle.dumps(c))
+    assert '_curried' not in c_pickled.__dict__
+    assert c_pickled() == c() == {'test': -1}
+
     c1 = Composition(
         compositor=reversed_args_compositor,
         outer=div_args,
@@ -827,6 +2056,176 @@ def test_composition():
     assert c1(g=2)['h'] == 1.5
     assert c1.bind(g=2)()['h'] == 1.5
 
+    # Compiled compositions are flat, but compute the same thing.
+    c1_compiled = c1.compile()
+    assert isinstance(c1_compiled, Pipeline)
+    assert [s.mode for s in c1_compiled] == ['inject', 'call']
+    assert c1_compiled(g=2) == c1(g=2)
+    c2 = Composition(
+        compositor=direct_compositor,
+        outer=P(increment_output_p, incr=1),
+        inner=c1,
+    ).compile()
+    assert c2(g=2) == {'h': 2.5}
+
+    deep = oper
+    for _ in range(10):
+        deep = Composition(
+            compositor=direct_compositor,
+            outer=increment_output_p,
+            inner=deep,
+        ).bind_curried(incr=1)
+    deep_compiled = deep.compile()
+    assert len(deep_compiled) == 11
+    params = dict(name='test', w=1, x=2, y=3, z=4)
+    assert deep_compiled(**params) == deep(**params) == {'test': 8}
+    deep_pickled = pickle.loads(pickle.dumps(deep_compiled))
+    assert deep_pickled(**params) == {'test': 8}
+
+    c3 = Composition(
+        compositor=delayed_outer_compositor,
+        outer=div_args,
+        inner=add_args,
+    )
+    assert c3.compile() is c3
+
+
+def test_instrument():
+    def add(x, y):
+        return x + y
+
+    def double(z):
+        return 2 * z
+
+    c = Composition(
+        compositor=direct_compositor,
+        outer=Primitive(double, 'double', output=('w',)),
+        inner=Primitive(add, 'add', output=('z',)),
+    )
+    # Call once before profiling, so that the cached closure exists.
+    assert c(x=1, y=2) == {'w': 6}
+    with profile(sizes=True) as prof:
+        for _ in range(3):
+            assert c(x=1, y=2) == {'w': 6}
+    rows = {(r.kind, r.name): r for r in prof.table()}
+    assert rows[('primitive', 'add')].calls == 3
+    assert rows[('primitive', 'double')].calls == 3
+    assert rows[('primitive', 'add')].result_bytes > 0
+    compositor_rows = [r for r in rows.values() if r.kind == 'compositor']
+    assert len(compositor_rows) == 1
+    assert compositor_rows[0].name.startswith('direct_compositor(')
+    assert compositor_rows[0].calls == 3
+    # Nested calls are excluded from self time.
+    for row in rows.values():
+        assert 0 <= row.self_wall <= row.wall + 1e-9
+    assert compositor_rows[0].self_wall < compositor_rows[0].wall
+    assert 'double' in str(prof)
+
+    events = []
+    hook = add_hook(events.append)
+    with pytest.raises(ZeroDivisionError):
+        Primitive(lambda x: 1 / x, 'invert', output=('y',))(x=0)
+    remove_hook(hook)
+    assert len(events) == 1
+    assert isinstance(events[0], CallEvent)
+    assert events[0].name == 'invert'
+    assert isinstance(events[0].error, ZeroDivisionError)
+
+    # Nothing is recorded once all hooks are removed.
+    c(x=1, y=2)
+    assert len(events) == 1
+
+
+def hook_count():
+    return len(instrument._hooks)
+
+
+def test_trace(tmp_path):
+    w, x, y, z = 1, 2, 3, 4
+    f = Primitive(oper, name='oper', output=None)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        i_chain = ichain(
+            split_chain(
+                ichain(increment_args(incr=1), name_output('test')),
+                ichain(negate_args(), name_output('testn')),
+                concurrency='thread',
+            ),
+        )
+        ref = iochain(f, i_chain)(w=w, x=x, y=y, z=z)
+        with trace() as tr:
+            out = iochain(f, i_chain)(w=w, x=x, y=y, z=z)
+            mapped = imap(
+                name_output('test'),
+                mapping={'w': [1, 2, 3]},
+                executor=executor,
+            )(f)(x=x, y=y, z=z)
+            joined = ichain(
+                name_output('test'),
+                join(joining_f=sum, join_vars=('w', 'x', 'y', 'z'))(
+                    intermediate_oper(['x', 'y']),
+                    intermediate_oper(['w', 'z']),
+                ),
+            )(f)(w=w, x=x, y=y, z=z)
+    assert out == ref
+    assert len(mapped['test']) == 3
+    assert 'test' in joined
+
+    # Traced events do not keep parameters and results alive.
+    assert all(e.params == {} and e.result is None for e in tr.events)
+    events = {e.id: e for e in tr.events}
+    branches = [e for e in tr.events if e.kind == 'branch']
+    assert sorted(e.args['index'] for e in branches) == [0, 1]
+    replicates = [e for e in tr.events if e.kind == 'replicate']
+    # One deduplicated inner call, then three outer calls.
+    assert sorted(e.args['index'] for e in replicates) == [0, 0, 1, 2]
+    assert len([e for e in tr.events if e.kind == 'join']) == 1
+    # Calls made within each branch and replicate are nested within it,
+    # although they ran on other threads.
+    for e in branches:
+        assert any(c.parent == e.id for c in tr.events)
+    assert any(
+        events[c.parent].kind == 'replicate'
+        for c in tr.events if c.kind == 'primitive' and c.parent
+    )
+    for e in tr.events:
+        if e.parent is not None:
+            parent = events[e.parent]
+            assert parent.start <= e.start
+            assert e.start + e.wall <= parent.start + parent.wall + 1e-6
+
+    # Events recorded in worker processes are returned to the parent.
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        with trace() as tr_proc:
+            compositor = close_imapping_compositor(
+                outer_mapping={'w': [1, 2, 3, 4]},
+                map_spec='w',
+                executor=executor,
+            )
+            compositor(f, P(increment_output_p, incr=0))(name='test')(
+                x=x, y=y, z=z
+            )
+    opers = [e for e in tr_proc.events if e.kind == 'primitive']
+    assert len(opers) == 4
+    assert all(e.pid != os.getpid() for e in opers)
+    proc_events = {e.id: e for e in tr_proc.events}
+    for e in opers:
+        assert proc_events[e.parent].kind == 'replicate'
+        root = proc_events[proc_events[e.parent].parent]
+        assert root.kind == 'compositor' and root.pid == os.getpid()
+
+    # Forked workers do not inherit the hooks of their parent.
+    fork = multiprocessing.get_context('fork')
+    with trace():
+        with ProcessPoolExecutor(max_workers=1, mp_context=fork) as executor:
+            assert executor.submit(hook_count).result() == 0
+
+    chrome = tr.to_chrome()
+    phases = {e['ph'] for e in chrome['traceEvents']}
+    assert phases == {'X', 's', 'f'}
+    tr.dump(tmp_path / 'trace.json')
+    with open(tmp_path / 'trace.json') as f:
+        assert len(json.load(f)['traceEvents']) == len(chrome['traceEvents'])
+
 
 def test_emulation():
     def indef_oper(**params):
@@ -889,6 +2288,19 @@ def test_emulation():
         }
     }
 
+    indef_oper.__signature__ = inspect.signature(oper)
+    indef_oper_w = emulate_assignment(strict=True)(indef_oper)
+    # The binder is resolved at decoration time.
+    indef_oper.__signature__ = inspect.signature(consume_all)
+    assert (
+        indef_oper_w(name='test', w=1, x=2, y=3, z=4) ==
+        oper('test', 1, 2, 3, 4)
+    )
+    with pytest.raises(TypeError, match="missing required argument 'w'"):
+        indef_oper_w(name='test', x=2, y=3, z=4)
+    with pytest.raises(TypeError, match="unexpected keyword argument 'v'"):
+        indef_oper_w(name='test', v=0, w=1, x=2, y=3, z=4)
+
 
 def test_docstring_splice():
     def f(a: float, b: float = 1): return a + b